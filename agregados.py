@@ -0,0 +1,196 @@
+import pandas as pd
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set
+from codificacion import COLUMNAS_CONTEO, contar_categorias
+
+# Claves del cubo de conteos S/I/R (además de antibiótico)
+CLAVES_CONTEOS = ['fecha', 'Grupo_principal', 'especie']
+# Dimensiones de los aislados (todas las filas)
+CLAVES_AISLADOS = ['especie', 'Grupo_principal', 'Tipo de muestra']
+# Dimensiones de las muestras (una fila por SPEC_NUM)
+CLAVES_MUESTRAS = ['Tipo de localizacion', 'Tipo de muestra', 'Rango_edad']
+
+# Rangos de edad en orden de menor a mayor edad
+RANGOS_EDAD = [
+    "Neonatal", "1-5 meses", "6-11 meses", "1-2 años", "2-4 años", "5-9 años",
+    "10-14 años", "15-19 años", "20-24 años", "25-29 años", "30-34 años",
+    "35-39 años", "40-44 años", "45-49 años", "50-54 años", "55-59 años",
+    "60-64 años", "65-69 años", "70-74 años", "75-79 años", "80-84 años",
+    "85-89 años", "90-94 años", "≥95 años"
+]
+
+# Función para convertir edades a años; las numéricas (p. ej. 45) se leen igual que como
+# texto ('45'), ya que al guardar en Parquet una columna con ambos tipos queda como texto
+def convertir_edad(edad):
+    if pd.isna(edad) or isinstance(edad, bool):
+        return None
+    edad_str = str(edad).strip().upper()  # Normalizar a mayúsculas y quitar espacios
+    if 'M' in edad_str:
+        try:
+            meses = float(edad_str.replace('M', ''))
+            return meses / 12  # Convertir meses a años
+        except ValueError:
+            return None
+    elif 'D' in edad_str:
+        try:
+            dias = float(edad_str.replace('D', ''))
+            return dias / 365  # Convertir días a años
+        except ValueError:
+            return None
+    else:
+        try:
+            return float(edad_str)
+        except ValueError:
+            return None
+
+# Función para asignar rango de edad
+def asignar_rango(edad):
+    if pd.isna(edad):
+        return None
+    elif edad <= 1/12:  # Menos de 1 mes (aprox. 28 días)
+        return "Neonatal"
+    elif 1/12 < edad <= 5/12:
+        return "1-5 meses"
+    elif 5/12 < edad <= 11/12:
+        return "6-11 meses"
+    elif 1 <= edad <= 2:
+        return "1-2 años"
+    elif 2 < edad <= 4:
+        return "2-4 años"
+    elif 5 <= edad <= 9:
+        return "5-9 años"
+    elif 10 <= edad <= 14:
+        return "10-14 años"
+    elif 15 <= edad <= 19:
+        return "15-19 años"
+    elif 20 <= edad <= 24:
+        return "20-24 años"
+    elif 25 <= edad <= 29:
+        return "25-29 años"
+    elif 30 <= edad <= 34:
+        return "30-34 años"
+    elif 35 <= edad <= 39:
+        return "35-39 años"
+    elif 40 <= edad <= 44:
+        return "40-44 años"
+    elif 45 <= edad <= 49:
+        return "45-49 años"
+    elif 50 <= edad <= 54:
+        return "50-54 años"
+    elif 55 <= edad <= 59:
+        return "55-59 años"
+    elif 60 <= edad <= 64:
+        return "60-64 años"
+    elif 65 <= edad <= 69:
+        return "65-69 años"
+    elif 70 <= edad <= 74:
+        return "70-74 años"
+    elif 75 <= edad <= 79:
+        return "75-79 años"
+    elif 80 <= edad <= 84:
+        return "80-84 años"
+    elif 85 <= edad <= 89:
+        return "85-89 años"
+    elif 90 <= edad <= 94:
+        return "90-94 años"
+    elif edad >= 95:
+        return "≥95 años"
+    return None
+
+def clave_muestra(spec_num: pd.Series) -> pd.Series:
+    """SPEC_NUM como texto canónico para comparar muestras entre cargas y partes.
+
+    Un SPEC_NUM entero leído como float (p. ej. 123.0 en una columna con celdas vacías, o
+    '123.0' si se guardó como texto) da la misma clave que 123 o '123'; los nulos, 'nan'.
+    """
+    claves = spec_num.astype(str).str.replace(r'^(-?\d+)\.0+$', r'\1', regex=True)
+    return claves.where(spec_num.notna(), 'nan')
+
+def muestras_unicas(df: pd.DataFrame, excluidas: Optional[Set[str]] = None) -> pd.DataFrame:
+    """Una fila por SPEC_NUM (elegida tras barajar con semilla fija) con su rango de edad.
+
+    Las muestras se comparan por clave_muestra; excluidas son claves de muestras ya
+    contadas en otro cubo, que se omiten.
+    """
+    df_unicos = df[['SPEC_NUM', 'Edad'] + CLAVES_MUESTRAS[:-1]]
+    df_unicos = df_unicos.assign(SPEC_NUM=clave_muestra(df_unicos['SPEC_NUM']))
+    if excluidas:
+        df_unicos = df_unicos[~df_unicos['SPEC_NUM'].isin(excluidas)]
+    df_unicos = df_unicos.sample(frac=1, random_state=42).drop_duplicates("SPEC_NUM", keep="first")
+    return df_unicos.assign(Rango_edad=df_unicos['Edad'].apply(convertir_edad).apply(asignar_rango))
+
+def construir_agregados(df: pd.DataFrame, muestras_excluidas: Optional[Set[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Cubo de agregados de un año, a partir de los datos con resultados codificados.
+
+    - conteos: S/I/R/Inconcluyente por fecha, Grupo_principal, especie y antibiótico.
+    - aislados: número de filas por especie, Grupo_principal y Tipo de muestra.
+    - muestras: número de muestras únicas por Tipo de localizacion, Tipo de muestra y Rango_edad.
+
+    Las claves nulas se conservan (dropna=False) en las tres tablas para que cualquier corte
+    del cubo dé los mismos conteos que agrupar los datos originales. muestras_excluidas se pasa a
+    muestras_unicas.
+    """
+    agregados = {
+        'conteos': contar_categorias(df, CLAVES_CONTEOS),
+        'aislados': df.groupby(CLAVES_AISLADOS, dropna=False, observed=True).size().reset_index(name='n'),
+        'muestras': (muestras_unicas(df, muestras_excluidas).groupby(CLAVES_MUESTRAS, dropna=False, observed=True)
+                     .size().reset_index(name='n')),
+    }
+    # Claves como object aunque los datos vengan con columnas categóricas
+    for tabla in agregados.values():
+        for col in tabla.columns[tabla.dtypes == 'category']:
+            tabla[col] = tabla[col].astype(object)
+    return agregados
+
+# Claves y columnas de conteo de cada tabla del cubo
+TABLAS_CUBO = {
+    'conteos': (CLAVES_CONTEOS + ['antibiotico'], COLUMNAS_CONTEO),
+    'aislados': (CLAVES_AISLADOS, ['n']),
+    'muestras': (CLAVES_MUESTRAS, ['n']),
+}
+# Cubos que combinar_agregados suma de una vez
+TAMANO_LOTE_CUBOS = 8
+
+def _sumar(tablas: List[pd.DataFrame], claves, valores) -> pd.DataFrame:
+    return (pd.concat(tablas, ignore_index=True)
+            .groupby(claves, dropna=False, sort=True)[valores].sum().reset_index())
+
+def sumar_agregados(agregados: Dict[str, pd.DataFrame], nuevos: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """Suma a un cubo existente el cubo de filas agregadas después (carga en modo append).
+
+    Todos los conteos son aditivos; para que el de muestras lo sea, el cubo nuevo debe
+    construirse excluyendo los SPEC_NUM ya contados (muestras_excluidas).
+    """
+    return {nombre: _sumar([agregados[nombre], nuevos[nombre]], claves, valores)
+            for nombre, (claves, valores) in TABLAS_CUBO.items()}
+
+def sumar_por_periodo(conteos: pd.DataFrame, frecuencia: str = 'M', claves: Optional[List[str]] = None) -> pd.DataFrame:
+    """Suma los conteos S/I/R del cubo por periodo de la fecha (alias de pandas: 'M', 'Q', 'Y') y claves.
+
+    El resultado es aditivo: sumar los de varias particiones o años por periodo y claves da
+    lo mismo que calcularlo sobre sus cubos juntos.
+    """
+    claves = list(claves or ['especie', 'antibiotico'])
+    periodo = conteos['fecha'].dt.to_period(frecuencia).rename('periodo')
+    return conteos.groupby([periodo] + claves, sort=True)[COLUMNAS_CONTEO].sum().reset_index()
+
+def combinar_agregados(cubos: Iterable[Dict[str, pd.DataFrame]]) -> Optional[Dict[str, pd.DataFrame]]:
+    """Suma los cubos de varias particiones (p. ej. todos los hospitales de un año).
+
+    Las muestras de particiones distintas son distintas, así que también se suman. Los
+    cubos se consumen por lotes de TAMANO_LOTE_CUBOS: en memoria solo están el acumulado y
+    un lote, aunque se combinen decenas de particiones. Un único cubo se devuelve tal cual;
+    sin cubos devuelve None.
+    """
+    cubos = iter(cubos)
+    acumulado = None
+    while True:
+        lote = list(islice(cubos, TAMANO_LOTE_CUBOS))
+        if not lote:
+            return acumulado
+        if acumulado is not None:
+            lote.insert(0, acumulado)
+        acumulado = lote[0] if len(lote) == 1 else {
+            nombre: _sumar([cubo[nombre] for cubo in lote], claves, valores)
+            for nombre, (claves, valores) in TABLAS_CUBO.items()
+        }
@@ -0,0 +1,26 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+@contextmanager
+def escritura_atomica(ruta: str) -> Iterator[str]:
+    """Ruta temporal en el directorio de ruta que la reemplaza atómicamente al terminar.
+
+    El temporal tiene un nombre único (mkstemp), así que varios procesos pueden escribir el
+    mismo archivo a la vez y los lectores nunca ven uno a medias; si la escritura falla, el
+    temporal se elimina y ruta queda como estaba.
+    """
+    directorio = os.path.dirname(ruta) or '.'
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=f".{os.path.basename(ruta)}.", suffix='.tmp')
+    os.close(descriptor)
+    try:
+        yield temporal
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,330 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+import categorizacion
+from archivos import escritura_atomica
+import gestor_datos
+import pipeline
+from categorizacion import VARIANTES_ANTIBIOTICO, VARIANTES_ESPECIE, obtener_registro
+from gestor_datos import ETAPAS_CARGA
+
+# Benchmark de procesar_archivo_subido sobre cargas sintéticas con el formato de una
+# exportación de WHONET (códigos reales de data/Lista_antimicrobianos.xlsx). Cada caso corre
+# en un proceso nuevo y sus tiempos y picos de memoria se guardan en JSON para comparar
+# entre commits:
+#   python benchmark.py --filas 10000 100000 1000000 --antibioticos 40
+#   python benchmark.py --filas 100000 --comparar benchmark_abc1234.json
+
+# Versión del generador; incrementarla regenera los archivos guardados
+VERSION_GENERADOR = 1
+# Filas de datos que admite una hoja de Excel (más la fila de encabezados)
+MAX_FILAS_EXCEL = 1_048_575
+DIRECTORIO_ARCHIVOS = os.path.join(tempfile.gettempdir(), "benchmark_cargas")
+
+# Diluciones dobles de los valores MIC
+DILUCIONES = [0.03, 0.06, 0.125, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256]
+# Valores que no son resultados (ver categorizacion.VALORES_NO_DESEADOS)
+VALORES_NO_RESULTADO = ['TRM', 'R/N', 'NEG']
+# Columnas de la exportación que el pipeline descarta
+COLUMNAS_EXTRA = ['PATIENT_ID', 'SEX', 'LABORATORY', 'WARD', 'DEPARTMENT']
+
+def _pesos_zipf(n: int, rng: np.random.Generator) -> np.ndarray:
+    # Pocos códigos muy frecuentes y una cola larga, en orden aleatorio
+    pesos = 1 / np.arange(1, n + 1)
+    rng.shuffle(pesos)
+    return pesos / pesos.sum()
+
+def _texto_mic(valor: float, coma: bool) -> str:
+    texto = f"{valor:g}"
+    return texto.replace('.', ',') if coma else texto
+
+def _vocabulario_mic(rng: np.random.Generator, combinacion: bool):
+    """Valores MIC posibles de un antibiótico (y sus probabilidades relativas).
+
+    Una ventana de diluciones con '<=' en el extremo inferior y '>=' o '>' en el superior;
+    los valores intermedios aparecen como número, como texto y, si tienen decimales, con
+    coma. Las combinaciones (p. ej. piperacilina/tazobactam) se escriben como '16/4'.
+    """
+    inicio = int(rng.integers(0, len(DILUCIONES) - 8))
+    ventana = DILUCIONES[inicio:inicio + int(rng.integers(6, 9))]
+    valores, pesos = [], []
+    def agregar(valor, peso):
+        valores.append(valor)
+        pesos.append(peso)
+    agregar(f"<={_texto_mic(ventana[0], False)}", 4)
+    agregar(f">={_texto_mic(ventana[-1], False)}", 2)
+    agregar(f">{_texto_mic(ventana[-2], False)}", 1)
+    for dilucion in ventana[1:-1]:
+        if combinacion:
+            agregar(f"{_texto_mic(dilucion, False)}/4", 2)
+        else:
+            agregar(float(dilucion), 2)
+            agregar(_texto_mic(dilucion, False), 1)
+        if dilucion != int(dilucion):
+            agregar(_texto_mic(dilucion, True), 0.5)
+    pesos = np.array(pesos, dtype=float)
+    return np.array(valores, dtype=object), pesos / pesos.sum()
+
+def _columna_mic(n: int, rng: np.random.Generator, anio: int, combinacion: bool) -> np.ndarray:
+    # Cada antibiótico se prueba en una fracción de los aislados; el resto queda vacío
+    valores, pesos = _vocabulario_mic(rng, combinacion)
+    probado = rng.uniform(0.3, 0.8)
+    # Valores que no son resultados y celdas que Excel convirtió en fecha (p. ej. '1/2')
+    extras = np.array(VALORES_NO_RESULTADO + [datetime(anio, 2, 1), datetime(anio, 4, 16), None], dtype=object)
+    pesos_extras = np.array([0.002, 0.002, 0.002, 0.0005, 0.0005, 1 - probado])
+    todos = np.concatenate([valores, extras])
+    probabilidades = np.concatenate([pesos * (probado - 0.007), pesos_extras])
+    return rng.choice(todos, n, p=probabilidades / probabilidades.sum())
+
+def generar_carga(filas: int, antibioticos: int = 40, anio: int = 2023, semilla: int = 0) -> pd.DataFrame:
+    """Carga sintética con las columnas y códigos de una exportación de WHONET.
+
+    Usa la primera variante de códigos de antibióticos de Lista_antimicrobianos.xlsx con al
+    menos antibioticos códigos, y los códigos de especie, muestra y localización del mismo
+    libro. Un 2 % de las fechas cae en el año anterior, para el filtro del año predominante.
+    """
+    registro = obtener_registro()
+    rng = np.random.default_rng(semilla)
+    variante = next((v for v in VARIANTES_ANTIBIOTICO if registro.antibioticos[v].dropna().nunique() >= antibioticos), None)
+    if variante is None:
+        maximo = max(registro.antibioticos[v].dropna().nunique() for v in VARIANTES_ANTIBIOTICO)
+        raise ValueError(f"Lista_antimicrobianos.xlsx tiene como máximo {maximo} códigos de antibióticos")
+    codigos_antibioticos = list(registro.antibioticos[variante].dropna().unique()[:antibioticos])
+    nombres = registro.dicc_antibioticos(variante)
+    codigos_especies = registro.especies[VARIANTES_ESPECIE[-1]].dropna().unique()
+    muestras = list(registro.dicc_muestras)
+    localizaciones = list(registro.dicc_localizacion)
+
+    dias = rng.integers(0, 365, filas)
+    fechas = pd.Timestamp(anio, 1, 1) + pd.to_timedelta(dias, unit='D')
+    fechas = fechas.where(rng.random(filas) > 0.02, pd.Timestamp(anio - 1, 12, 15))
+    edades = rng.integers(0, 100, filas)
+    unidades = rng.choice(['', 'm', 'd'], filas, p=[0.9, 0.07, 0.03])
+    datos = {
+        'SPEC_NUM': np.sort(rng.integers(1, max(filas * 4 // 5, 2), filas)),
+        'PATIENT_ID': [f"P{k:07d}" for k in rng.integers(0, max(filas // 2, 1), filas)],
+        'SEX': rng.choice(['m', 'f'], filas),
+        'LABORATORY': 'LAB',
+        'WARD': rng.choice([f"Sala {k}" for k in range(1, 21)], filas),
+        'DEPARTMENT': rng.choice(['Medicina', 'Cirugía', 'Pediatría', 'UCI', 'Emergencia'], filas),
+        'SPEC_DATE': fechas.to_pydatetime(),
+        'SPEC_TYPE': rng.choice(muestras, filas, p=_pesos_zipf(len(muestras), rng)),
+        'WARD_TYPE': rng.choice(localizaciones, filas, p=_pesos_zipf(len(localizaciones), rng)),
+        'AGE': [f"{edad % 12 if unidad == 'm' else edad % 28}{unidad}" if unidad else str(edad)
+                for edad, unidad in zip(edades, unidades)],
+        # Especies frecuentes (las primeras filas del libro) y una cola de especies raras
+        'ORGANISM': np.where(rng.random(filas) < 0.9,
+                             rng.choice(codigos_especies[:40], filas, p=_pesos_zipf(min(40, len(codigos_especies)), rng)),
+                             rng.choice(codigos_especies, filas)),
+    }
+    for codigo in codigos_antibioticos:
+        combinacion = '/' in str(nombres.get(codigo, ''))
+        datos[codigo] = _columna_mic(filas, rng, anio, combinacion)
+    return pd.DataFrame(datos)
+
+def escribir_xlsx(df: pd.DataFrame, ruta: str) -> None:
+    # Libro en modo de solo escritura: las filas se escriben sin construir el libro en memoria
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(list(df.columns))
+    columnas = [df[col].to_numpy(dtype=object) for col in df.columns]
+    for fila in zip(*columnas):
+        hoja.append([None if valor is None or valor != valor else valor for valor in fila])
+    with escritura_atomica(ruta) as temporal:
+        libro.save(temporal)
+
+def archivo_carga(filas: int, antibioticos: int, anio: int, semilla: int, directorio: str = DIRECTORIO_ARCHIVOS) -> str:
+    """Ruta del .xlsx sintético de esos parámetros; se genera solo si no existe."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"whonet_{filas}x{antibioticos}_{anio}_s{semilla}_v{VERSION_GENERADOR}.xlsx")
+    if not os.path.exists(ruta):
+        print(f"Generando {ruta}...")
+        inicio = time.perf_counter()
+        escribir_xlsx(generar_carga(filas, antibioticos, anio, semilla), ruta)
+        print(f"Archivo generado en {time.perf_counter() - inicio:.1f} s")
+    return ruta
+
+def _precargar_referencias() -> None:
+    # Tablas de referencia en memoria antes de medir, como en un worker que ya procesó cargas
+    registro = obtener_registro()
+    registro.dicc_variables, registro.dicc_muestras, registro.dicc_localizacion
+    registro.antibioticos, registro.especies, registro.dicc_grupo_general, registro.puntos_corte
+    for variante in VARIANTES_ANTIBIOTICO:
+        registro.dicc_antibioticos(variante)
+    for variante in VARIANTES_ESPECIE:
+        registro.dicc_especies(variante)
+
+def _mb(valor: int) -> float:
+    return round(valor / 2**20, 1)
+
+def medir_carga(ruta: str, anio: int, por_bloques: Optional[bool] = None) -> Dict:
+    """Procesa el archivo con procesar_archivo_subido y mide cada etapa.
+
+    Las etapas de carga (ETAPAS_CARGA) se miden entre los avisos de progreso; las etapas
+    del pipeline, con las métricas de EjecutorPipeline. Los datos se guardan en un
+    DATA_DIR temporal que se elimina al terminar.
+    """
+    with open(ruta, 'rb') as f:
+        contenido = f.read()
+    inicio = time.perf_counter()
+    _precargar_referencias()
+    referencias_segundos = time.perf_counter() - inicio
+
+    metricas: List[Dict] = []
+    tramos: List[Dict] = []
+    def cerrar_tramo():
+        if tramos and 'segundos' not in tramos[-1]:
+            tramo = tramos[-1]
+            tramo['segundos'] = time.perf_counter() - tramo['inicio']
+            picos = [pipeline.pico_rss()] + [m['rss_pico'] for m in metricas[tramo['metricas']:]]
+            tramo['rss_pico'] = max(picos)
+    def progreso(etapa, detalle=''):
+        cerrar_tramo()
+        tramos.append({'etapa': etapa, 'inicio': time.perf_counter(), 'metricas': len(metricas)})
+        pipeline.reiniciar_pico_rss()
+
+    directorio_datos = tempfile.mkdtemp(prefix="benchmark_datos_")
+    data_dir = gestor_datos.DATA_DIR
+    gestor_datos.DATA_DIR = directorio_datos
+    pipeline.agregar_destino_metricas(metricas.append)
+    try:
+        pipeline.reiniciar_pico_rss()
+        rss_inicio = pipeline.memoria_rss()
+        inicio = time.perf_counter()
+        filas = gestor_datos.procesar_archivo_subido(contenido, anio, por_bloques, progreso=progreso)
+        total_segundos = time.perf_counter() - inicio
+        cerrar_tramo()
+        columnas = gestor_datos.cargar_datos(anio, codificado=True).shape[1]
+    finally:
+        pipeline.quitar_destino_metricas(metricas.append)
+        gestor_datos.DATA_DIR = data_dir
+        shutil.rmtree(directorio_datos, ignore_errors=True)
+
+    # En la carga por bloques cada etapa se repite por bloque: se suman tiempos y filas
+    etapas_carga = []
+    for etapa, _ in ETAPAS_CARGA:
+        propios = [t for t in tramos if t['etapa'] == etapa]
+        if propios:
+            etapas_carga.append({'etapa': etapa, 'veces': len(propios),
+                                 'segundos': round(sum(t['segundos'] for t in propios), 4),
+                                 'rss_pico_mb': _mb(max(t['rss_pico'] for t in propios))})
+    etapas_pipeline = {}
+    for m in metricas:
+        etapa = etapas_pipeline.setdefault(m['etapa'], {'etapa': m['etapa'], 'veces': 0, 'segundos': 0.0,
+                                                        'filas_entrada': 0, 'filas_salida': 0,
+                                                        'delta_rss_mb': 0.0, 'rss_pico_mb': 0.0})
+        etapa['veces'] += 1
+        etapa['segundos'] = round(etapa['segundos'] + m['segundos'], 4)
+        etapa['filas_entrada'] += m['filas_entrada']
+        etapa['filas_salida'] += m['filas_salida']
+        etapa['delta_rss_mb'] = round(etapa['delta_rss_mb'] + _mb(m['delta_rss']), 1)
+        etapa['rss_pico_mb'] = max(etapa['rss_pico_mb'], _mb(m['rss_pico']))
+    return {
+        'archivo_mb': _mb(len(contenido)),
+        'por_bloques': por_bloques if por_bloques is not None else len(contenido) > gestor_datos.UMBRAL_CARGA_POR_BLOQUES,
+        'filas_guardadas': filas,
+        'columnas_guardadas': columnas,
+        'referencias_segundos': round(referencias_segundos, 4),
+        'total_segundos': round(total_segundos, 4),
+        'rss_inicio_mb': _mb(rss_inicio),
+        'rss_pico_mb': max([t['rss_pico_mb'] for t in etapas_carga], default=0.0),
+        'etapas_carga': etapas_carga,
+        'etapas_pipeline': list(etapas_pipeline.values()),
+    }
+
+def _ejecutar_en_proceso(*args) -> Dict:
+    # Un proceso nuevo por caso: los picos de memoria no arrastran lo que dejaron los anteriores
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(medir_carga, *args).result()
+
+def _git(*args) -> Optional[str]:
+    try:
+        resultado = subprocess.run(['git', *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   capture_output=True, text=True, check=True)
+        return resultado.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(resultados: Dict, ruta_base: str) -> None:
+    """Imprime la razón actual/base del tiempo total y de cada etapa para los casos comunes."""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    clave = lambda caso: (caso['filas'], caso['antibioticos'], caso['por_bloques'])
+    casos_base = {clave(caso): caso for caso in base['casos']}
+    print(f"\nComparación con {ruta_base} (commit {base.get('commit')}); razón actual/base:")
+    for caso in resultados['casos']:
+        anterior = casos_base.get(clave(caso))
+        if anterior is None:
+            continue
+        print(f"  {caso['filas']} filas x {caso['antibioticos']} antibióticos: "
+              f"total {caso['total_segundos'] / anterior['total_segundos']:.2f}x, "
+              f"pico de memoria {caso['rss_pico_mb'] / anterior['rss_pico_mb']:.2f}x")
+        etapas_base = {etapa['etapa']: etapa for etapa in anterior['etapas_pipeline']}
+        for etapa in caso['etapas_pipeline']:
+            previa = etapas_base.get(etapa['etapa'])
+            if previa and previa['segundos'] > 0:
+                print(f"    {etapa['etapa']:38} {etapa['segundos'] / previa['segundos']:.2f}x")
+
+def main(argumentos: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark de procesar_archivo_subido con cargas sintéticas de WHONET")
+    parser.add_argument('--filas', type=int, nargs='+', default=[10_000, 100_000],
+                        help="filas de cada carga (p. ej. 10000 100000 1000000)")
+    parser.add_argument('--antibioticos', type=int, nargs='+', default=[40], help="columnas de antibióticos")
+    parser.add_argument('--anio', type=int, default=2023)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--por-bloques', choices=['auto', 'si', 'no'], default='auto',
+                        help="auto: según el tamaño del archivo, como en el dashboard")
+    parser.add_argument('--directorio-archivos', default=DIRECTORIO_ARCHIVOS,
+                        help="donde se guardan (y reutilizan) los .xlsx generados")
+    parser.add_argument('--salida', help="archivo JSON de resultados (por defecto benchmark_<commit>.json)")
+    parser.add_argument('--comparar', help="JSON de un benchmark anterior con el que comparar")
+    args = parser.parse_args(argumentos)
+    if any(filas < 1 or filas > MAX_FILAS_EXCEL for filas in args.filas):
+        parser.error(f"--filas debe estar entre 1 y {MAX_FILAS_EXCEL} (límite de una hoja de Excel)")
+    por_bloques = {'auto': None, 'si': True, 'no': False}[args.por_bloques]
+
+    commit = _git('rev-parse', '--short', 'HEAD')
+    resultados = {
+        'commit': commit,
+        'cambios_sin_commit': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                    'plataforma': platform.platform(), 'cpus': os.cpu_count(),
+                    'procesos_categorizacion': categorizacion.PROCESOS_CATEGORIZACION},
+        'casos': [],
+    }
+    for filas in args.filas:
+        for antibioticos in args.antibioticos:
+            ruta = archivo_carga(filas, antibioticos, args.anio, args.semilla, args.directorio_archivos)
+            for repeticion in range(1, args.repeticiones + 1):
+                caso = dict(filas=filas, antibioticos=antibioticos, repeticion=repeticion,
+                            **_ejecutar_en_proceso(ruta, args.anio, por_bloques))
+                resultados['casos'].append(caso)
+                print(f"{filas} filas x {antibioticos} antibióticos (repetición {repeticion}): "
+                      f"{caso['total_segundos']:.2f} s, pico {caso['rss_pico_mb']:.0f} MB")
+                for etapa in caso['etapas_carga']:
+                    print(f"  {etapa['etapa']:12} {etapa['segundos']:9.2f} s  {etapa['rss_pico_mb']:8.0f} MB")
+
+    salida = args.salida or f"benchmark_{commit or 'sin_git'}.json"
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}")
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import pandas as pd
+
+# Memoria máxima (MB) para los gráficos y tablas cacheados del dashboard
+MEMORIA_CACHE_GRAFICOS_MB = int(os.getenv("MEMORIA_CACHE_GRAFICOS_MB", "200"))
+
+def estimar_tamano(valor: Any) -> int:
+    """Tamaño aproximado en bytes: memoria de los DataFrames y tamaño serializado del resto."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, dict):
+        return sum(estimar_tamano(v) for v in valor.values())
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+class CacheLRU:
+    """Cache LRU acotado por memoria estimada.
+
+    Al superar max_bytes se descartan las entradas usadas hace más tiempo. Las claves
+    son tuplas cuyo primer elemento es el año, para poder invalidar un año completo.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        tamano = estimar_tamano(valor)
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            # La entrada recién guardada se conserva aunque supere el límite por sí sola
+            while self._bytes > self.max_bytes and len(self._entradas) > 1:
+                _, (_, tamano_descartado) = self._entradas.popitem(last=False)
+                self._bytes -= tamano_descartado
+
+    def invalidar(self, anio) -> None:
+        with self._lock:
+            for clave in [c for c in self._entradas if c[0] == anio]:
+                self._bytes -= self._entradas.pop(clave)[1]
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {'aciertos': self.aciertos, 'fallos': self.fallos,
+                'entradas': len(self._entradas), 'bytes': self._bytes}
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
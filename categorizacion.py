@@ -1,26 +1,51 @@
 import pandas as pd
+import numpy as np
 import datetime
 import re
-from typing import Dict, Tuple, Optional, List
+from typing import Callable, Dict, Iterator, Tuple, Optional, List
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+import os
+import threading
+from referencias import cargar_compilado, leer_libro
+from pipeline import EjecutorPipeline, registrar_etapa
+
+# Libros de referencia
+RUTA_DICCIONARIOS = 'data/Lista_antimicrobianos.xlsx'
+RUTA_MAPEO_ESPECIES = 'data/Lista_especie_especifico_general.xlsx'
+RUTA_CLSI = 'data/Lista_CLSI_completa.xlsx'
+
+# Columnas con las variantes de códigos en el diccionario de antimicrobianos
+VARIANTES_ANTIBIOTICO = ['antibiotico_1', 'antibiotico_2', 'antibiotico_3', 'antibiotico_4']
+VARIANTES_ESPECIE = ['especie_1', 'especie_2', 'especie_3']
+
+# Hospital y región de las cargas que no los indican (los datos originales del proyecto)
+HOSPITAL_POR_DEFECTO = 'Hospital Honorio Delgado Arequipa'
+REGION_POR_DEFECTO = 'Arequipa'
+
+# Procesos para la categorización (1 = serial); configurable por variable de entorno
+PROCESOS_CATEGORIZACION = int(os.getenv("PROCESOS_CATEGORIZACION", "1"))
 
 def cargar_datos(ruta: str) -> pd.DataFrame:
     try:
         if not Path(ruta).is_file():
             raise FileNotFoundError(f"El archivo {ruta} no existe.")
-        return pd.read_excel(ruta)
+        return leer_libro(ruta)
     except Exception as e:
         raise ValueError(f"Error al cargar el archivo {ruta}: {str(e)}")
 
 def cargar_diccionario(ruta: str, columnas: list, llave: str, valor: str) -> Dict[str, str]:
     try:
-        df = pd.read_excel(ruta, usecols=columnas).dropna()
+        df = leer_libro(ruta)[columnas].dropna()
         return dict(zip(df[llave], df[valor]))
     except Exception as e:
         raise ValueError(f"Error al cargar diccionario desde {ruta}: {str(e)}")
     
 def renombrar_columnas(df: pd.DataFrame, diccionario: Dict[str, str]) -> pd.DataFrame:
-    return df.rename(columns={k: v for k, v in diccionario.items() if k in df.columns})
+    # Solo cambian las etiquetas: los datos se comparten con df
+    return df.rename(columns={k: v for k, v in diccionario.items() if k in df.columns}, copy=False)
 
 def reemplazar_valores(df: pd.DataFrame, columna: str, diccionario: Dict[str, str]) -> pd.DataFrame:
     if columna in df.columns:
@@ -58,154 +83,330 @@ def agregar_columnas_fijas(df: pd.DataFrame, hospital: str, region:str) -> pd.Da
     df['Region'] = region
     return df
 
+# Las columnas se eliminan en el lugar (del no copia las demás, a diferencia de drop o de
+# seleccionar un subconjunto)
 def eliminar_columnas_no_deseadas(df: pd.DataFrame, columnas: List[str]) -> pd.DataFrame:
-    columnas_eliminadas = [col for col in columnas if col in df.columns]
-    return df.drop(columns=columnas_eliminadas, errors='ignore')
+    for col in [col for col in columnas if col in df.columns]:
+        del df[col]
+    return df
+
+def conservar_columnas(df: pd.DataFrame, columnas: List[str]) -> pd.DataFrame:
+    conservar = set(columnas)
+    return eliminar_columnas_no_deseadas(df, [col for col in df.columns if col not in conservar])
 
 def limpiar_valores_antibioticos(df: pd.DataFrame, columnas_antibioticos: List[str], valores_a_reemplazar: List[str]) -> pd.DataFrame:
-    columnas_presentes = [col for col in columnas_antibioticos if col in df.columns]
-    df[columnas_presentes] = df[columnas_presentes].replace(valores_a_reemplazar, pd.NA)
+    # Columna a columna, para no materializar una copia de todo el bloque de antibióticos
+    for col in [col for col in columnas_antibioticos if col in df.columns]:
+        df[col] = df[col].replace(valores_a_reemplazar, pd.NA)
     return df
 
-def agregar_columnas_mapeadas(df: pd.DataFrame, ruta_mapeo: str, columna_base: str) -> pd.DataFrame:
-    mapeo_especies = cargar_datos(ruta_mapeo)
-    dicc_grupo_general = dict(zip(mapeo_especies['Especie_especifica'], mapeo_especies['Grupo_general']))
-    dicc_grupo_principal = dict(zip(mapeo_especies['Especie_especifica'], mapeo_especies['Grupo_principal']))
-        
+def agregar_columnas_mapeadas(df: pd.DataFrame, registro: 'RegistroReferencias', columna_base: str) -> pd.DataFrame:
     if columna_base in df.columns:
-        df['Grupo_general'] = df[columna_base].map(dicc_grupo_general)
-        df['Grupo_principal'] = df[columna_base].map(dicc_grupo_principal)
+        df['Grupo_general'] = df[columna_base].map(registro.dicc_grupo_general)
+        df['Grupo_principal'] = df[columna_base].map(registro.dicc_grupo_principal)
 
     return df
 
-def limpiar_valores_mic(df: pd.DataFrame, columnas_antibioticos: List[str]) -> pd.DataFrame:
-    def transformar_mic(valor):
-        if pd.isna(valor):
-            return pd.NA
-        valor = str(valor).strip()
-        # Eliminar fracciones (por ejemplo: 16/4 → 16)
-        if '/' in valor:
-            valor = valor.split('/')[0].strip()
-        try:
-            if valor.startswith('>=') or valor.startswith('<=') or valor.startswith('='):
-                num = float(valor.replace('>=', '').replace('<=', '').replace('=', '').replace(',', '.'))
-                return num
-            elif valor.startswith('>'):
-                num = float(valor[1:].replace(',', '.'))
-                return num * 2
-            elif valor.startswith('<'):
-                num = float(valor[1:].replace(',', '.'))
-                return num / 2
-            else:
-                return float(valor.replace(',', '.'))
-        except (ValueError, TypeError):
-            return pd.NA
+def transformar_mic(valor):
+    if pd.isna(valor):
+        return pd.NA
+    valor = str(valor).strip()
+    # Eliminar fracciones (por ejemplo: 16/4 → 16)
+    if '/' in valor:
+        valor = valor.split('/')[0].strip()
+    try:
+        if valor.startswith('>=') or valor.startswith('<=') or valor.startswith('='):
+            num = float(valor.replace('>=', '').replace('<=', '').replace('=', '').replace(',', '.'))
+            return num
+        elif valor.startswith('>'):
+            num = float(valor[1:].replace(',', '.'))
+            return num * 2
+        elif valor.startswith('<'):
+            num = float(valor[1:].replace(',', '.'))
+            return num / 2
+        else:
+            return float(valor.replace(',', '.'))
+    except (ValueError, TypeError):
+        return pd.NA
+
+# Códigos del calificador que acompaña a cada valor MIC
+CALIFICADOR_INVALIDO = -1  # valor nulo o no interpretable
+CALIFICADORES_MIC = {'': 0, '=': 1, '>=': 2, '<=': 3, '>': 4, '<': 5}
+
+# Calificador opcional seguido de un número decimal (con punto o coma)
+_PATRON_MIC = r'^(>=|<=|=|>|<)?\s*([+-]?(?:[0-9]+(?:[.,][0-9]*)?|[.,][0-9]+)(?:[eE][+-]?[0-9]+)?)$'
+
+def _calificador_mic(texto: str) -> int:
+    for simbolo in ('>=', '<=', '=', '>', '<'):
+        if texto.startswith(simbolo):
+            return CALIFICADORES_MIC[simbolo]
+    return CALIFICADORES_MIC['']
+
+# Interpreta valores MIC en bloque: devuelve los MIC (float, NaN si no se interpretan) y el
+# código del calificador (int8). Mismas reglas que transformar_mic, que resuelve los casos atípicos
+def parsear_mic_vectorizado(valores) -> Tuple[np.ndarray, np.ndarray]:
+    valores = np.asarray(valores, dtype=object)
+    mic = np.full(len(valores), np.nan)
+    calificadores = np.full(len(valores), CALIFICADOR_INVALIDO, dtype=np.int8)
+    posiciones = np.flatnonzero(~pd.isna(valores))
+    if len(posiciones) == 0:
+        return mic, calificadores
+
+    textos = pd.Series(valores[posiciones]).astype(str).str.strip()
+    textos = textos.str.split('/', n=1).str[0].str.strip()
+    partes = textos.str.extract(_PATRON_MIC)
+    coincide = partes[1].notna().to_numpy()
+
+    simbolos = partes[0].fillna('')[coincide]
+    numeros = partes[1][coincide].str.replace(',', '.', regex=False).to_numpy(dtype=object).astype(float)
+    numeros = np.where(simbolos == '>', numeros * 2, np.where(simbolos == '<', numeros / 2, numeros))
+    mic[posiciones[coincide]] = numeros
+    calificadores[posiciones[coincide]] = simbolos.map(CALIFICADORES_MIC).to_numpy(dtype=np.int8)
+
+    # Casos atípicos (p. ej. '==8' o '1_0'): misma lógica escalar que antes
+    for posicion, texto in zip(posiciones[~coincide], textos[~coincide]):
+        num = transformar_mic(valores[posicion])
+        if not pd.isna(num):
+            mic[posicion] = num
+            calificadores[posicion] = _calificador_mic(texto)
+    return mic, calificadores
 
+# Celdas que limpiar_valores_mic interpreta de una vez: acota los textos y extracciones
+# temporales de parsear_mic_vectorizado sin volver a una pasada por columna
+CELDAS_POR_LOTE_MIC = 1_000_000
+
+def limpiar_valores_mic(df: pd.DataFrame, columnas_antibioticos: List[str],
+                        devolver_calificadores: bool = False):
     columnas_presentes = [col for col in columnas_antibioticos if col in df.columns]
-    for col in columnas_presentes:
-        df[col] = df[col].apply(transformar_mic)
+    n = len(df)
+    por_lote = max(1, CELDAS_POR_LOTE_MIC // max(n, 1))
+    calificadores = {}
+    # Una pasada por lote de columnas de antibióticos
+    for inicio in range(0, len(columnas_presentes), por_lote):
+        lote = columnas_presentes[inicio:inicio + por_lote]
+        mic, calificadores_lote = parsear_mic_vectorizado(np.concatenate([df[col].to_numpy(dtype=object) for col in lote]))
+        for k, col in enumerate(lote):
+            df[col] = mic[k * n:(k + 1) * n]
+            if devolver_calificadores:
+                calificadores[col] = calificadores_lote[k * n:(k + 1) * n]
+    if devolver_calificadores:
+        df_calificadores = pd.DataFrame(calificadores, index=df.index, columns=columnas_presentes)
+        return df, df_calificadores
     return df
 
+def _normalizar_texto(valor) -> str:
+    return str(valor).strip().lower()
+
+def _normalizar_clave(valor) -> str:
+    return str(valor).strip().lower() if (valor is not None) else ""
+
+def _agrupar_especies_clsi(clsi_df: pd.DataFrame) -> Dict[str, frozenset]:
+    # Grupo_general -> valores de 'Grupo/Especie especifica' de ese grupo
+    especies = clsi_df[['Grupo_general', 'Grupo/Especie especifica']].dropna()
+    return {grupo: frozenset(valores) for grupo, valores in
+            especies.groupby('Grupo_general', sort=False)['Grupo/Especie especifica']}
+
+# Puntos de corte con índices por (antibiótico, especie/grupo) para búsquedas O(1) con la
+# precedencia exacto -> exclusión -> grupo. No debe modificarse después de construido
+class IndicePuntosCorte(dict):
+    def __init__(self, puntos: Optional[Dict] = None, clsi_df: Optional[pd.DataFrame] = None):
+        super().__init__(puntos or {})
+        self.clsi_df = clsi_df
+        self.especies_por_grupo = _agrupar_especies_clsi(clsi_df) if clsi_df is not None else {}
+        # Claves normalizadas (buscar_puntos_corte)
+        self._directo = {}
+        self._exclusion = {}
+        # Claves literales (obtener_puntos_corte)
+        self._directo_literal = {}
+        self._exclusion_literal = {}
+        for (antibiotico, objetivo, modo_exclusion, excluidas), valores in self.items():
+            clave = (_normalizar_texto(antibiotico), _normalizar_texto(objetivo))
+            if bool(modo_exclusion):
+                excluidas_norm = None if excluidas is None else frozenset(e.strip().lower() for e in excluidas)
+                self._exclusion.setdefault(clave, []).append((excluidas_norm, valores))
+                self._exclusion_literal.setdefault(antibiotico, []).append((objetivo, excluidas, valores))
+            else:
+                if excluidas is None:
+                    self._directo.setdefault(clave, valores)
+                self._directo_literal.setdefault((antibiotico, objetivo), valores)
+
+    def buscar(self, antibiotico: str, especie: str, grupo: str) -> Optional[tuple]:
+        ant = _normalizar_texto(antibiotico)
+        esp = _normalizar_clave(especie)
+        grp = _normalizar_clave(grupo)
+        # 1) coincidencia exacta por especie
+        valores = self._directo.get((ant, esp))
+        if valores is not None:
+            return valores
+        # 2) reglas de exclusión para el grupo
+        for excluidas, valores in self._exclusion.get((ant, grp), ()):
+            if excluidas is None or esp not in excluidas:
+                return valores
+        # 3) coincidencia por grupo general
+        return self._directo.get((ant, grp))
+
+    def obtener(self, antibiotico: str, especie: str, clsi_df: Optional[pd.DataFrame] = None) -> Optional[tuple]:
+        # 1. Coincidencia exacta por especie (sin exclusión)
+        if (antibiotico, especie, False, None) in self:
+            return self[(antibiotico, especie, False, None)]
+        # 2. Buscar reglas de exclusión aplicables (el grupo general debe coincidir)
+        if clsi_df is not None:
+            especies_por_grupo = self.especies_por_grupo if clsi_df is self.clsi_df else _agrupar_especies_clsi(clsi_df)
+            for grupo, excluidas, valores in self._exclusion_literal.get(antibiotico, ()):
+                if especie not in excluidas and (especie in especies_por_grupo.get(grupo, ()) or grupo == especie):
+                    return valores
+        # 3. Coincidencia por grupo general (sin exclusión)
+        return self._directo_literal.get((antibiotico, especie))
+
+def _como_indice(diccionario: Dict) -> IndicePuntosCorte:
+    if isinstance(diccionario, IndicePuntosCorte):
+        return diccionario
+    return IndicePuntosCorte(diccionario)
+
+# Memoriza los puntos de corte (clásico y alterno) resueltos por (antibiótico, especie, grupo)
+class CacheResolucion:
+    def __init__(self, puntos_corte_clasico: Dict, puntos_corte_alterno: Dict):
+        self.puntos_corte_clasico = _como_indice(puntos_corte_clasico)
+        self.puntos_corte_alterno = _como_indice(puntos_corte_alterno)
+        self._resueltos = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    def resolver(self, antibiotico: str, especie: str, grupo: str) -> Tuple[Optional[tuple], Optional[tuple]]:
+        clave = (_normalizar_texto(antibiotico), _normalizar_clave(especie), _normalizar_clave(grupo))
+        resultado = self._resueltos.get(clave)
+        if resultado is not None:
+            self.aciertos += 1
+            return resultado
+        self.fallos += 1
+        resultado = (self.puntos_corte_clasico.buscar(antibiotico, especie, grupo),
+                     self.puntos_corte_alterno.buscar(antibiotico, especie, grupo))
+        self._resueltos[clave] = resultado
+        return resultado
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {'aciertos': self.aciertos, 'fallos': self.fallos, 'entradas': len(self._resueltos)}
+
+    def limpiar(self) -> None:
+        self._resueltos.clear()
+        self.aciertos = 0
+        self.fallos = 0
+
+# Cache de resolución compartido por el pipeline; se invalida al recargar la tabla CLSI
+_cache_resolucion: Optional[CacheResolucion] = None
+
+def obtener_cache_resolucion(puntos_corte_clasico: Dict, puntos_corte_alterno: Dict) -> CacheResolucion:
+    global _cache_resolucion
+    cache = _cache_resolucion
+    if (cache is None or cache.puntos_corte_clasico is not puntos_corte_clasico
+            or cache.puntos_corte_alterno is not puntos_corte_alterno):
+        cache = CacheResolucion(puntos_corte_clasico, puntos_corte_alterno)
+        _cache_resolucion = cache
+    return cache
+
+def limpiar_cache_resolucion() -> None:
+    global _cache_resolucion
+    if _cache_resolucion is not None:
+        _cache_resolucion.limpiar()
+    _cache_resolucion = None
+
+# Versión de la estructura de los puntos de corte compilados (DataFrame e IndicePuntosCorte);
+# incrementarla al cambiar el formato del índice para que se reconstruyan los artefactos
+VERSION_PUNTOS_CORTE = 1
+
 def cargar_puntos_corte_clsi(ruta_clsi: str) -> Tuple[Dict, Dict]:
     
     try:
-        # Cargar archivo de puntos de corte
-        clsi_df = pd.read_excel(
-            ruta_clsi,
-            usecols=['Antibiotico', 'Grupo_general', 'Grupo/Especie especifica',
-                     'CLSI <=S', 'CLSI =I/SDD', 'CLSI >=R',
-                     'CLSI >=S', 'CLSI =I', 'CLSI <=R']
-        )
-        
-        # Funciones auxiliares (mantenidas exactamente como en el código original)
-        def limpiar_mic(valor):
-            if pd.isna(valor):
-                return None
-            valor = str(valor).split('/')[0].strip().replace(',', '.')
-            return valor
-        
-        def es_numero(valor):
-            if valor is None:
-                return False
-            return re.match(r'^\d+(\.\d+)?$', valor) is not None
-        
-        def limpiar_intermedio(valor):
-            if pd.isna(valor):
-                return None
-            valor = str(valor).strip().replace(',', '.')
-            if re.match(r'^\d+(\.\d+)?-\d+(\.\d+)?$', valor):
-                return 'rango'
-            if es_numero(valor):
-                return float(valor)
-            return None
-        
-        # Diccionarios de puntos de corte
-        puntos_corte_clasico = {}
-        puntos_corte_alterno = {}
-        
-        for _, fila in clsi_df.iterrows():
-            antibiotico = str(fila['Antibiotico']).strip()
-            grupo_general = str(fila['Grupo_general']).strip()
-            grupo_especifico = str(fila['Grupo/Especie especifica']).strip()
-            
-            # Detectar si es un caso de exclusión
-            modo_exclusion = False
-            especies_excluidas = []
-            especies_incluidas = []
-            if grupo_especifico.lower().startswith("diferente:"):
-                modo_exclusion = True
-                especies_str = grupo_especifico.split(":", 1)[1].strip()
-                especies_excluidas = [e.strip() for e in especies_str.split(",") if e.strip()]
-            elif grupo_especifico.lower() != 'nan' and grupo_especifico.strip() != "":
-                especies_incluidas = [e.strip() for e in grupo_especifico.split(",") if e.strip()]
-            
-            # --- Método clásico ---
-            s = limpiar_mic(fila['CLSI <=S'])
-            i = limpiar_intermedio(fila['CLSI =I/SDD'])
-            r = limpiar_mic(fila['CLSI >=R'])
-            if es_numero(s) and es_numero(r):
-                if modo_exclusion:
-                    puntos_corte_clasico[(antibiotico, grupo_general, True, tuple(especies_excluidas))] = (float(s), i, float(r))
-                else:
-                    for especie in especies_incluidas:
-                        puntos_corte_clasico[(antibiotico, especie, False, None)] = (float(s), i, float(r))
-                    puntos_corte_clasico[(antibiotico, grupo_general, False, None)] = (float(s), i, float(r))
-            
-            # --- Método alterno ---
-            s_alt = limpiar_mic(fila['CLSI >=S'])
-            i_alt = limpiar_intermedio(fila['CLSI =I'])
-            r_alt = limpiar_mic(fila['CLSI <=R'])
-            if es_numero(s_alt) and es_numero(r_alt):
-                if modo_exclusion:
-                    puntos_corte_alterno[(antibiotico, grupo_general, True, tuple(especies_excluidas))] = (float(s_alt), i_alt, float(r_alt))
-                else:
-                    for especie in especies_incluidas:
-                        puntos_corte_alterno[(antibiotico, especie, False, None)] = (float(s_alt), i_alt, float(r_alt))
-                    puntos_corte_alterno[(antibiotico, grupo_general, False, None)] = (float(s_alt), i_alt, float(r_alt))
-        
-        return clsi_df, puntos_corte_clasico, puntos_corte_alterno
-    
+        limpiar_cache_resolucion()
+        # Los diccionarios se compilan una vez por versión del libro CLSI
+        return cargar_compilado(ruta_clsi, 'puntos_corte', _compilar_puntos_corte_clsi, VERSION_PUNTOS_CORTE)
     except Exception as e:
         raise ValueError(f"Error al cargar puntos de corte CLSI desde {ruta_clsi}: {str(e)}")
 
+def _compilar_puntos_corte_clsi(ruta_clsi: str) -> Tuple[pd.DataFrame, 'IndicePuntosCorte', 'IndicePuntosCorte']:
+    # Cargar archivo de puntos de corte
+    clsi_df = pd.read_excel(
+        ruta_clsi,
+        usecols=['Antibiotico', 'Grupo_general', 'Grupo/Especie especifica',
+                 'CLSI <=S', 'CLSI =I/SDD', 'CLSI >=R',
+                 'CLSI >=S', 'CLSI =I', 'CLSI <=R']
+    )
+
+    # Funciones auxiliares (mantenidas exactamente como en el código original)
+    def limpiar_mic(valor):
+        if pd.isna(valor):
+            return None
+        valor = str(valor).split('/')[0].strip().replace(',', '.')
+        return valor
+
+    def es_numero(valor):
+        if valor is None:
+            return False
+        return re.match(r'^\d+(\.\d+)?$', valor) is not None
+
+    def limpiar_intermedio(valor):
+        if pd.isna(valor):
+            return None
+        valor = str(valor).strip().replace(',', '.')
+        if re.match(r'^\d+(\.\d+)?-\d+(\.\d+)?$', valor):
+            return 'rango'
+        if es_numero(valor):
+            return float(valor)
+        return None
+
+    # Diccionarios de puntos de corte
+    puntos_corte_clasico = {}
+    puntos_corte_alterno = {}
+
+    for fila in clsi_df.to_dict('records'):
+        antibiotico = str(fila['Antibiotico']).strip()
+        grupo_general = str(fila['Grupo_general']).strip()
+        grupo_especifico = str(fila['Grupo/Especie especifica']).strip()
+
+        # Detectar si es un caso de exclusión
+        modo_exclusion = False
+        especies_excluidas = []
+        especies_incluidas = []
+        if grupo_especifico.lower().startswith("diferente:"):
+            modo_exclusion = True
+            especies_str = grupo_especifico.split(":", 1)[1].strip()
+            especies_excluidas = [e.strip() for e in especies_str.split(",") if e.strip()]
+        elif grupo_especifico.lower() != 'nan' and grupo_especifico.strip() != "":
+            especies_incluidas = [e.strip() for e in grupo_especifico.split(",") if e.strip()]
+
+        # --- Método clásico ---
+        s = limpiar_mic(fila['CLSI <=S'])
+        i = limpiar_intermedio(fila['CLSI =I/SDD'])
+        r = limpiar_mic(fila['CLSI >=R'])
+        if es_numero(s) and es_numero(r):
+            if modo_exclusion:
+                puntos_corte_clasico[(antibiotico, grupo_general, True, tuple(especies_excluidas))] = (float(s), i, float(r))
+            else:
+                for especie in especies_incluidas:
+                    puntos_corte_clasico[(antibiotico, especie, False, None)] = (float(s), i, float(r))
+                puntos_corte_clasico[(antibiotico, grupo_general, False, None)] = (float(s), i, float(r))
+
+        # --- Método alterno ---
+        s_alt = limpiar_mic(fila['CLSI >=S'])
+        i_alt = limpiar_intermedio(fila['CLSI =I'])
+        r_alt = limpiar_mic(fila['CLSI <=R'])
+        if es_numero(s_alt) and es_numero(r_alt):
+            if modo_exclusion:
+                puntos_corte_alterno[(antibiotico, grupo_general, True, tuple(especies_excluidas))] = (float(s_alt), i_alt, float(r_alt))
+            else:
+                for especie in especies_incluidas:
+                    puntos_corte_alterno[(antibiotico, especie, False, None)] = (float(s_alt), i_alt, float(r_alt))
+                puntos_corte_alterno[(antibiotico, grupo_general, False, None)] = (float(s_alt), i_alt, float(r_alt))
+
+    return (clsi_df,
+            IndicePuntosCorte(puntos_corte_clasico, clsi_df),
+            IndicePuntosCorte(puntos_corte_alterno, clsi_df))
+
 def obtener_puntos_corte(antibiotico: str, especie: str, metodo: str = 'clasico', clsi_df: pd.DataFrame = None,
                          puntos_corte_clasico: Dict = None, puntos_corte_alterno: Dict = None) -> Optional[tuple]:
     
     diccionario = puntos_corte_clasico if metodo == 'clasico' else puntos_corte_alterno
-    # 1. Coincidencia exacta por especie (sin exclusión)
-    if (antibiotico, especie, False, None) in diccionario:
-        return diccionario[(antibiotico, especie, False, None)]
-    # 2. Buscar reglas de exclusión aplicables
-    for (ab, grupo, modo_exc, excluidas), valores in diccionario.items():
-        if ab == antibiotico and modo_exc and especie not in excluidas:
-            # El grupo general debe coincidir
-            if clsi_df is not None and (especie in clsi_df.loc[clsi_df['Grupo_general'] == grupo, 'Grupo/Especie especifica'].values or grupo == especie):
-                return valores
-    # 3. Coincidencia por grupo general (sin exclusión)
-    for (ab, grupo, modo_exc, _), valores in diccionario.items():
-        if ab == antibiotico and not modo_exc and grupo == especie:
-            return valores
-    return None
+    return _como_indice(diccionario).obtener(antibiotico, especie, clsi_df)
 
 def sigue_patron_dilucion_doble(valor):
     try:
@@ -220,43 +421,21 @@ def sigue_patron_dilucion_doble(valor):
     except:
         return False
 
+# sigue_patron_dilucion_doble para una columna completa: la mantisa de frexp es 0.5 (o ~1)
+# en las diluciones dobles; nulos, no finitos y no positivos dan False
+def sigue_patron_dilucion_doble_vectorizado(valores) -> np.ndarray:
+    mic = np.asarray(valores, dtype=float)
+    valido = np.isfinite(mic) & (mic > 0)
+    mantisa, _ = np.frexp(np.where(valido, mic, 1.0))
+    return valido & ((mantisa == 0.5) | (np.abs(mantisa - 1) < 0.0001))
+
 def buscar_puntos_corte(diccionario: Dict, antibiotico: str, especie: str, grupo: str) -> Optional[tuple]:
     if antibiotico is None:
         return None
-    ant = str(antibiotico).strip().lower()
-    esp = str(especie).strip().lower() if (especie is not None) else ""
-    grp = str(grupo).strip().lower() if (grupo is not None) else ""
-    # 1) coincidencia exacta por especie (modo_exclusion False, k_excl is None)
-    for key, val in diccionario.items():
-        k_ant, k_target, k_modo, k_excl = key
-        if str(k_ant).strip().lower() != ant:
-            continue
-        if (not bool(k_modo)) and (k_excl is None):
-            if str(k_target).strip().lower() == esp:
-                return val
-    # 2) reglas de exclusión (modo_exclusion True) para el grupo
-    for key, val in diccionario.items():
-        k_ant, k_target, k_modo, k_excl = key
-        if str(k_ant).strip().lower() != ant:
-            continue
-        if bool(k_modo) and str(k_target).strip().lower() == grp:
-            # k_excl expected to be tuple/list of excluded species
-            if k_excl is None:
-                return val
-            excluded_lower = [e.strip().lower() for e in list(k_excl)]
-            if esp not in excluded_lower:
-                return val
-            # si esp está en excluded_lower -> no aplica esta regla de exclusión (se ignora)
-    # 3) coincidencia por grupo general (modo_exclusion False)
-    for key, val in diccionario.items():
-        k_ant, k_target, k_modo, k_excl = key
-        if str(k_ant).strip().lower() != ant:
-            continue
-        if (not bool(k_modo)) and (k_excl is None) and str(k_target).strip().lower() == grp:
-            return val
-    return None
+    return _como_indice(diccionario).buscar(antibiotico, especie, grupo)
 
-def categorizar_mic(valor: any, antibiotico_col: str, especie: str, grupo: str, puntos_corte_clasico: Dict, puntos_corte_alterno: Dict) -> any:
+def categorizar_mic(valor: any, antibiotico_col: str, especie: str, grupo: str, puntos_corte_clasico: Dict, puntos_corte_alterno: Dict,
+                    cache: Optional[CacheResolucion] = None) -> any:
     if pd.isna(valor):
         return valor
     try:
@@ -265,8 +444,15 @@ def categorizar_mic(valor: any, antibiotico_col: str, especie: str, grupo: str,
         return 'Inconcluyente'
     # decidir método según patrón (diluciones dobles -> clásico)
     es_clasico = sigue_patron_dilucion_doble(mic)
+    if cache is not None:
+        # Sin antibiótico no hay puntos de corte (como buscar_puntos_corte); no se guarda en el cache
+        puntos_clasico, puntos_alterno = ((None, None) if antibiotico_col is None
+                                          else cache.resolver(antibiotico_col, especie, grupo))
     if es_clasico:
-        puntos = buscar_puntos_corte(puntos_corte_clasico, antibiotico_col, especie, grupo)
+        if cache is not None:
+            puntos = puntos_clasico
+        else:
+            puntos = buscar_puntos_corte(puntos_corte_clasico, antibiotico_col, especie, grupo)
         if puntos is None:
             return valor  # sin puntos de corte, dejamos el valor original
         s, i, r = puntos
@@ -285,7 +471,10 @@ def categorizar_mic(valor: any, antibiotico_col: str, especie: str, grupo: str,
         else:
             return 'Inconcluyente'
     else:
-        puntos = buscar_puntos_corte(puntos_corte_alterno, antibiotico_col, especie, grupo)
+        if cache is not None:
+            puntos = puntos_alterno
+        else:
+            puntos = buscar_puntos_corte(puntos_corte_alterno, antibiotico_col, especie, grupo)
         if puntos is None:
             return valor
         s, i, r = puntos
@@ -299,139 +488,408 @@ def categorizar_mic(valor: any, antibiotico_col: str, especie: str, grupo: str,
         else:
             return 'Inconcluyente'
 
-def categorizar_dataframe(data: pd.DataFrame, puntos_corte_clasico: Dict, puntos_corte_alterno: Dict) -> pd.DataFrame:
-    df_categorizado = data.copy()
-    columnas_ab = [
-        col for col in data.columns
-        if col not in ['Grupo_general', 'fecha', 'especie', 'Hospital', 'Region', 
-                       'Grupo_principal', 'Tipo de localizacion', 'Tipo de muestra', 
-                       'SPEC_NUM', 'Edad']
+# Columnas que no contienen valores MIC
+COLUMNAS_NO_ANTIBIOTICOS = ['Grupo_general', 'fecha', 'especie', 'Hospital', 'Region',
+                            'Grupo_principal', 'Tipo de localizacion', 'Tipo de muestra',
+                            'SPEC_NUM', 'Edad']
+
+# Tabla de resultados usada por el motor vectorizado (el último código equivale a None)
+_CATEGORIAS = np.array(['S', 'I', 'R', 'Inconcluyente', None], dtype=object)
+_COD_S, _COD_I, _COD_R, _COD_INCONCLUYENTE, _COD_NINGUNO = range(5)
+
+def _a_float(valor) -> Optional[float]:
+    try:
+        return float(valor)
+    except:
+        return None
+
+def _normalizar_columna(serie: pd.Series) -> np.ndarray:
+    # Normaliza sobre los valores únicos; los nulos se resuelven uno a uno (None -> "", NaN -> "nan")
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    normalizados = np.array([_normalizar_clave(u) for u in unicos] + [""], dtype=object)
+    claves = normalizados[codigos]
+    nulos = codigos == -1
+    if nulos.any():
+        claves[nulos] = [_normalizar_clave(v) for v in serie.to_numpy(dtype=object)[nulos]]
+    return claves
+
+def _tabla_puntos_corte(resueltos: List[Optional[tuple]]) -> Tuple[np.ndarray, ...]:
+    # Convierte los puntos de corte resueltos por par (especie, grupo) en arreglos
+    n = len(resueltos)
+    tiene = np.zeros(n, dtype=bool)
+    s = np.full(n, np.nan)
+    r = np.full(n, np.nan)
+    tipo_i = np.zeros(n, dtype=np.int8)  # 0: sin intermedio, 1: numérico, 2: rango
+    valor_i = np.full(n, np.nan)
+    for k, puntos in enumerate(resueltos):
+        if puntos is None:
+            continue
+        tiene[k] = True
+        s[k], i, r[k] = puntos
+        if i not in [None, '']:
+            if isinstance(i, (int, float)):
+                tipo_i[k] = 1
+                valor_i[k] = i
+            else:
+                tipo_i[k] = 2
+    return tiene, s, tipo_i, valor_i, r
+
+def _categorizar_columna(valores: pd.Series, antibiotico: str, codigos_par: np.ndarray, pares,
+                         cache: CacheResolucion) -> Optional[np.ndarray]:
+    # Conversión a float sobre los valores únicos (misma semántica que float() en categorizar_mic)
+    codigos, unicos = pd.factorize(valores, use_na_sentinel=True)
+    if len(unicos) == 0:
+        return None
+    mic_unicos = [_a_float(u) for u in unicos]
+    invalido_unicos = np.array([m is None for m in mic_unicos] + [False])
+    mic_unicos = np.array([np.nan if m is None else m for m in mic_unicos] + [np.nan], dtype=float)
+
+    no_nulo = codigos != -1
+    mic = mic_unicos[codigos]
+    invalido = invalido_unicos[codigos]
+    valido = no_nulo & ~invalido
+    # Diluciones dobles -> método clásico; el resto usa la tabla alterna
+    es_clasico = sigue_patron_dilucion_doble_vectorizado(mic)
+
+    resultado = np.full(len(valores), _COD_NINGUNO, dtype=np.int8)
+    asignado = invalido.copy()
+    resultado[invalido] = _COD_INCONCLUYENTE
+
+    resueltos = [cache.resolver(antibiotico, especie, grupo) for especie, grupo in pares]
+
+    with np.errstate(invalid='ignore'):
+        # Método clásico: MIC <= S -> S, MIC >= R -> R, entre -> I si i existe
+        tiene, s, tipo_i, valor_i, r = (t[codigos_par] for t in _tabla_puntos_corte([p[0] for p in resueltos]))
+        mascara = valido & es_clasico & tiene
+        codigo = np.select(
+            [mic <= s, mic >= r, tipo_i == 0,
+             (tipo_i == 1) & (mic == valor_i),
+             (tipo_i == 2) & (s < mic) & (mic < r)],
+            [_COD_S, _COD_R, _COD_INCONCLUYENTE, _COD_I, _COD_I],
+            default=_COD_NINGUNO
+        )
+        resultado[mascara] = codigo[mascara]
+        asignado |= mascara
+
+        # Método alterno: MIC >= S -> S, MIC <= R -> R, entre -> I si i existe
+        tiene, s, tipo_i, valor_i, r = (t[codigos_par] for t in _tabla_puntos_corte([p[1] for p in resueltos]))
+        mascara = valido & ~es_clasico & tiene
+        codigo = np.select(
+            [mic >= s, mic <= r, (tipo_i != 0) & (r < mic) & (mic < s)],
+            [_COD_S, _COD_R, _COD_I],
+            default=_COD_INCONCLUYENTE
+        )
+        resultado[mascara] = codigo[mascara]
+        asignado |= mascara
+
+    if not asignado.any():
+        return None
+    # Sin puntos de corte (o valor nulo) se conserva el valor original
+    salida = valores.to_numpy(dtype=object, copy=True)
+    salida[asignado] = _CATEGORIAS[resultado[asignado]]
+    return salida
+
+# Estado de cada proceso trabajador: los puntos de corte se envían una sola vez por pool y la
+# cache de resolución se conserva entre llamadas (p. ej. entre los bloques de una carga)
+_estado_trabajador: Dict = {}
+
+def _inicializar_trabajador(puntos_corte_clasico: Dict, puntos_corte_alterno: Dict) -> None:
+    _estado_trabajador['cache'] = CacheResolucion(puntos_corte_clasico, puntos_corte_alterno)
+
+def _categorizar_bloque(columnas: List[Tuple[str, np.ndarray]], codigos_par: np.ndarray,
+                        pares) -> List[Tuple[str, Optional[np.ndarray]]]:
+    return [
+        (col, _categorizar_columna(pd.Series(valores), col, codigos_par, pares, _estado_trabajador['cache']))
+        for col, valores in columnas
     ]
-    for col in columnas_ab:
-        for idx, row in data.iterrows():
-            grupo = row['Grupo_general']
-            especie = row['especie']
-            mic_valor = row[col]
-            antibiotico_col = col  # debe coincidir con los nombres usados en Lista_CLSI_test
-            categoria = categorizar_mic(mic_valor, antibiotico_col, especie, grupo, puntos_corte_clasico, puntos_corte_alterno)
-            df_categorizado.at[idx, col] = categoria
+
+def crear_pool_categorizacion(puntos_corte_clasico: Dict, puntos_corte_alterno: Dict,
+                              n_procesos: int = PROCESOS_CATEGORIZACION) -> Optional[ProcessPoolExecutor]:
+    # Pool de procesos para categorizar_dataframe con esos puntos de corte (None con un solo proceso)
+    if n_procesos <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_trabajador,
+                               initargs=(puntos_corte_clasico, puntos_corte_alterno))
+
+# Categoriza columna a columna con NumPy; mismo resultado que categorizar_mic celda por celda.
+# Con n_procesos > 1 y al menos umbral_paralelo celdas, las columnas se reparten entre procesos.
+# pool (ver crear_pool_categorizacion) debe haberse creado con los mismos puntos de corte; sin pool
+# se crea uno solo para esta llamada. Con copiar=False las categorías se escriben en data
+def categorizar_dataframe(data: pd.DataFrame, puntos_corte_clasico: Dict, puntos_corte_alterno: Dict,
+                          n_procesos: int = 1, umbral_paralelo: int = 500_000, copiar: bool = True,
+                          pool: Optional[ProcessPoolExecutor] = None) -> pd.DataFrame:
+    df_categorizado = data.copy() if copiar else data
+    columnas_ab = [col for col in data.columns if col not in COLUMNAS_NO_ANTIBIOTICOS]
+    if not columnas_ab or data.empty:
+        return df_categorizado
+
+    especies = _normalizar_columna(data['especie'])
+    grupos = _normalizar_columna(data['Grupo_general'])
+    codigos_par, pares = pd.factorize(pd.MultiIndex.from_arrays([especies, grupos]))
+
+    n_procesos = min(n_procesos, len(columnas_ab))
+    if n_procesos > 1 and len(data) * len(columnas_ab) >= umbral_paralelo:
+        # Bloques contiguos de columnas; map conserva el orden, así que el resultado es determinista
+        bloques = [
+            [(col, data[col].to_numpy()) for col in columnas]
+            for columnas in np.array_split(np.array(columnas_ab, dtype=object), n_procesos * 2) if len(columnas)
+        ]
+        propio = pool is None
+        executor = crear_pool_categorizacion(puntos_corte_clasico, puntos_corte_alterno, n_procesos) if propio else pool
+        try:
+            lotes = executor.map(_categorizar_bloque, bloques, repeat(codigos_par), repeat(list(pares)))
+            resultados = [par for bloque in lotes for par in bloque]
+        finally:
+            if propio:
+                executor.shutdown()
+        print(f"Categorización en {n_procesos} procesos ({len(bloques)} bloques de columnas)")
+    else:
+        cache = obtener_cache_resolucion(puntos_corte_clasico, puntos_corte_alterno)
+        resultados = [(col, _categorizar_columna(data[col], col, codigos_par, pares, cache)) for col in columnas_ab]
+        estadisticas = cache.estadisticas()
+        print(f"Puntos de corte: {estadisticas['fallos']} resueltos, {estadisticas['aciertos']} desde cache")
+
+    for col, categorias in resultados:
+        if categorias is not None:
+            df_categorizado[col] = pd.Series(categorias, index=data.index, dtype=object)
     return df_categorizado
 
-def procesar_dataset(df: pd.DataFrame, ruta_diccionarios: str) -> Tuple[pd.DataFrame, Dict[str, Dict]]:
-    
-    # Diccionarios para almacenar resultados
-    diccionarios = {}
-    
-    # 1. Renombrar columnas principales
-    dicc_variables = cargar_diccionario(
-        ruta_diccionarios, 
-        columnas=['variable_original', 'variable_nueva'],
-        llave='variable_original',
-        valor='variable_nueva'
-    )
-    data = renombrar_columnas(df, dicc_variables)
-    
-    # 2. Reemplazar valores de tipo de muestra
-    dicc_muestras = cargar_diccionario(
-        ruta_diccionarios,
-        columnas=['codigo_muestra', 'nombre_muestra'],
-        llave='codigo_muestra',
-        valor='nombre_muestra'
-    )
-    data = reemplazar_valores(data, 'Tipo de muestra', dicc_muestras)
-    diccionarios['dicc_muestras'] = dicc_muestras
-    
-    # 3. Reemplazar valores de tipo de servicio
-    dicc_localizacion = cargar_diccionario(
-        ruta_diccionarios,
-        columnas=['codigo_localizacion', 'nombre_localizacion'],
-        llave='codigo_localizacion',
-        valor='nombre_localizacion'
-    )
-    data = reemplazar_valores(data, 'Tipo de localizacion', dicc_localizacion)
-    diccionarios['dicc_localizacion'] = dicc_localizacion
-    
-    # 4. Procesar antibióticos
-    antibioticos = cargar_datos(ruta_diccionarios)[['antibiotico_1', 'antibiotico_2', 'antibiotico_3', 'antibiotico_4', 'antibiotico']]
-    variantes = ['antibiotico_1', 'antibiotico_2', 'antibiotico_3', 'antibiotico_4']
-    columna_usada = detectar_columna_antibioticos(data, antibioticos, variantes)
+# Tablas de referencia compartidas por las etapas del pipeline: se cargan de forma perezosa,
+# una sola vez por proceso (con lock), y no deben modificarse
+class RegistroReferencias:
+    def __init__(self, ruta_diccionarios: str = RUTA_DICCIONARIOS,
+                 ruta_mapeo_especies: str = RUTA_MAPEO_ESPECIES, ruta_clsi: str = RUTA_CLSI):
+        self.ruta_diccionarios = ruta_diccionarios
+        self.ruta_mapeo_especies = ruta_mapeo_especies
+        self.ruta_clsi = ruta_clsi
+        self._tablas = {}
+        self._lock = threading.RLock()
+
+    def _obtener(self, nombre, construir):
+        tabla = self._tablas.get(nombre)
+        if tabla is None:
+            with self._lock:
+                tabla = self._tablas.get(nombre)
+                if tabla is None:
+                    tabla = construir()
+                    self._tablas[nombre] = tabla
+        return tabla
+
+    def _diccionario(self, llave: str, valor: str) -> Dict[str, str]:
+        return self._obtener(('dicc', llave, valor), lambda: cargar_diccionario(
+            self.ruta_diccionarios, columnas=[llave, valor], llave=llave, valor=valor))
+
+    @property
+    def dicc_variables(self) -> Dict[str, str]:
+        return self._diccionario('variable_original', 'variable_nueva')
+
+    @property
+    def dicc_muestras(self) -> Dict[str, str]:
+        return self._diccionario('codigo_muestra', 'nombre_muestra')
+
+    @property
+    def dicc_localizacion(self) -> Dict[str, str]:
+        return self._diccionario('codigo_localizacion', 'nombre_localizacion')
+
+    @property
+    def antibioticos(self) -> pd.DataFrame:
+        return self._obtener('antibioticos', lambda: cargar_datos(self.ruta_diccionarios)[
+            VARIANTES_ANTIBIOTICO + ['antibiotico']])
+
+    @property
+    def especies(self) -> pd.DataFrame:
+        return self._obtener('especies', lambda: cargar_datos(self.ruta_diccionarios)[
+            VARIANTES_ESPECIE + ['especie']])
+
+    def dicc_antibioticos(self, variante: str) -> Dict[str, str]:
+        return self._diccionario(variante, 'antibiotico')
+
+    def dicc_especies(self, variante: str) -> Dict[str, str]:
+        return self._diccionario(variante, 'especie')
+
+    def _mapeo_especies(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        def construir():
+            mapeo = cargar_datos(self.ruta_mapeo_especies)
+            return (dict(zip(mapeo['Especie_especifica'], mapeo['Grupo_general'])),
+                    dict(zip(mapeo['Especie_especifica'], mapeo['Grupo_principal'])))
+        return self._obtener('mapeo_especies', construir)
+
+    @property
+    def dicc_grupo_general(self) -> Dict[str, str]:
+        return self._mapeo_especies()[0]
+
+    @property
+    def dicc_grupo_principal(self) -> Dict[str, str]:
+        return self._mapeo_especies()[1]
+
+    @property
+    def puntos_corte(self) -> Tuple[pd.DataFrame, IndicePuntosCorte, IndicePuntosCorte]:
+        return self._obtener('puntos_corte', lambda: cargar_puntos_corte_clsi(self.ruta_clsi))
+
+    def recargar(self) -> None:
+        with self._lock:
+            self._tablas = {}
+            limpiar_cache_resolucion()
+
+_registro: Optional[RegistroReferencias] = None
+_registro_lock = threading.Lock()
+
+# Registro de referencias del proceso (uno por worker de gunicorn)
+def obtener_registro() -> RegistroReferencias:
+    global _registro
+    if _registro is None:
+        with _registro_lock:
+            if _registro is None:
+                _registro = RegistroReferencias()
+    return _registro
+
+# Columnas que se eliminan aunque vengan con nombre de antibiótico
+COLUMNAS_NO_DESEADAS = [
+    'BLEE',
+    'Gentamicina de nivel alto (sinergia)',
+    'Estreptomicina de nivel alto (sinergia)',
+    'Resistencia inducible a clindamicina',
+    'Deteccion de cefoxitina'
+]
+# Valores de antibióticos que no son resultados
+VALORES_NO_DESEADOS = ['TRM', 'R/N', 'NEG']
+
+# Contexto inicial de las etapas de categorización para un EjecutorPipeline
+@contextmanager
+def pool_categorizacion(registro: Optional[RegistroReferencias] = None,
+                        n_procesos: int = PROCESOS_CATEGORIZACION) -> Iterator[Optional[ProcessPoolExecutor]]:
+    # Un pool por carga: los bloques de un mismo archivo reutilizan los procesos trabajadores
+    _, puntos_corte_clasico, puntos_corte_alterno = (registro or obtener_registro()).puntos_corte
+    pool = crear_pool_categorizacion(puntos_corte_clasico, puntos_corte_alterno, n_procesos)
+    try:
+        yield pool
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def contexto_categorizacion(registro: Optional[RegistroReferencias] = None,
+                            variantes: Optional[Dict[str, Optional[str]]] = None,
+                            hospital: str = HOSPITAL_POR_DEFECTO,
+                            region: str = REGION_POR_DEFECTO,
+                            pool: Optional[ProcessPoolExecutor] = None) -> Dict:
+    # Variantes de códigos ya detectadas (p. ej. en el primer bloque de una carga por bloques)
+    # y pool de categorización compartido por toda la carga (ver pool_categorizacion)
+    return {'registro': registro or obtener_registro(), 'variantes': dict(variantes or {}),
+            'hospital': hospital, 'region': region, 'diccionarios': {}, 'pool_categorizacion': pool}
+
+# Etapas registradas de la categorización. Todas modifican el DataFrame de trabajo en el
+# lugar (renombrar, eliminar y reemplazar columnas), sin copias del archivo completo.
+
+@registrar_etapa('renombrar_columnas', progreso='renombrar')
+def _etapa_renombrar_columnas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return renombrar_columnas(df, contexto['registro'].dicc_variables)
+
+@registrar_etapa('reemplazar_muestras')
+def _etapa_reemplazar_muestras(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    dicc_muestras = contexto['registro'].dicc_muestras
+    contexto['diccionarios']['dicc_muestras'] = dicc_muestras
+    return reemplazar_valores(df, 'Tipo de muestra', dicc_muestras)
+
+@registrar_etapa('reemplazar_localizacion')
+def _etapa_reemplazar_localizacion(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    dicc_localizacion = contexto['registro'].dicc_localizacion
+    contexto['diccionarios']['dicc_localizacion'] = dicc_localizacion
+    return reemplazar_valores(df, 'Tipo de localizacion', dicc_localizacion)
+
+@registrar_etapa('renombrar_antibioticos')
+def _etapa_renombrar_antibioticos(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    registro, variantes = contexto['registro'], contexto['variantes']
+    columna_usada = variantes.get('antibiotico') or detectar_columna_antibioticos(df, registro.antibioticos, VARIANTES_ANTIBIOTICO)
+    variantes['antibiotico'] = columna_usada
     
     dicc_antibioticos = {}
     if columna_usada:
-        dicc_antibioticos = cargar_diccionario(
-            ruta_diccionarios,
-            columnas=[columna_usada, 'antibiotico'],
-            llave=columna_usada,
-            valor='antibiotico'
-        )
-        data = renombrar_columnas(data, dicc_antibioticos)
-    diccionarios['dicc_antibioticos'] = dicc_antibioticos
-    
-    # 5. Procesar especies
-    especies = cargar_datos(ruta_diccionarios)[['especie_1', 'especie_2', 'especie_3', 'especie']]
-    columnas_codigo = ['especie_1', 'especie_2', 'especie_3']
-    columna_usada = detectar_columna_especies(data, especies, columnas_codigo)
+        dicc_antibioticos = registro.dicc_antibioticos(columna_usada)
+        df = renombrar_columnas(df, dicc_antibioticos)
+    contexto['diccionarios']['dicc_antibioticos'] = dicc_antibioticos
+    contexto['columnas_antibioticos'] = [c for c in dicc_antibioticos.values() if c in df.columns]
+    return df
+
+@registrar_etapa('reemplazar_especies')
+def _etapa_reemplazar_especies(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    registro, variantes = contexto['registro'], contexto['variantes']
+    columna_usada = variantes.get('especie') or detectar_columna_especies(df, registro.especies, VARIANTES_ESPECIE)
+    variantes['especie'] = columna_usada
     
     dicc_especies = {}
     if columna_usada:
-        dicc_especies = cargar_diccionario(
-            ruta_diccionarios,
-            columnas=[columna_usada, 'especie'],
-            llave=columna_usada,
-            valor='especie'
-        )
-        data = reemplazar_valores(data, 'especie', dicc_especies)
-    diccionarios['dicc_especies'] = dicc_especies
-    
-    return data, diccionarios
+        dicc_especies = registro.dicc_especies(columna_usada)
+        df = reemplazar_valores(df, 'especie', dicc_especies)
+    contexto['diccionarios']['dicc_especies'] = dicc_especies
+    contexto['diccionarios']['variantes'] = variantes
+    return df
 
-# Ejecución principal
-def procesar_categorizacion(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict, pd.DataFrame, Dict, Dict]:
-    #RUTA_DATOS = '/Users/zahir/Documents/Bases de datos INS/Honorio Delgado  Arequipa 2023.xlsx'
-    RUTA_DICCIONARIOS = 'data/Lista_antimicrobianos.xlsx'
-    RUTA_MAPEO_ESPECIES = 'data/Lista_especie_especifico_general.xlsx'
-    RUTA_CLSI = 'data/Lista_CLSI_completa.xlsx'
+@registrar_etapa('corregir_celdas_convertidas_a_fecha')
+def _etapa_corregir_fechas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return corregir_celdas_convertidas_a_fecha(df, contexto['columnas_antibioticos'])
 
-    # Procesar dataset
-    data_procesado, diccionarios = procesar_dataset(df, RUTA_DICCIONARIOS)
-    
-    # Corregir fechas en columnas de antibióticos
-    columnas_antibioticos = [c for c in diccionarios['dicc_antibioticos'].values() if c in data_procesado.columns]
-    data_corregido = corregir_celdas_convertidas_a_fecha(data_procesado, columnas_antibioticos)
-    
-    # Filtrar columnas finales
-    columnas_a_conservar = ['fecha', 'SPEC_NUM', 'Tipo de localizacion', 'Tipo de muestra', 'Edad', 'especie'] + columnas_antibioticos
-    columnas_existentes = [col for col in columnas_a_conservar if col in data_corregido.columns]
-    data_filtrada = data_corregido[columnas_existentes]
-    
-    # Agregar columnas fijas
-    data_filtrada = agregar_columnas_fijas(data_filtrada, 'Hospital Honorio Delgado Arequipa', 'Arequipa')
-
-    # Eliminar columnas no deseadas
-    columnas_a_eliminar = [
-        'BLEE',
-        'Gentamicina de nivel alto (sinergia)',
-        'Estreptomicina de nivel alto (sinergia)',
-        'Resistencia inducible a clindamicina',
-        'Deteccion de cefoxitina'
-    ]
-    data_filtrada = eliminar_columnas_no_deseadas(data_filtrada, columnas_a_eliminar)
+@registrar_etapa('conservar_columnas')
+def _etapa_conservar_columnas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    columnas_a_conservar = ['fecha', 'SPEC_NUM', 'Tipo de localizacion', 'Tipo de muestra', 'Edad', 'especie'] + contexto['columnas_antibioticos']
+    return conservar_columnas(df, columnas_a_conservar)
 
-    # Limpiar valores no deseados en columnas de antibióticos
-    valores_a_reemplazar = ['TRM', 'R/N', 'NEG']
-    data_filtrada = limpiar_valores_antibioticos(data_filtrada, columnas_antibioticos, valores_a_reemplazar)
-    
-    # Agregar columnas mapeadas
-    data_filtrada = agregar_columnas_mapeadas(data_filtrada, RUTA_MAPEO_ESPECIES, 'especie')
+@registrar_etapa('agregar_columnas_fijas')
+def _etapa_agregar_columnas_fijas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return agregar_columnas_fijas(df, contexto['hospital'], contexto['region'])
+
+@registrar_etapa('eliminar_columnas_no_deseadas')
+def _etapa_eliminar_columnas_no_deseadas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return eliminar_columnas_no_deseadas(df, COLUMNAS_NO_DESEADAS)
 
-    # Limpiar valores MIC en columnas de antibióticos
-    data_filtrada = limpiar_valores_mic(data_filtrada, columnas_antibioticos)
+@registrar_etapa('limpiar_valores_antibioticos')
+def _etapa_limpiar_valores_antibioticos(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return limpiar_valores_antibioticos(df, contexto['columnas_antibioticos'], VALORES_NO_DESEADOS)
 
-    # Cargar puntos de corte CLSI
-    clsi_df, puntos_corte_clasico, puntos_corte_alterno = cargar_puntos_corte_clsi(RUTA_CLSI)
+@registrar_etapa('agregar_columnas_mapeadas')
+def _etapa_agregar_columnas_mapeadas(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return agregar_columnas_mapeadas(df, contexto['registro'], 'especie')
 
-    # Categorizar valores MIC
-    data_filtrada = categorizar_dataframe(data_filtrada, puntos_corte_clasico, puntos_corte_alterno)
+@registrar_etapa('limpiar_valores_mic', progreso='mic')
+def _etapa_limpiar_valores_mic(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    return limpiar_valores_mic(df, contexto['columnas_antibioticos'])
 
-    return data_filtrada, diccionarios, clsi_df, puntos_corte_clasico, puntos_corte_alterno
+@registrar_etapa('categorizar_dataframe', progreso='categorizar')
+def _etapa_categorizar_dataframe(df: pd.DataFrame, contexto: Dict) -> pd.DataFrame:
+    # Cargar puntos de corte CLSI y categorizar sobre el mismo DataFrame
+    clsi_df, puntos_corte_clasico, puntos_corte_alterno = contexto['registro'].puntos_corte
+    contexto.update(clsi_df=clsi_df, puntos_corte_clasico=puntos_corte_clasico,
+                    puntos_corte_alterno=puntos_corte_alterno)
+    return categorizar_dataframe(df, puntos_corte_clasico, puntos_corte_alterno,
+                                 n_procesos=PROCESOS_CATEGORIZACION, copiar=False,
+                                 pool=contexto.get('pool_categorizacion'))
 
+# Renombrado de columnas y reemplazo de códigos por nombres
+ETAPAS_DATASET = ['renombrar_columnas', 'reemplazar_muestras', 'reemplazar_localizacion',
+                  'renombrar_antibioticos', 'reemplazar_especies']
+# Categorización completa: la etapa 'renombrar' del progreso empieza con ETAPAS_DATASET
+ETAPAS_CATEGORIZACION = ETAPAS_DATASET + [
+    'corregir_celdas_convertidas_a_fecha', 'conservar_columnas', 'agregar_columnas_fijas',
+    'eliminar_columnas_no_deseadas', 'limpiar_valores_antibioticos', 'agregar_columnas_mapeadas',
+    'limpiar_valores_mic', 'categorizar_dataframe',
+]
+
+def procesar_dataset(df: pd.DataFrame, registro: RegistroReferencias,
+                     variantes: Optional[Dict[str, Optional[str]]] = None) -> Tuple[pd.DataFrame, Dict[str, Dict]]:
+    ejecutor = EjecutorPipeline(df, contexto_categorizacion(registro, variantes))
+    ejecutor.ejecutar_etapas(ETAPAS_DATASET)
+    return ejecutor.df, ejecutor.contexto['diccionarios']
+
+# Ejecución principal
+def procesar_categorizacion(df: pd.DataFrame, registro: Optional[RegistroReferencias] = None,
+                            variantes: Optional[Dict[str, Optional[str]]] = None,
+                            progreso: Optional[Callable[[str], None]] = None,
+                            hospital: str = HOSPITAL_POR_DEFECTO,
+                            region: str = REGION_POR_DEFECTO) -> Tuple[pd.DataFrame, Dict, pd.DataFrame, Dict, Dict]:
+    #RUTA_DATOS = '/Users/zahir/Documents/Bases de datos INS/Honorio Delgado  Arequipa 2023.xlsx'
+    # df no se modifica: las etapas trabajan sobre el DataFrame del ejecutor.
+    # progreso recibe la etapa que empieza: 'renombrar', 'mic' o 'categorizar'
+    ejecutor = EjecutorPipeline(df, contexto_categorizacion(registro, variantes, hospital, region))
+    ejecutor.ejecutar_etapas(ETAPAS_CATEGORIZACION, progreso)
+    contexto = ejecutor.contexto
+    return (ejecutor.df, contexto['diccionarios'], contexto['clsi_df'],
+            contexto['puntos_corte_clasico'], contexto['puntos_corte_alterno'])
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from typing import List
+from limpieza_final import COLUMNAS_FIJAS
+from pipeline import registrar_etapa
+
+# Tabla fija de códigos para los resultados de categorización (int8)
+CATEGORIAS = ['S', 'I', 'R', 'Inconcluyente']
+CODIGO_NA = -1
+CODIGOS = {categoria: codigo for codigo, categoria in enumerate(CATEGORIAS)}
+
+# Columnas de conteo en el orden en que las generaba pivot_table (orden alfabético)
+COLUMNAS_CONTEO = sorted(CATEGORIAS)
+
+def columnas_antibioticos(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> List[str]:
+    return [col for col in df.columns if col not in columnas_fijas]
+
+def esta_codificado(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> bool:
+    return all(df[col].dtype == np.int8 for col in columnas_antibioticos(df, columnas_fijas))
+
+def codificar_resultados(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> pd.DataFrame:
+    """Reemplaza las columnas de antibióticos por códigos int8 según CODIGOS.
+
+    Cualquier valor que no sea una categoría S/I/R/Inconcluyente (nulos o MIC sin
+    categorizar) queda como CODIGO_NA.
+    """
+    antibioticos = columnas_antibioticos(df, columnas_fijas)
+    codigos = {
+        col: df[col].astype(object).map(CODIGOS).fillna(CODIGO_NA).to_numpy(dtype=np.int8)
+        for col in antibioticos
+    }
+    return pd.concat([df[[col for col in df.columns if col not in antibioticos]],
+                      pd.DataFrame(codigos, index=df.index)], axis=1)[list(df.columns)]
+
+def eliminar_columnas_sin_resultados(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> pd.DataFrame:
+    vacias = [col for col in columnas_antibioticos(df, columnas_fijas) if (df[col] == CODIGO_NA).all()]
+    return df.drop(columns=vacias)
+
+def decodificar_resultados(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> pd.DataFrame:
+    """Inversa de codificar_resultados: columnas object con 'S'/'I'/'R'/'Inconcluyente' o pd.NA."""
+    tabla = np.array(CATEGORIAS + [pd.NA], dtype=object)  # CODIGO_NA (-1) toma el último elemento
+    df = df.copy()
+    for col in columnas_antibioticos(df, columnas_fijas):
+        df[col] = tabla[df[col].to_numpy(dtype=np.int8)]
+    return df
+
+def extraer_mic_sin_categoria(df: pd.DataFrame, columnas_fijas: List[str] = COLUMNAS_FIJAS) -> pd.DataFrame:
+    """MIC numéricos que quedaron sin categorizar (sin puntos de corte), en formato largo.
+
+    Devuelve una fila por celda con las columnas fila (etiqueta del índice), antibiotico y mic.
+    """
+    partes = []
+    for col in columnas_antibioticos(df, columnas_fijas):
+        valores = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        posiciones = np.flatnonzero(~np.isnan(valores))
+        if len(posiciones):
+            partes.append(pd.DataFrame({'fila': df.index[posiciones], 'antibiotico': col,
+                                        'mic': valores[posiciones]}))
+    if not partes:
+        return pd.DataFrame({'fila': pd.Series(dtype=df.index.dtype), 'antibiotico': pd.Series(dtype='category'),
+                             'mic': pd.Series(dtype=float)})
+    mic = pd.concat(partes, ignore_index=True)
+    mic['antibiotico'] = mic['antibiotico'].astype('category')
+    return mic
+
+# Etapas registradas: los MIC sin categorizar quedan en el contexto ('mic_sin_categoria') y el
+# DataFrame de trabajo pasa a tener los resultados codificados
+@registrar_etapa('extraer_mic_sin_categoria')
+def _etapa_extraer_mic_sin_categoria(df: pd.DataFrame, contexto: dict) -> pd.DataFrame:
+    contexto['mic_sin_categoria'] = extraer_mic_sin_categoria(df)
+    return df
+
+@registrar_etapa('codificar_resultados')
+def _etapa_codificar_resultados(df: pd.DataFrame, contexto: dict) -> pd.DataFrame:
+    return codificar_resultados(df)
+
+def contar_categorias(df: pd.DataFrame, claves: List[str], columnas_fijas: List[str] = COLUMNAS_FIJAS) -> pd.DataFrame:
+    """Conteo de S/I/R/Inconcluyente por claves y antibiótico directamente sobre los códigos.
+
+    Equivale a melt + pivot_table(aggfunc='size', dropna=False) sobre las columnas de texto:
+    solo aparecen las combinaciones con al menos un resultado, las claves nulas se conservan
+    como un grupo más y las filas quedan ordenadas por claves y antibiótico.
+    """
+    antibioticos = sorted(columnas_antibioticos(df, columnas_fijas))
+    agrupado = df.groupby(claves, sort=True, observed=True, dropna=False)
+    grupos = agrupado.ngroup().to_numpy(dtype=np.int64)
+    indice_grupos = agrupado.size().index
+    codigos = df[antibioticos].to_numpy(dtype=np.int8)
+
+    n_grupos, n_antibioticos, n_categorias = len(indice_grupos), len(antibioticos), len(CATEGORIAS)
+    validos = codigos != CODIGO_NA
+    posiciones = ((grupos[:, None] * n_antibioticos + np.arange(n_antibioticos)) * n_categorias + codigos)[validos]
+    conteos = np.bincount(posiciones, minlength=n_grupos * n_antibioticos * n_categorias)
+    conteos = conteos.reshape(n_grupos * n_antibioticos, n_categorias)
+
+    presentes = np.flatnonzero(conteos.sum(axis=1) > 0)
+    claves_df = indice_grupos.to_frame(index=False).iloc[presentes // n_antibioticos].reset_index(drop=True)
+    claves_df['antibiotico'] = np.array(antibioticos, dtype=object)[presentes % n_antibioticos]
+    for categoria in COLUMNAS_CONTEO:
+        claves_df[categoria] = conteos[presentes, CODIGOS[categoria]]
+    return claves_df
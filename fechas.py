@@ -0,0 +1,48 @@
+import pandas as pd
+
+# Meses en español, en orden; las etiquetas "Mes-AAAA" se generan solo para mostrar
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+         "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+_NUMERO_MES = {mes: numero for numero, mes in enumerate(MESES, 1)}
+
+# Frecuencias admitidas en las series de tendencia (alias de pandas para to_period)
+FRECUENCIAS = {'mes': 'M', 'trimestre': 'Q', 'anio': 'Y'}
+
+def inicio_de_mes(fechas: pd.Series) -> pd.Series:
+    """Fechas truncadas al primer día de su mes (datetime64), la clave de mes que se guarda.
+
+    Se trunca con la aritmética de datetime64 de NumPy: no depende del locale ni de formatear
+    cada fecha como texto. NaT se conserva.
+    """
+    meses = fechas.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+    return pd.Series(meses.astype('datetime64[ns]'), index=fechas.index, name=fechas.name)
+
+def desde_etiquetas(etiquetas: pd.Series) -> pd.Series:
+    """Convierte etiquetas "Mes-AAAA" (formato guardado antes de usar fechas) a inicio de mes.
+
+    Se interpreta cada etiqueta distinta una sola vez; las que no se reconocen quedan NaT.
+    """
+    def convertir(etiqueta):
+        mes, _, anio = str(etiqueta).partition('-')
+        if mes not in _NUMERO_MES or not anio.isdigit():
+            return pd.NaT
+        return pd.Timestamp(int(anio), _NUMERO_MES[mes], 1)
+    tabla = {etiqueta: convertir(etiqueta) for etiqueta in pd.unique(etiquetas.dropna())}
+    return pd.to_datetime(etiquetas.map(tabla).astype(object), errors='coerce')
+
+def normalizar_fechas(fechas: pd.Series) -> pd.Series:
+    """Columna fecha como inicio de mes (datetime64), venga ya como fecha o como etiqueta de texto."""
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas
+    return desde_etiquetas(fechas)
+
+def etiquetas_meses(fechas: pd.Series) -> pd.Series:
+    """Etiquetas "Mes-AAAA" en español para mostrar, como categórica en orden cronológico.
+
+    Las etiquetas se construyen una vez por mes distinto; cada fila solo guarda el código
+    de su mes (NaT queda como nulo).
+    """
+    codigos, unicas = pd.factorize(fechas, sort=True)
+    etiquetas = [f"{MESES[mes.month - 1]}-{mes.year}" for mes in pd.DatetimeIndex(unicas)]
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=etiquetas, ordered=True),
+                     index=fechas.index, name=fechas.name)
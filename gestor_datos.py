@@ -1,8 +1,25 @@
 import pandas as pd
+import numpy as np
 import pickle
+import glob
 import os
-from categorizacion import procesar_categorizacion
-from limpieza_final import procesar_limpieza_final
+import shutil
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from io import BytesIO
+from urllib.parse import quote, unquote
+from openpyxl import load_workbook
+from archivos import escritura_atomica
+from categorizacion import (contexto_categorizacion, obtener_registro, pool_categorizacion, ETAPAS_CATEGORIZACION,
+                            HOSPITAL_POR_DEFECTO, REGION_POR_DEFECTO)
+from limpieza_final import ETAPAS_LIMPIEZA_BLOQUE, ETAPAS_LIMPIEZA_FINAL, anio_predominante
+from pipeline import EjecutorPipeline
+from agregados import (clave_muestra, construir_agregados, sumar_agregados, combinar_agregados, sumar_por_periodo,
+                       TABLAS_CUBO)
+from fechas import FRECUENCIAS, normalizar_fechas
+from codificacion import (CODIGO_NA, codificar_resultados, columnas_antibioticos, decodificar_resultados,
+                          esta_codificado, eliminar_columnas_sin_resultados)
 
 # Directorio para almacenar datos procesados
 if os.getenv("RENDER"):  # Render define esta variable de entorno automáticamente
@@ -12,45 +29,522 @@ else:
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def procesar_archivo_subido(contenido, anio):
-    # Convertir contenido a DataFrame
-    df = pd.read_excel(pd.ExcelFile(pd.io.common.BytesIO(contenido)))
-    print(f"Procesando archivo para el año {anio}...")
-    
-    # Procesar con Categorizacion.py
-    data_categorizado, _, _, _, _ = procesar_categorizacion(df)
+# Los datos se guardan particionados por región y hospital, un juego de archivos por año:
+# DATA_DIR/particiones/{region}/{hospital}/datos_{anio}.parquet (y mic_, agregados_)
+SUBDIRECTORIO_PARTICIONES = "particiones"
+PARTICION_POR_DEFECTO = (REGION_POR_DEFECTO, HOSPITAL_POR_DEFECTO)
+# Prefijos de los archivos de datos de un año
+PREFIJOS_DATOS = ('datos_', 'mic_', 'agregados_')
+
+# Columnas guardadas como categóricas además de las de antibióticos ('fecha' se guarda como
+# fecha de inicio de mes)
+COLUMNAS_CATEGORICAS = ['Region', 'Hospital', 'Tipo de localizacion', 'Tipo de muestra',
+                        'especie', 'Grupo_general', 'Grupo_principal']
+
+# Etapas de una carga, en orden, con el nombre que se muestra al usuario. Las funciones de
+# carga aceptan progreso(etapa, detalle) y lo llaman al empezar cada etapa.
+ETAPAS_CARGA = [
+    ('leer', 'Lectura del archivo'),
+    ('renombrar', 'Renombrado de columnas y códigos'),
+    ('mic', 'Lectura de valores MIC'),
+    ('categorizar', 'Categorización CLSI'),
+    ('limpiar', 'Limpieza final'),
+    ('guardar', 'Guardado'),
+]
+
+def _sin_progreso(etapa, detalle=''):
+    pass
+
+# Etapas registradas (ver pipeline.registrar_etapa) con que se procesa una carga: categorización,
+# MIC sin categorizar, limpieza final y codificación S/I/R sobre un único DataFrame de trabajo.
+# En la carga por bloques cada bloque se procesa igual, salvo el filtro del año, que se hace al guardar.
+ETAPAS_PROCESAMIENTO = (ETAPAS_CATEGORIZACION + ['extraer_mic_sin_categoria']
+                        + ETAPAS_LIMPIEZA_FINAL + ['codificar_resultados'])
+ETAPAS_PROCESAMIENTO_BLOQUE = (ETAPAS_CATEGORIZACION + ['extraer_mic_sin_categoria']
+                               + ETAPAS_LIMPIEZA_BLOQUE + ['codificar_resultados'])
 
-    # Procesar con LimpiezaFinal.py
-    data_limpia = procesar_limpieza_final(data_categorizado)
+# Filas por bloque en la carga por bloques
+TAMANO_BLOQUE = 20000
+# Archivos más grandes que esto (en bytes) se procesan por bloques
+UMBRAL_CARGA_POR_BLOQUES = 20 * 1024 * 1024
+
+# Procesa un archivo subido y reemplaza los datos del año en la partición (región, hospital);
+# devuelve el número de filas guardadas
+def procesar_archivo_subido(contenido, anio, por_bloques=None, progreso=_sin_progreso,
+                            region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    if _carga_por_bloques(contenido, por_bloques):
+        return _guardar_por_bloques(contenido, anio, TAMANO_BLOQUE, progreso, particion)
+    data_codificada, mic_sin_categoria = _procesar_contenido(contenido, anio, progreso=progreso, particion=particion)
     
     # Guardar DataFrame procesado
-    guardar_datos(data_limpia, anio)
+    progreso('guardar')
+    guardar_datos(data_codificada, anio, mic_sin_categoria, region, hospital)
     
-    print(f"Datos guardados para el año {anio}")
-    return data_limpia
+    print(f"Datos guardados para el año {anio} ({hospital}, {region})")
+    return len(data_codificada)
+
+def _carga_por_bloques(contenido, por_bloques=None):
+    return por_bloques if por_bloques is not None else len(contenido) > UMBRAL_CARGA_POR_BLOQUES
+
+def _procesar_contenido(contenido, anio, anio_filtro=None, progreso=_sin_progreso, particion=PARTICION_POR_DEFECTO):
+    # Categoriza, limpia y codifica un archivo subido en una sola pasada; devuelve
+    # (datos, mic_sin_categoria). Con anio_filtro se conservan las filas de ese año en lugar
+    # de las del año predominante.
+
+    # Convertir contenido a DataFrame
+    progreso('leer')
+    df = pd.read_excel(pd.ExcelFile(BytesIO(contenido)))
+    print(f"Procesando archivo para el año {anio}...")
+    
+    # Categorización, limpieza final y codificación sobre un único DataFrame de trabajo
+    region, hospital = particion
+    ejecutor = EjecutorPipeline(df, dict(contexto_categorizacion(hospital=hospital, region=region), anio=anio_filtro),
+                                etiquetas={'anio': anio, 'region': region, 'hospital': hospital})
+    del df
+    data_codificada = ejecutor.ejecutar_etapas(ETAPAS_PROCESAMIENTO, progreso)
+    mic_sin_categoria = ejecutor.contexto['mic_sin_categoria']
+    mic_sin_categoria = mic_sin_categoria[mic_sin_categoria['fila'].isin(data_codificada.index)]
+    return data_codificada, mic_sin_categoria
+
+# Lee la primera hoja en bloques de filas (openpyxl de solo lectura, sin el libro completo en
+# memoria); el índice de cada bloque continúa el del anterior, como con pd.read_excel
+def leer_excel_por_bloques(contenido, tamano_bloque=TAMANO_BLOQUE):
+    libro = load_workbook(BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = [c if c is not None else f"Unnamed: {k}" for k, c in enumerate(encabezado)]
+        bloque, inicio = [], 0
+        for fila in filas:
+            if all(v is None for v in fila):
+                continue
+            bloque.append(fila)
+            if len(bloque) == tamano_bloque:
+                yield pd.DataFrame(bloque, columns=columnas, index=range(inicio, inicio + len(bloque)))
+                inicio += len(bloque)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=columnas, index=range(inicio, inicio + len(bloque)))
+    finally:
+        libro.close()
+
+# Carga grande bloque a bloque: en memoria solo hay un bloque a la vez y el año predominante
+# se resuelve al final sobre el archivo completo. Devuelve el número de filas guardadas
+def procesar_archivo_por_bloques(contenido, anio, tamano_bloque=TAMANO_BLOQUE, progreso=_sin_progreso,
+                                 region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    return _guardar_por_bloques(contenido, anio, tamano_bloque, progreso, _particion(region, hospital))
+
+def _guardar_por_bloques(contenido, anio, tamano_bloque=TAMANO_BLOQUE, progreso=_sin_progreso,
+                         particion=PARTICION_POR_DEFECTO, anio_filtro=None, existentes=None):
+    # Cada bloque procesado se escribe enseguida como una parte por año (el año predominante
+    # solo se conoce al final) en un directorio temporal de la partición, y el cubo de cada
+    # año se acumula bloque a bloque. Al terminar se publican las partes y el cubo del año
+    # elegido (anio_filtro o el predominante). Con existentes (SPEC_NUM y especie de los datos
+    # guardados, modo append) se descartan los aislados ya guardados y las partes se agregan
+    # a las del año; si no, reemplazan el año.
+    print(f"Procesando archivo por bloques para el año {anio}...")
+    progreso('leer')
+    registro = obtener_registro()
+    region, hospital = particion
+    if existentes is not None:
+        claves_existentes = _claves_aislado(existentes)
+        # El índice continúa el de los datos guardados (las filas de mic_sin_categoria lo referencian)
+        desplazamiento = int(existentes.index.max()) + 1
+    directorio = _directorio_particion(particion)
+    os.makedirs(directorio, exist_ok=True)
+    temporal = tempfile.mkdtemp(prefix='.carga_', dir=directorio)
+    try:
+        # Por año: partes escritas (datos, mic, filas), cubo acumulado y SPEC_NUM ya contados
+        partes, cubos, muestras = {}, {}, {}
+        if existentes is not None:
+            muestras[anio_filtro] = set(clave_muestra(existentes['SPEC_NUM']))
+        variantes = None
+        conteo_anios = pd.Series(dtype='int64')
+        leidos = 0
+        # Un único pool de categorización para todos los bloques del archivo
+        with pool_categorizacion(registro) as pool:
+            for n, bloque in enumerate(leer_excel_por_bloques(contenido, tamano_bloque), 1):
+                # Las variantes de códigos detectadas en el primer bloque se reutilizan en los siguientes
+                ejecutor = EjecutorPipeline(bloque, contexto_categorizacion(registro, variantes, hospital, region, pool),
+                                            etiquetas={'anio': anio, 'region': region, 'hospital': hospital, 'bloque': n})
+                data_bloque = ejecutor.ejecutar_etapas(ETAPAS_PROCESAMIENTO_BLOQUE,
+                                                       progreso=lambda etapa: progreso(etapa, f"bloque {n}"))
+                variantes = ejecutor.contexto['variantes']
+                conteo_anios = conteo_anios.add(ejecutor.contexto['conteo_anios'], fill_value=0)
+                mic_bloque = ejecutor.contexto['mic_sin_categoria']
+                print(f"Bloque {n}: {len(bloque)} filas leídas, {len(data_bloque)} procesadas")
+                leidos += len(bloque)
+                del bloque, ejecutor
+
+                progreso('guardar', f"bloque {n}")
+                anios_bloque = data_bloque['fecha'].dt.year.to_numpy()
+                anios_guardar = ([anio_filtro] if anio_filtro is not None
+                                 else pd.unique(anios_bloque[~np.isnan(anios_bloque)]).astype(int))
+                for anio_datos in anios_guardar:
+                    parte = data_bloque.take(np.flatnonzero(anios_bloque == anio_datos))
+                    mic_parte = mic_bloque
+                    if existentes is not None:
+                        parte = parte[~_claves_aislado(parte).isin(claves_existentes)]
+                        parte.index = parte.index + desplazamiento
+                        mic_parte = mic_parte.assign(fila=mic_parte['fila'] + desplazamiento)
+                    parte = eliminar_columnas_sin_resultados(parte)
+                    if parte.empty:
+                        continue
+                    parte = _preparar_para_parquet(parte)
+                    mic_parte = mic_parte[mic_parte['fila'].isin(parte.index)]
+                    archivos = (os.path.join(temporal, f'datos_{anio_datos}_bloque{n:06d}.parquet'),
+                                os.path.join(temporal, f'mic_{anio_datos}_bloque{n:06d}.parquet'))
+                    _escribir_parquet(parte, archivos[0])
+                    _escribir_parquet(mic_parte, archivos[1])
+                    partes.setdefault(anio_datos, []).append(archivos + (len(parte),))
+                    # El cubo de la parte excluye las muestras ya contadas en bloques anteriores
+                    vistas = muestras.setdefault(anio_datos, set())
+                    nuevos = construir_agregados(parte, muestras_excluidas=vistas)
+                    cubos[anio_datos] = sumar_agregados(cubos[anio_datos], nuevos) if anio_datos in cubos else nuevos
+                    vistas.update(clave_muestra(parte['SPEC_NUM']))
+                del data_bloque, mic_bloque
+                # Memoria que pyarrow retiene tras escribir las partes: se devuelve antes del siguiente bloque
+                pa.default_memory_pool().release_unused()
+
+        if not leidos:
+            raise ValueError("El archivo no contiene filas de datos")
+        progreso('guardar')
+        anio_datos = anio_predominante(conteo_anios, anio_filtro)
+        filas = sum(parte[2] for parte in partes.get(anio_datos, []))
+        print(f"Filas conservadas: {filas} de {leidos}")
+        if existentes is not None:
+            if filas:
+                _publicar_partes(partes[anio_datos], cubos[anio_datos], anio, particion, agregar=True)
+                print(f"Datos agregados al año {anio} ({hospital}, {region})")
+            return filas
+        if not filas:
+            raise ValueError(f"El archivo no contiene filas del año {anio_datos}")
+        _publicar_partes(partes[anio_datos], cubos[anio_datos], anio, particion)
+        print(f"Datos guardados para el año {anio} ({hospital}, {region})")
+        return filas
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+        try:
+            os.rmdir(directorio)  # Solo si la partición quedó vacía (p. ej. una carga fallida)
+        except OSError:
+            pass
+
+def _publicar_partes(partes, agregados, anio, particion, agregar=False):
+    # Mueve a la partición las partes escritas por _guardar_por_bloques y guarda el cubo.
+    # Al reemplazar el año, la primera parte pasa a ser el archivo principal; al agregar, las
+    # partes siguen a las ya guardadas y el cubo se suma al existente.
+    region, hospital = particion
+    if agregar:
+        # El cubo se lee antes de mover las partes: si faltara, se construiría ya con ellas
+        agregados = sumar_agregados(cargar_agregados(anio, region, hospital), agregados)
+        primera = len(_archivos_datos(anio, particion=particion))
+    else:
+        _eliminar_partes(anio, particion)
+        primera = 0
+    for numero, (datos, mic, _) in enumerate(partes, primera):
+        for prefijo, archivo in (('datos', datos), ('mic', mic)):
+            destino = (_ruta_datos(anio, prefijo=prefijo, particion=particion) if numero == 0
+                       else _ruta_parte(anio, numero, prefijo, particion))
+            os.replace(archivo, destino)
+            print(f"Archivo guardado: {destino}")
+    guardar_agregados(agregados, anio, region, hospital)
+
+def _claves_aislado(df):
+    # Un aislado se identifica por SPEC_NUM y especie (como texto canónico: los tipos pueden variar entre cargas)
+    return pd.MultiIndex.from_arrays([clave_muestra(df['SPEC_NUM']), df['especie'].astype(str)])
+
+# Modo append: agrega las filas nuevas del año (sin los aislados ya guardados) como una parte más
+# y suma solo sus conteos al cubo, sin reescribir el año. Devuelve el número de filas agregadas
+def agregar_archivo_subido(contenido, anio, por_bloques=None, progreso=_sin_progreso,
+                           region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    existentes = cargar_datos(anio, columnas=['SPEC_NUM', 'especie'], codificado=True, region=region, hospital=hospital)
+    if _carga_por_bloques(contenido, por_bloques):
+        return _guardar_por_bloques(contenido, anio, TAMANO_BLOQUE, progreso, particion, anio_filtro=anio,
+                                    existentes=existentes)
+    data_codificada, mic_sin_categoria = _procesar_contenido(contenido, anio, anio_filtro=anio,
+                                                             progreso=progreso, particion=particion)
+    progreso('guardar')
+    if existentes is None:
+        guardar_datos(data_codificada, anio, mic_sin_categoria, region, hospital)
+        print(f"Datos guardados para el año {anio} ({hospital}, {region})")
+        return len(data_codificada)
+
+    nuevas = ~_claves_aislado(data_codificada).isin(_claves_aislado(existentes))
+    print(f"Filas nuevas: {nuevas.sum()} de {len(nuevas)} ({(~nuevas).sum()} aislados ya guardados)")
+    data_codificada = eliminar_columnas_sin_resultados(data_codificada[nuevas])
+    if data_codificada.empty:
+        return 0
+    # El índice continúa el de los datos guardados (las filas de mic_sin_categoria lo referencian)
+    desplazamiento = int(existentes.index.max()) + 1
+    data_codificada.index = data_codificada.index + desplazamiento
+    mic_sin_categoria = mic_sin_categoria.assign(fila=mic_sin_categoria['fila'] + desplazamiento)
+    mic_sin_categoria = mic_sin_categoria[mic_sin_categoria['fila'].isin(data_codificada.index)]
+
+    # El cubo se lee antes de escribir la parte: si faltara, se construiría ya con ella
+    agregados = cargar_agregados(anio, region, hospital)
+    data_codificada = _preparar_para_parquet(data_codificada)
+    numero = len(_archivos_datos(anio, particion=particion))
+    _escribir_parquet(data_codificada, _ruta_parte(anio, numero, particion=particion))
+    _escribir_parquet(mic_sin_categoria, _ruta_parte(anio, numero, prefijo='mic', particion=particion))
+    nuevos = construir_agregados(data_codificada, muestras_excluidas=set(clave_muestra(existentes['SPEC_NUM'])))
+    guardar_agregados(sumar_agregados(agregados, nuevos), anio, region, hospital)
+    print(f"Datos agregados al año {anio} ({hospital}, {region})")
+    return len(data_codificada)
+
+def _particion(region, hospital):
+    # (región, hospital) validados: se usan como nombres de directorio
+    for nombre in (region, hospital):
+        if not isinstance(nombre, str) or not nombre.strip().strip('.'):
+            raise ValueError(f"Nombre de región u hospital no válido: {nombre!r}")
+    return (region.strip(), hospital.strip())
 
-def guardar_datos(df, anio):
-    archivo = os.path.join(DATA_DIR, f'datos_{anio}.pkl')
-    with open(archivo, 'wb') as f:
-        pickle.dump(df, f)
+def _directorio_particiones():
+    return os.path.join(DATA_DIR, SUBDIRECTORIO_PARTICIONES)
+
+def _directorio_particion(particion):
+    region, hospital = particion
+    return os.path.join(_directorio_particiones(), quote(region, safe=' '), quote(hospital, safe=' '))
+
+def _ruta_datos(anio, extension='parquet', prefijo='datos', particion=PARTICION_POR_DEFECTO):
+    return os.path.join(_directorio_particion(particion), f'{prefijo}_{anio}.{extension}')
+
+def _ruta_parte(anio, numero, prefijo='datos', particion=PARTICION_POR_DEFECTO):
+    return os.path.join(_directorio_particion(particion), f'{prefijo}_{anio}_parte{numero:04d}.parquet')
+
+def _partes(anio, prefijo='datos', particion=PARTICION_POR_DEFECTO):
+    # Partes agregadas en modo append o escritas por una carga por bloques, en orden
+    return sorted(glob.glob(os.path.join(glob.escape(_directorio_particion(particion)),
+                                         f'{prefijo}_{anio}_parte*.parquet')))
+
+def _archivos_datos(anio, prefijo='datos', particion=PARTICION_POR_DEFECTO):
+    # Archivo principal del año seguido de sus partes
+    principal = _ruta_datos(anio, prefijo=prefijo, particion=particion)
+    return ([principal] if os.path.exists(principal) else []) + _partes(anio, prefijo, particion)
+
+def _eliminar_partes(anio, particion=PARTICION_POR_DEFECTO):
+    for prefijo in ('datos', 'mic'):
+        for archivo in _partes(anio, prefijo, particion):
+            os.remove(archivo)
+
+def _tiene_datos(anio, particion):
+    return bool(_archivos_datos(anio, particion=particion)) or os.path.exists(_ruta_datos(anio, 'pkl', particion=particion))
+
+# Particiones (región, hospital) guardadas, ordenadas; anio deja las que tienen datos de ese año
+# y region y hospital filtran por nombre (None: todas)
+def listar_particiones(anio=None, region=None, hospital=None):
+    raiz = _directorio_particiones()
+    if not os.path.isdir(raiz):
+        return []
+    particiones = []
+    for dir_region in sorted(os.listdir(raiz)):
+        if region is not None and unquote(dir_region) != region:
+            continue
+        for dir_hospital in sorted(os.listdir(os.path.join(raiz, dir_region))):
+            particion = (unquote(dir_region), unquote(dir_hospital))
+            if hospital is not None and particion[1] != hospital:
+                continue
+            if anio is None or _tiene_datos(anio, particion):
+                particiones.append(particion)
+    return particiones
+
+# Mueve a la partición por defecto los archivos guardados directamente en DATA_DIR (antes de
+# particionar por región y hospital)
+def migrar_datos_sin_particion():
+    archivos = [f for f in os.listdir(DATA_DIR)
+                if f.startswith(PREFIJOS_DATOS) and os.path.isfile(os.path.join(DATA_DIR, f))]
+    if not archivos:
+        return
+    destino = _directorio_particion(PARTICION_POR_DEFECTO)
+    os.makedirs(destino, exist_ok=True)
+    for archivo in archivos:
+        try:
+            os.replace(os.path.join(DATA_DIR, archivo), os.path.join(destino, archivo))
+        except FileNotFoundError:
+            pass  # Otro worker ya lo movió
+    print(f"Migrados {len(archivos)} archivos a la partición {PARTICION_POR_DEFECTO}")
+
+def _leer_parquet(archivos, columnas=None, filtros=None):
+    partes = []
+    for archivo in archivos:
+        # Una parte puede no tener todas las columnas de antibióticos
+        columnas_archivo = columnas if columnas is None else [c for c in columnas if c in pq.read_schema(archivo).names]
+        parte = pd.read_parquet(archivo, engine='pyarrow', columns=columnas_archivo, filters=filtros)
+        if 'fecha' in parte.columns:
+            # Archivos guardados con la fecha como etiqueta "Mes-AAAA"
+            parte['fecha'] = normalizar_fechas(parte['fecha'])
+        partes.append(parte)
+    if len(partes) == 1:
+        return partes[0]
+    df = pd.concat(partes)
+    for col in df.columns:
+        if col in COLUMNAS_CATEGORICAS:
+            # Las partes tienen categorías distintas y concat las deja como object
+            df[col] = df[col].astype('category')
+        elif col in columnas_antibioticos(df) and df[col].dtype != np.int8:
+            # Antibióticos ausentes en alguna parte: sin resultado
+            df[col] = df[col].fillna(CODIGO_NA).astype(np.int8)
+    return df
+
+def _preparar_para_parquet(df):
+    # Columnas de baja cardinalidad como categóricas (dictionary encoding); los resultados
+    # S/I/R ya vienen como códigos int8
+    df = df.copy()
+    for col in df.columns:
+        tipo = pd.api.types.infer_dtype(df[col], skipna=True)
+        if tipo.startswith('mixed'):
+            # Parquet no admite tipos mezclados en una columna (p. ej. SPEC_NUM o Edad): se guardan como
+            # texto, que agregados.convertir_edad interpreta igual que los números
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+        if col in COLUMNAS_CATEGORICAS:
+            df[col] = df[col].astype('category')
+    return df
+
+def _escribir_parquet(df, archivo):
+    # Escritura atómica: los lectores nunca ven un archivo a medias
+    with escritura_atomica(archivo) as temporal:
+        df.to_parquet(temporal, engine='pyarrow')
     print(f"Archivo guardado: {archivo}")
 
-def cargar_datos(anio):
-    archivo = os.path.join(DATA_DIR, f'datos_{anio}.pkl')
-    if os.path.exists(archivo):
-        with open(archivo, 'rb') as f:
-            df = pickle.load(f)
-        print(f"Datos cargados para el año {anio}")
+# Guarda los datos de un año de la partición con los resultados S/I/R en int8, los MIC sin
+# categoría (fila, antibiotico, mic) en mic_{anio}.parquet y el cubo de agregados del año
+def guardar_datos(df, anio, mic_sin_categoria=None, region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    if not esta_codificado(df):
+        df = codificar_resultados(df)
+    df = _preparar_para_parquet(df)
+    # Reemplaza el año completo, incluidas las partes agregadas en modo append
+    _eliminar_partes(anio, particion)
+    _escribir_parquet(df, _ruta_datos(anio, particion=particion))
+    if mic_sin_categoria is not None:
+        _escribir_parquet(mic_sin_categoria, _ruta_datos(anio, prefijo='mic', particion=particion))
+    # El cubo se construye sobre los datos tal como se guardan, igual que si se leyeran del archivo
+    guardar_agregados(construir_agregados(df), anio, region, hospital)
+
+# Guarda el cubo de agregados de un año (ver agregados.construir_agregados)
+def guardar_agregados(agregados, anio, region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    for nombre, tabla in agregados.items():
+        _escribir_parquet(tabla, _ruta_datos(anio, prefijo=f'agregados_{nombre}', particion=particion))
+
+# Convierte datos_{anio}.pkl a Parquet y renombra el pickle a .pkl.migrado
+def migrar_pickle(anio, region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    archivo_pkl = _ruta_datos(anio, 'pkl', particion=_particion(region, hospital))
+    with open(archivo_pkl, 'rb') as f:
+        df = pickle.load(f)
+    guardar_datos(df, anio, region=region, hospital=hospital)
+    os.replace(archivo_pkl, f"{archivo_pkl}.migrado")
+    print(f"Migrado a Parquet: {archivo_pkl}")
+
+def migrar_pickles():
+    for region, hospital in listar_particiones():
+        for archivo in sorted(os.listdir(_directorio_particion((region, hospital)))):
+            if archivo.startswith('datos_') and archivo.endswith('.pkl'):
+                migrar_pickle(int(archivo.split('_')[1].split('.')[0]), region, hospital)
+
+# Datos de un año de la partición; columnas y filtros (formato de pyarrow) se aplican al leer.
+# Los resultados S/I/R quedan en int8 con codificado=True y las categóricas como object sin categoricas
+def cargar_datos(anio, columnas=None, filtros=None, categoricas=False, codificado=False,
+                 region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    if (not os.path.exists(_ruta_datos(anio, particion=particion))
+            and os.path.exists(_ruta_datos(anio, 'pkl', particion=particion))):
+        migrar_pickle(anio, region, hospital)
+    archivos = _archivos_datos(anio, particion=particion)
+    if archivos:
+        df = _leer_parquet(archivos, columnas, filtros)
+        if not categoricas:
+            for col in df.columns[df.dtypes == 'category']:
+                df[col] = df[col].astype(object)
+        if not esta_codificado(df):
+            # Archivos guardados antes de la codificación int8
+            df = codificar_resultados(df)
+        if not codificado:
+            df = decodificar_resultados(df)
+        print(f"Datos cargados para el año {anio} ({hospital}, {region})")
         return df
-    print(f"No se encontraron datos para el año {anio}")
+    print(f"No se encontraron datos para el año {anio} ({hospital}, {region})")
     return None
 
-def obtener_anios_disponibles():
-    if not os.path.exists(DATA_DIR):
-        return []
-    
-    archivos = [f for f in os.listdir(DATA_DIR) if f.startswith('datos_') and f.endswith('.pkl')]
-    anios = [int(f.split('_')[1].split('.')[0]) for f in archivos]
-    print(f"Años disponibles: {sorted(anios)}")
-    return sorted(anios)
+def _archivos_anio(anio, particion):
+    # Todos los archivos de un año: datos y MIC (con sus partes) y las tablas del cubo
+    cubo = [_ruta_datos(anio, prefijo=f'agregados_{nombre}', particion=particion) for nombre in TABLAS_CUBO]
+    return (_archivos_datos(anio, particion=particion) + _archivos_datos(anio, 'mic', particion)
+            + [archivo for archivo in cubo if os.path.exists(archivo)])
+
+# Versión de los datos de un año en las particiones elegidas (None: todas): mtime más reciente en ns
+# y tamaño total, incluido el cubo que se escribe al final; None si no hay datos
+def version_datos(anio, region=None, hospital=None):
+    estados = []
+    for particion in listar_particiones(anio, region, hospital):
+        for archivo in _archivos_anio(anio, particion):
+            try:
+                estados.append(os.stat(archivo))
+            except FileNotFoundError:
+                pass  # Reemplazado mientras se guardaba el año
+    if not estados:
+        return None
+    return (max(e.st_mtime_ns for e in estados), sum(e.st_size for e in estados))
+
+def cargar_mic_sin_categoria(anio, region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    archivos = _archivos_datos(anio, prefijo='mic', particion=_particion(region, hospital))
+    if archivos:
+        return pd.concat([pd.read_parquet(archivo, engine='pyarrow') for archivo in archivos], ignore_index=True)
+    return None
+
+# Cubo de agregados de un año de la partición; si el año tiene datos pero no cubo (datos
+# anteriores a los cubos), se construye y se guarda
+def cargar_agregados(anio, region=REGION_POR_DEFECTO, hospital=HOSPITAL_POR_DEFECTO):
+    particion = _particion(region, hospital)
+    archivos = {nombre: _ruta_datos(anio, prefijo=f'agregados_{nombre}', particion=particion)
+                for nombre in ('conteos', 'aislados', 'muestras')}
+    if all(os.path.exists(archivo) for archivo in archivos.values()):
+        agregados = {nombre: pd.read_parquet(archivo, engine='pyarrow') for nombre, archivo in archivos.items()}
+        agregados['conteos']['fecha'] = normalizar_fechas(agregados['conteos']['fecha'])
+        return agregados
+    df = cargar_datos(anio, codificado=True, region=region, hospital=hospital)
+    if df is None:
+        return None
+    agregados = construir_agregados(df)
+    guardar_agregados(agregados, anio, region, hospital)
+    return agregados
+
+# Cubo de un año sumando los cubos de las particiones de una región y/o hospital (None: todas),
+# sin leer sus datos completos; None si ninguna partición tiene el año
+def consultar_agregados(anio, region=None, hospital=None):
+    cubos = (cargar_agregados(anio, *particion) for particion in listar_particiones(anio, region, hospital))
+    return combinar_agregados(cubo for cubo in cubos if cubo is not None)
+
+# Conteos S/I/R por periodo ('mes', 'trimestre' o 'anio'), especie y antibiótico de varios años: de cada
+# cubo se leen solo las especies y antibióticos pedidos y se reducen por periodo. None si no hay datos
+def consultar_tendencia(anios=None, frecuencia='mes', region=None, hospital=None, especies=None, antibioticos=None):
+    filtros = [(columna, 'in', list(valores)) for columna, valores in
+               (('especie', especies), ('antibiotico', antibioticos)) if valores is not None] or None
+    claves, columnas_conteo = ['especie', 'antibiotico'], TABLAS_CUBO['conteos'][1]
+    partes = []
+    for anio in (anios if anios is not None else obtener_anios_disponibles(region, hospital)):
+        for particion in listar_particiones(anio, region, hospital):
+            archivo = _ruta_datos(anio, prefijo='agregados_conteos', particion=particion)
+            if not os.path.exists(archivo) and cargar_agregados(anio, *particion) is None:
+                continue
+            conteos = pd.read_parquet(archivo, engine='pyarrow', filters=filtros)
+            conteos['fecha'] = normalizar_fechas(conteos['fecha'])
+            partes.append(sumar_por_periodo(conteos, FRECUENCIAS[frecuencia], claves))
+    if not partes:
+        return None
+    return (pd.concat(partes, ignore_index=True)
+            .groupby(['periodo'] + claves, sort=True)[columnas_conteo].sum().reset_index())
 
+# Años con datos en alguna partición de la región y/o hospital (None: todas)
+def obtener_anios_disponibles(region=None, hospital=None):
+    anios = set()
+    for particion in listar_particiones(region=region, hospital=hospital):
+        for f in os.listdir(_directorio_particion(particion)):
+            if f.startswith('datos_') and f.endswith(('.parquet', '.pkl')):
+                anios.add(int(f.split('_')[1].split('.')[0]))
+    anios = sorted(anios)
+    print(f"Años disponibles: {anios}")
+    return anios
@@ -0,0 +1,761 @@
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from dash import dash_table
+from agregados import RANGOS_EDAD
+from fechas import MESES, etiquetas_meses
+
+# Colores fijos para especies
+colores_especies = {
+    "Acinetobacter baumannii": "blue",
+    "Klebsiella pneumoniae": "orange",
+    "Escherichia coli": "red",
+    "Pseudomonas aeruginosa": "green",
+    "Staphylococcus aureus": "black"
+}
+
+# Especies de interés
+especies_fijas = [
+    "Acinetobacter baumannii", 
+    "Klebsiella pneumoniae", 
+    "Escherichia coli", 
+    "Pseudomonas aeruginosa", 
+    "Staphylococcus aureus"
+]
+
+# Ordenar meses manualmente
+def meses_del_anio(anio):
+    return [f"{mes}-{anio}" for mes in MESES]
+
+# ------- TRANSFORMACIONES DE DATOS -------
+# Sección 1: Transformación de datos para gráfico de lineas
+def calcular_conteos_porcentajes(conteos):
+    # Conteos S/I/R ya materializados en el cubo al cargar el archivo
+    count_table = conteos.copy()
+    count_table.index.names = ['Index']
+    
+    for col in ['I', 'R', 'S', 'Inconcluyente']:
+        if col not in count_table.columns:
+            count_table[col] = 0
+    
+    count_table['total'] = count_table['I'] + count_table['R'] + count_table['S'] + count_table['Inconcluyente']
+    count_table['I (%)'] = (count_table['I'] / count_table['total'] * 100).round(2)
+    count_table['R (%)'] = (count_table['R'] / count_table['total'] * 100).round(2)
+    count_table['S (%)'] = (count_table['S'] / count_table['total'] * 100).round(2)
+    count_table['Inconcluyente (%)'] = (count_table['Inconcluyente'] / count_table['total'] * 100).round(2)
+    
+    return count_table
+
+# Sección 2: Transformación de datos para gráfico de barras ailados por especie
+def transformar_datos_para_aislados_barras(aislados):
+    # Sumar aislados por especie a partir del cubo
+    conteo_especies = (
+        aislados.groupby(["especie", "Grupo_principal"])["n"]
+        .sum()
+        .reset_index(name="aislados")
+    )
+
+    # Ordenar especies de mayor a menor
+    conteo_especies = conteo_especies.sort_values("aislados", ascending=False)
+
+    orden_especies = (
+        conteo_especies["especie"]
+        .astype(str).str.strip()
+        .drop_duplicates()
+        .tolist()
+    )
+    return conteo_especies, orden_especies
+
+# Sección 3: Transformación de datos para el gráfico heatmap porcentaje de resistencia por especie y antibiótico
+def transformar_datos_para_heatmap(data_filtrada, conteo_especies):
+    # Dividir los datos en Gram positivas y Gram negativas
+    gram_positiva = data_filtrada[data_filtrada["Grupo_principal"] == "Gram positiva"]
+    gram_negativa = data_filtrada[data_filtrada["Grupo_principal"] == "Gram negativa"]
+
+    # Función auxiliar para procesar cada grupo
+    # Agrupar por especie y antibiótico, sumar counts, y calcular todos los porcentajes globales
+    def procesar_grupo(df_grupo, orden_especies):
+        df_heatmap_grouped = (
+            df_grupo.groupby(["especie", "antibiotico"])
+            .agg({"R": "sum", "S": "sum", "I": "sum", "Inconcluyente": "sum", "total": "sum"})
+            .reset_index()
+        )
+
+        # Calcular porcentajes, redondeando a 1 decimal
+        df_heatmap_grouped["R (%)"] = (df_heatmap_grouped["R"] / df_heatmap_grouped["total"] * 100).round(1)
+        df_heatmap_grouped["S (%)"] = (df_heatmap_grouped["S"] / df_heatmap_grouped["total"] * 100).round(1)
+        df_heatmap_grouped["I (%)"] = (df_heatmap_grouped["I"] / df_heatmap_grouped["total"] * 100).round(1)
+        df_heatmap_grouped["Inconcluyente (%)"] = (df_heatmap_grouped["Inconcluyente"] / df_heatmap_grouped["total"] * 100).round(1)
+
+        # Pivotar para porcentajes
+        pivot_R = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="R (%)",
+            aggfunc="first"
+        ).fillna("")  # Blanks para NaN
+
+        pivot_S = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="S (%)",
+            aggfunc="first"
+        ).fillna(0)
+
+        pivot_I = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="I (%)",
+            aggfunc="first"
+        ).fillna(0)
+
+        pivot_Inconcluyente = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="Inconcluyente (%)",
+            aggfunc="first"
+        ).fillna(0)
+
+        # Ordenar las filas del heatmap usando el mismo orden de especies del gráfico de barras
+        pivot_R = pivot_R.reindex(index=orden_especies)[sorted(pivot_R.columns)]
+
+        # Asegurar que los otros pivots estén alineados
+        pivot_S = pivot_S.reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+        pivot_I = pivot_I.reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+        pivot_Inconcluyente = pivot_Inconcluyente.reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+
+        # Pivotar los conteos originales
+        pivot_R_count = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="R",
+            aggfunc="first"
+        ).reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+
+        pivot_S_count = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="S",
+            aggfunc="first"
+        ).reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+
+        pivot_I_count = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="I",
+            aggfunc="first"
+        ).reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+
+        pivot_Inconcluyente_count = df_heatmap_grouped.pivot_table(
+            index="especie",
+            columns="antibiotico",
+            values="Inconcluyente",
+            aggfunc="first"
+        ).reindex(index=pivot_R.index, columns=pivot_R.columns).fillna(0)
+
+        return (pivot_R, pivot_S, pivot_I, pivot_Inconcluyente,
+                pivot_R_count, pivot_S_count, pivot_I_count, pivot_Inconcluyente_count)
+    
+    # Obtener el orden de especies por grupo
+    orden_positivas = conteo_especies[conteo_especies["Grupo_principal"] == "Gram positiva"]["especie"].drop_duplicates().tolist()
+    orden_negativas = conteo_especies[conteo_especies["Grupo_principal"] == "Gram negativa"]["especie"].drop_duplicates().tolist()
+
+    # Procesar ambos grupos
+    pivots_positivas = procesar_grupo(gram_positiva, orden_positivas)
+    pivots_negativas = procesar_grupo(gram_negativa, orden_negativas)
+
+    return pivots_positivas, pivots_negativas
+
+# Sección 4: Transformación de datos para el grafico de barras y tabla frecuencia de muestras por servicio
+def trasformar_datos_tipo_de_servicio(muestras):
+    # Calcular conteo y porcentaje para "Tipo de localización" (muestras únicas por SPEC_NUM)
+    conteo_servicio = muestras.groupby("Tipo de localizacion")["n"].sum().reset_index(name="n")
+    conteo_servicio["Porcentaje"] = (conteo_servicio["n"] / conteo_servicio["n"].sum() * 100).round(2)
+    conteo_servicio = conteo_servicio.sort_values("Porcentaje", ascending=False)
+
+    # Crear DataFrame para la tabla con la fila de total
+    total_row = pd.DataFrame({
+        "Tipo de localizacion": ["Total"],
+        "n": [conteo_servicio["n"].sum()],
+        "Porcentaje": [100.0]
+    })
+    conteo_servicio_tabla = pd.concat([conteo_servicio, total_row], ignore_index=True)
+
+    return conteo_servicio, conteo_servicio_tabla
+
+# Sección 5: Transformación de datos para el gráfico de barras y tabla porcentaje por tipo de muestra
+def transformar_datos_para_frecuencia_tipo_muestra(muestras):
+    # Calcular conteo y porcentaje para "Tipo de muestra"
+    if "Tipo de muestra" in muestras.columns:
+        conteo_muestra = muestras.groupby("Tipo de muestra")["n"].sum().reset_index(name="n")
+        conteo_muestra["Porcentaje"] = (conteo_muestra["n"] / conteo_muestra["n"].sum() * 100).round(2)
+        conteo_muestra = conteo_muestra.sort_values("Porcentaje", ascending=False)
+
+        # Identificar categorías infrecuentes (porcentaje < 1%)
+        infrecuentes = conteo_muestra[(conteo_muestra["Porcentaje"] < 1.0) & (conteo_muestra["Tipo de muestra"] != "Otros")]
+
+        if not infrecuentes.empty:
+            # Calcular total de muestras y porcentaje de categorías infrecuentes
+            total_infrecuentes_n = infrecuentes["n"].sum()
+            total_infrecuentes_pct = infrecuentes["Porcentaje"].sum()
+            
+            # Crear fila para "Muestras infrecuentes"
+            muestras_infrecuentes_row = pd.DataFrame({
+                "Tipo de muestra": ["Muestras infrecuentes"],
+                "n": [total_infrecuentes_n],
+                "Porcentaje": [round(total_infrecuentes_pct, 2)]
+            })
+            
+            # Filtrar solo categorías frecuentes (>= 1%)
+            categorias_frecuentes = conteo_muestra[(conteo_muestra["Porcentaje"] >= 1.0) | (conteo_muestra["Tipo de muestra"] == "Otros")]
+            
+            # Combinar categorías frecuentes con "Muestras infrecuentes"
+            conteo_muestra = pd.concat([categorias_frecuentes, muestras_infrecuentes_row], ignore_index=True)
+
+        # Ordenar por porcentaje descendente
+        conteo_muestra = conteo_muestra.sort_values("Porcentaje", ascending=False).reset_index(drop=True)
+
+        # Crear DataFrame para la tabla (misma lógica que para el gráfico)
+        conteo_muestra_tabla = conteo_muestra.copy()
+
+        # Crear DataFrame para la tabla con la fila de total
+        total_row = pd.DataFrame({
+            "Tipo de muestra": ["Total"],
+            "n": [conteo_muestra["n"].sum()],
+            "Porcentaje": [100.0]
+        })
+        conteo_muestra_tabla = pd.concat([conteo_muestra, total_row], ignore_index=True)
+    else:
+        conteo_muestra = pd.DataFrame(columns=["Tipo de muestra", "n", "Porcentaje"])
+        conteo_muestra_tabla = conteo_muestra
+
+    return conteo_muestra, conteo_muestra_tabla
+
+# Sección 6: Transformación de datos para gráfico de barras de muestras por rango de edad
+def transformar_datos_para_edad(muestras):
+    # El rango de edad de cada muestra se asigna al construir el cubo (agregados.asignar_rango)
+    conteo_edad = muestras.groupby('Rango_edad')['n'].sum().reset_index(name='n')
+    # Ordenar por rango de edad (de menor a mayor edad) corrigiendo el error
+    conteo_edad['Orden'] = conteo_edad['Rango_edad'].apply(lambda x: RANGOS_EDAD.index(x) if x in RANGOS_EDAD else len(RANGOS_EDAD))
+    conteo_edad = conteo_edad.sort_values('Orden').drop(columns=['Orden'])
+
+    return conteo_edad
+
+#Sección 6: Transformación de datos para gráfico de barras apiladas y tabla de tipo de muestra por servicio
+def transformar_datos_para_muestras_por_servicio(muestras):
+    # Crear una copia para no modificar el cubo
+    df_temp = muestras.copy()
+
+    # Identificar tipos de muestra poco frecuentes (<1%)
+    conteo_muestras = df_temp.groupby('Tipo de muestra')['n'].sum().reset_index(name='Conteo')
+    conteo_muestras['Porcentaje'] = (conteo_muestras['Conteo'] / conteo_muestras['Conteo'].sum() * 100).round(2)
+    muestras_infrecuentes = conteo_muestras[conteo_muestras['Porcentaje'] < 1]['Tipo de muestra'].tolist()
+    df_temp['Tipo de muestra'] = df_temp['Tipo de muestra'].replace(muestras_infrecuentes, 'muestras infrecuentes')
+
+    # Crear tabla pivot para conteo por servicio y tipo de muestra
+    conteo_servicio_muestras = (
+        df_temp.groupby(['Tipo de localizacion', 'Tipo de muestra'])['n']
+        .sum()
+        .reset_index(name='Conteo')
+    )
+
+    # Calcular porcentajes por grupo de 'Tipo de localizacion'
+    totales_por_servicio = conteo_servicio_muestras.groupby('Tipo de localizacion')['Conteo'].transform('sum')
+    conteo_servicio_muestras['Porcentaje'] = (conteo_servicio_muestras['Conteo'] / totales_por_servicio * 100).round(2)
+
+    # Ordenar 'Tipo de localizacion' por conteo total
+    totales_servicios = conteo_servicio_muestras.groupby('Tipo de localizacion')['Conteo'].sum().sort_values(ascending=False)
+    orden_servicios = totales_servicios.index.tolist()
+
+    # Ordenar 'Tipo de muestra' por conteo total
+    totales_tipos_muestra = conteo_servicio_muestras.groupby('Tipo de muestra')['Conteo'].sum().sort_values(ascending=False)
+    orden_tipos_muestra = totales_tipos_muestra.index.tolist()
+
+    # Convertir a tipos categóricos para ordenar la tabla
+    conteo_servicio_muestras['Tipo de localizacion'] = pd.Categorical(
+        conteo_servicio_muestras['Tipo de localizacion'],
+        categories=orden_servicios,
+        ordered=True
+    )
+    conteo_servicio_muestras['Tipo de muestra'] = pd.Categorical(
+        conteo_servicio_muestras['Tipo de muestra'],
+        categories=orden_tipos_muestra,
+        ordered=True
+    )
+    conteo_servicio_muestras = conteo_servicio_muestras.sort_values(by=['Tipo de localizacion', 'Tipo de muestra'])
+
+    return conteo_servicio_muestras, orden_servicios, orden_tipos_muestra, muestras_infrecuentes
+
+# Sección 7: Transformación de datos para gráfico de barras apiladas y tabla de perfil de especies por tipo de muestra
+def transformar_datos_para_especies_por_muestra(aislados, muestras_infrecuentes):
+    # Crear una copia para no modificar el cubo
+    df_temp = aislados.copy()
+
+    # Identificar tipos de muestra poco frecuentes (<3%)
+    conteo_especie = df_temp.groupby('especie')['n'].sum().reset_index(name='Conteo')
+    conteo_especie['Porcentaje'] = (conteo_especie['Conteo'] / conteo_especie['Conteo'].sum() * 100).round(2)
+    #conteo_especies = conteo_especies.sort_values(by="Conteo", ascending=False)
+    especies_infrecuentes = conteo_especie[conteo_especie['Porcentaje'] < 3]['especie'].tolist()
+
+    # Reemplazar especies poco frecuentes
+    df_temp['especie'] = df_temp['especie'].replace(especies_infrecuentes, 'otras especies')
+
+    # Reemplazar tipos de muestra poco frecuentes
+    df_temp['Tipo de muestra'] = df_temp['Tipo de muestra'].replace(muestras_infrecuentes, 'muestras infrecuentes')
+
+    # Crear tabla pivote para conteo por tipo de muestra por especies
+    conteo_muestra_especies = (
+        df_temp.groupby(['Tipo de muestra', 'especie'])['n']
+        .sum()
+        .reset_index(name='Conteo')
+    )
+
+    # Calcular porcentajes por grupo de 'Tipo de muestra'
+    totales_por_muestra = conteo_muestra_especies.groupby('Tipo de muestra')['Conteo'].transform('sum')
+    conteo_muestra_especies['Porcentaje'] = (conteo_muestra_especies['Conteo'] / totales_por_muestra * 100).round(2)
+
+    # Ordenar 'Tipo de muestra' por conteo total
+    totales_muestras = conteo_muestra_especies.groupby('Tipo de muestra')['Conteo'].sum().sort_values(ascending=False)
+    orden_muestras = totales_muestras.index.tolist()
+
+    # Ordenar 'especies' por conteo total
+    totales_especies = conteo_muestra_especies.groupby('especie')['Conteo'].sum().sort_values(ascending=False)
+    orden_de_especies = totales_especies.index.tolist()
+
+    # Convertir a tipos categóricos para ordenar la tabla
+    conteo_muestra_especies['Tipo de muestra'] = pd.Categorical(
+        conteo_muestra_especies['Tipo de muestra'],
+        categories=orden_muestras,
+        ordered=True
+    )
+    conteo_muestra_especies['especie'] = pd.Categorical(
+        conteo_muestra_especies['especie'],
+        categories=orden_de_especies,
+        ordered=True
+    )
+    conteo_muestra_especies = conteo_muestra_especies.sort_values(by=['Tipo de muestra', 'Porcentaje'], ascending=[True, False])
+
+    return conteo_muestra_especies, orden_muestras, orden_de_especies
+
+
+# ------- GENERACIÓN DE GRÁFICOS -------
+# Cada constructor genera, a partir del cubo del año, solo los elementos de un gráfico (y su tabla)
+
+def construir_lineas(agregados, anio):
+    # Datos del gráfico de líneas de resistencia (se dibuja en figura_resistencia)
+    # El cubo conserva las claves nulas; el gráfico solo muestra meses y especies conocidos
+    count_table = calcular_conteos_porcentajes(agregados['conteos'].dropna(subset=['fecha', 'Grupo_principal', 'especie']))
+    #count_table.to_excel("/Users/zahir/Downloads/CountCount.xlsx", index=False)
+    df_grafLineas = count_table[count_table['total'] >= 10]
+    # En el cubo la fecha es el inicio de mes; aquí pasa a la etiqueta "Mes-AAAA"
+    df_grafLineas["fecha"] = pd.Categorical(etiquetas_meses(df_grafLineas["fecha"]), categories=meses_del_anio(anio), ordered=True)
+    antibioticos = sorted(df_grafLineas["antibiotico"].dropna().unique())
+    return {'df_grafLineas': df_grafLineas, 'antibioticos': antibioticos}
+
+def construir_aislados(agregados, anio):
+    conteo_especies, orden_especies = transformar_datos_para_aislados_barras(agregados['aislados'])
+
+    # 1.Generación del gráfico de barras: Aislados por especie
+    # Colores por categoría
+    category_colors = {
+        "Gram negativa": "#A5005A",
+        "Gram positiva": "#F48FB1",
+        "Hongo": "#81C784",
+    }
+
+    fig3 = px.bar(
+        conteo_especies,
+        x="especie",
+        y="aislados",
+        color="Grupo_principal" if "Grupo_principal" in conteo_especies.columns else None,
+        color_discrete_map=category_colors if "Grupo_principal" in conteo_especies.columns else None,
+        labels={"aislados": "Número de aislados", "especie": "Especie"},
+        title="Número de aislados por especie"
+    )
+
+    fig3.update_layout(
+        height=600,
+        xaxis_tickangle=-45,
+        legend_title=None
+    )
+
+    fig3.update_xaxes(categoryorder="array", categoryarray=orden_especies)
+    fig3.update_yaxes(
+        type="log",
+        tickvals=[1, 10, 100, 1000, 10000],
+        ticktext=["1", "10", "100", "1000", "10k"]
+    )
+    return {'fig3': fig3}
+
+def construir_heatmaps(agregados, anio):
+    count_table = calcular_conteos_porcentajes(agregados['conteos'])
+    conteo_especies, _ = transformar_datos_para_aislados_barras(agregados['aislados'])
+    (pivots_positivas, pivots_negativas) = transformar_datos_para_heatmap(count_table, conteo_especies)
+
+    # Desempaquetar los pivots
+    (pivot_R_pos, pivot_S_pos, pivot_I_pos, pivot_Inconcluyente_pos,
+    pivot_R_count_pos, pivot_S_count_pos, pivot_I_count_pos, pivot_Inconcluyente_count_pos) = pivots_positivas
+
+    (pivot_R_neg, pivot_S_neg, pivot_I_neg, pivot_Inconcluyente_neg,
+    pivot_R_count_neg, pivot_S_count_neg, pivot_I_count_neg, pivot_Inconcluyente_count_neg) = pivots_negativas
+
+    # 2.Generación del gráfico Heatmap: Resistencia por especie-antibiótico
+    # Crear customdata como un array 7D para incluir porcentajes y conteos
+    # Heatmap para Gram positivas
+    customdata_pos = np.stack([
+        pivot_S_pos.values, pivot_I_pos.values, pivot_Inconcluyente_pos.values,
+        pivot_R_count_pos.values, pivot_S_count_pos.values, pivot_I_count_pos.values, pivot_Inconcluyente_count_pos.values
+    ], axis=-1)
+
+    fig_heatmap_pos = px.imshow(
+        pivot_R_pos,
+        text_auto=True, # Mostrar valores en celdas (solo R (%))
+        aspect="auto", # Ajustar aspecto automáticamente
+        color_continuous_scale="Reds", # Escala de color rojo para alto
+        labels={"color": "Resistencia (%)"}
+    )
+    # Ajustes para mejorar legibilidad
+    fig_heatmap_pos.update_layout(
+        xaxis_tickangle=-45, # Rotar etiquetas de columnas
+        yaxis_title="Especie (Gram Positiva)",
+        xaxis_title="Antibiótico",
+        height=600,  # Ajustar altura para menos especies
+        coloraxis_colorbar={"title": "R (%)"},
+        xaxis_side="top" # Mover etiquetas del eje X arriba
+    )
+    # Actualizar hover con datos adicionales incluyendo conteos
+    fig_heatmap_pos.update_traces(
+        customdata=customdata_pos,
+        hovertemplate="Especie: %{y}<br>Antibiótico: %{x}<br>R (%): %{z:.1f}; n = %{customdata[3]:.0f}<br>S (%): %{customdata[0]:.1f}; n = %{customdata[4]:.0f}<br>I (%): %{customdata[1]:.1f}; n = %{customdata[5]:.0f}<br>Inconcluyente (%): %{customdata[2]:.1f}; n = %{customdata[6]:.0f}",
+        textfont_size=14
+    )
+
+    # Heatmap para Gram negativas
+    customdata_neg = np.stack([
+        pivot_S_neg.values, pivot_I_neg.values, pivot_Inconcluyente_neg.values,
+        pivot_R_count_neg.values, pivot_S_count_neg.values, pivot_I_count_neg.values, pivot_Inconcluyente_count_neg.values
+    ], axis=-1)
+
+    fig_heatmap_neg = px.imshow(
+        pivot_R_neg,
+        text_auto=True,
+        aspect="auto",
+        color_continuous_scale="Reds",
+        labels={"color": "Resistencia (%)"}
+    )
+
+    fig_heatmap_neg.update_layout(
+        xaxis_tickangle=-45,
+        yaxis_title="Especie (Gram Negativa)",
+        xaxis_title="Antibiótico",
+        height=600,  # Ajustar altura para menos especies
+        coloraxis_colorbar={"title": "R (%)"},
+        xaxis_side="top"
+    )
+
+    fig_heatmap_neg.update_traces(
+        customdata=customdata_neg,
+        hovertemplate="Especie: %{y}<br>Antibiótico: %{x}<br>R (%): %{z:.1f}; n = %{customdata[3]:.0f}<br>S (%): %{customdata[0]:.1f}; n = %{customdata[4]:.0f}<br>I (%): %{customdata[1]:.1f}; n = %{customdata[5]:.0f}<br>Inconcluyente (%): %{customdata[2]:.1f}; n = %{customdata[6]:.0f}",
+        textfont_size=14
+    )
+    return {'fig_heatmap_pos': fig_heatmap_pos, 'fig_heatmap_neg': fig_heatmap_neg}
+
+def construir_localizacion(agregados, anio):
+    conteo_servicio, conteo_servicio_tabla = trasformar_datos_tipo_de_servicio(agregados['muestras'])
+
+    # 3.Generación del gráfico de barras y tabla de frecuencia de muestras por servicio
+    # Crear gráfico de barras
+    fig_localizacion = px.bar(
+        conteo_servicio,
+        x="Tipo de localizacion",
+        y="Porcentaje",
+        labels={"Porcentaje": "Porcentaje (%)", "Tipo de localización": "Tipo de Localizacion"},
+        title="Pocentajes de muestra según servicio",
+        color_discrete_sequence=["#636EFA"]
+    )
+    fig_localizacion.update_layout(
+        height=600,
+        xaxis_tickangle=-45,
+        showlegend=False
+    )
+
+    # Crear tabla
+    tabla_localizacion = dash_table.DataTable(
+        id="tabla_localizacion",
+        columns=[
+            {"name": "Servicio", "id": "Tipo de localizacion"},
+            {"name": "n", "id": "n"},
+            {"name": "Porcentaje (%)", "id": "Porcentaje"}
+        ],
+        data=conteo_servicio_tabla.to_dict("records"),
+        style_table={"overflowX": "auto", "height": "600px",},
+        style_cell={
+            "textAlign": "left",
+            "padding": "5px",
+            "fontSize": "14px"
+        },
+        style_header={
+            "backgroundColor": "#f8f9fa",
+            "fontWeight": "bold"
+        }
+    )
+    return {'fig_localizacion': fig_localizacion, 'tabla_localizacion': tabla_localizacion}
+
+def construir_muestra(agregados, anio):
+    conteo_muestra, conteo_muestra_tabla = transformar_datos_para_frecuencia_tipo_muestra(agregados['muestras'])
+
+    # 4.Generación del gráfico de barras y tabla de frecuencia por tipo de muestra
+    # Crear gráfico de barras
+    fig_muestra = px.bar(
+        conteo_muestra,
+        x="Tipo de muestra",
+        y="Porcentaje",
+        labels={"Porcentaje": "Porcentaje (%)", "Tipo de muestra": "Tipo de Muestra"},
+        title="Tipos de muestras y su proporción (%)",
+        color_discrete_sequence=["#EF553B"],
+        #category_orders={"Tipo de muestra": conteo_muestra["Tipo de muestra"].tolist()}
+    )
+    fig_muestra.update_layout(
+        height=600,
+        xaxis_tickangle=-45,
+        showlegend=False
+    )
+
+    # Crear tabla
+    tabla_muestra = dash_table.DataTable(
+        id="tabla_muestra",
+        columns=[
+            {"name": "Tipo de Muestra", "id": "Tipo de muestra"},
+            {"name": "n", "id": "n"},
+            {"name": "Porcentaje (%)", "id": "Porcentaje"}
+        ],
+        data=conteo_muestra_tabla.to_dict("records"),
+        style_table={
+            "overflowX": "auto",
+            "overflowY": "auto",  # Habilita scroll vertical
+            "height": "600px",    # Altura fija, ajusta según necesites
+        },
+        style_cell={
+            "textAlign": "left",
+            "padding": "5px",
+            "fontSize": "14px"
+        },
+        style_header={
+            "backgroundColor": "#f8f9fa",
+            "fontWeight": "bold"
+        },
+        fixed_rows={"headers": True} # Fijar encabezados de tablas
+    )
+    return {'fig_muestra': fig_muestra, 'tabla_muestra': tabla_muestra}
+
+def construir_edad(agregados, anio):
+    conteo_edad = transformar_datos_para_edad(agregados['muestras'])
+
+    # 5.Generación del gráfico de barras de muestras por edad
+    # Crear gráfico de barras
+    fig_edad = px.bar(
+        conteo_edad,
+        x="Rango_edad",
+        y="n",
+        labels={"n": "Conteo", "Rango_edad": "Rango de Edad"},
+        title="Número de muestras según edad",
+        color_discrete_sequence=["#00CC96"]
+    )
+    fig_edad.update_layout(
+        height=400,
+        xaxis_tickangle=-45,
+        showlegend=False
+    )
+    return {'fig_edad': fig_edad}
+
+def construir_servicio_muestras(agregados, anio):
+    conteo_servicio_muestras, orden_servicios, orden_tipos_muestra, _ = transformar_datos_para_muestras_por_servicio(agregados['muestras'])
+
+    # 6.Generación del gráfico de barras apiladas: Distribución de tipos de muestra por servicio
+    fig_servicio_muestras = px.bar(
+        conteo_servicio_muestras,
+        x="Tipo de localizacion",
+        y="Conteo",
+        color="Tipo de muestra",
+        title="Distribución del tipo de muestras analizadas según servicio",
+        labels={"Conteo": "Conteo", "Tipo de localizacion": "Servicio", "Tipo de muestra": "Tipo de Muestra"},
+        category_orders={
+            "Tipo de localizacion": orden_servicios,
+            "Tipo de muestra": orden_tipos_muestra
+        },
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    fig_servicio_muestras.update_traces(
+        marker_line_width=1,
+        marker_line_color='black'
+    )
+    fig_servicio_muestras.update_layout(
+        height=600,
+        xaxis_tickangle=-45,
+        showlegend=True,
+        legend_title="Tipo de Muestra"
+    )
+
+    # Crear tabla para distribución de tipos de muestra por servicio
+    tabla_servicio_muestras = dash_table.DataTable(
+        id="tabla_servicio_muestras",
+        columns=[
+            {"name": "Servicio", "id": "Tipo de localizacion"},
+            {"name": "Tipo de Muestra", "id": "Tipo de muestra"},
+            {"name": "Conteo", "id": "Conteo"},
+            {"name": "Porcentaje (%)", "id": "Porcentaje"}
+        ],
+        data=conteo_servicio_muestras.to_dict("records"),
+        style_table={
+            "overflowX": "auto",
+            "overflowY": "auto", 
+            "height": "600px",    
+        },
+        style_cell={
+            "textAlign": "left",
+            "padding": "5px",
+            "fontSize": "14px"
+        },
+        style_header={
+            "backgroundColor": "#f8f9fa",
+            "fontWeight": "bold"
+        },
+    )
+    return {'fig_servicio_muestras': fig_servicio_muestras, 'tabla_servicio_muestras': tabla_servicio_muestras}
+
+def construir_muestra_especies(agregados, anio):
+    # Los tipos de muestra infrecuentes se agrupan igual que en el gráfico por servicio
+    _, _, _, muestras_infrecuentes = transformar_datos_para_muestras_por_servicio(agregados['muestras'])
+    conteo_muestra_especies, orden_muestras, orden_de_especies = transformar_datos_para_especies_por_muestra(agregados['aislados'], muestras_infrecuentes)
+
+    # 7. Generación del gráfico de barras apiladas: Distribución de perfiles de especies por tipo de muestra
+    fig_muestra_especies = px.bar(
+        conteo_muestra_especies,
+        x="Tipo de muestra",
+        y="Conteo",
+        color="especie",
+        title="Aislamientos bacterianos según su origen de la muestra",
+        labels={"Conteo": "Conteo", "Tipo de muestra": "Tipo de Muestra", "perfil_especies": "Perfil de Especies"},
+        category_orders={
+            "Tipo de muestra": orden_muestras,
+            "especie": orden_de_especies
+        },
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    fig_muestra_especies.update_traces(
+        marker_line_width=1,
+        marker_line_color='black'
+    )
+    fig_muestra_especies.update_layout(
+        height=600,
+        xaxis_tickangle=-45,
+        showlegend=True,
+        legend_title="Especies"
+    )
+
+    # Crear tabla para distribución de perfiles de especies por tipo de muestra
+    tabla_muestra_especies = dash_table.DataTable(
+        id="tabla_muestra_especies",
+        columns=[
+            {"name": "Tipo de Muestra", "id": "Tipo de muestra"},
+            {"name": "Especies", "id": "especie"},
+            {"name": "Conteo", "id": "Conteo"},
+            {"name": "Porcentaje (%)", "id": "Porcentaje"}
+        ],
+        data=conteo_muestra_especies.to_dict("records"),
+        style_table={
+            "overflowX": "auto",
+            "overflowY": "auto", 
+            "height": "600px",    
+        },
+        style_cell={
+            "textAlign": "left",
+            "padding": "5px",
+            "fontSize": "14px"
+        },
+        style_header={
+            "backgroundColor": "#f8f9fa",
+            "fontWeight": "bold"
+        }
+    )
+    return {'fig_muestra_especies': fig_muestra_especies, 'tabla_muestra_especies': tabla_muestra_especies}
+
+CONSTRUCTORES = {
+    'lineas': construir_lineas,
+    'aislados': construir_aislados,
+    'heatmaps': construir_heatmaps,
+    'localizacion': construir_localizacion,
+    'muestra': construir_muestra,
+    'edad': construir_edad,
+    'servicio_muestras': construir_servicio_muestras,
+    'muestra_especies': construir_muestra_especies,
+}
+
+# Constructores necesarios para cada pestaña; los de otras pestañas no se ejecutan
+CONSTRUCTORES_PESTANA = {
+    "tab-muestras": ['localizacion', 'muestra', 'edad', 'servicio_muestras', 'muestra_especies'],
+    "tab-aislados": ['aislados', 'heatmaps', 'lineas'],
+}
+
+def construir_vista(agregados, anio, constructores=None):
+    """Genera los elementos (gráficos, tablas y datos auxiliares) de los constructores indicados.
+
+    Sin constructores se generan todos los de CONSTRUCTORES.
+    """
+    vista = {}
+    for nombre in constructores or CONSTRUCTORES:
+        vista.update(CONSTRUCTORES[nombre](agregados, anio))
+    print(f"✅ Gráficos regenerados para {anio}: {', '.join(constructores or CONSTRUCTORES)}")
+    return vista
+
+def figura_resistencia(df_grafLineas, abx_1, anio):
+    """Gráfico de líneas: resistencia mensual a un antibiótico para las especies de interés."""
+    if df_grafLineas is None or df_grafLineas.empty:
+        return go.Figure().add_annotation(text="Sin datos para este año", showarrow=False)
+
+    df_1 = df_grafLineas[(df_grafLineas["antibiotico"] == abx_1) & (df_grafLineas["especie"].isin(especies_fijas))]
+    df_1 = df_1.assign(fecha=pd.Categorical(df_1["fecha"], categories=meses_del_anio(anio), ordered=True))
+    df_1_grouped = df_1.groupby(["fecha", "especie"], as_index=False)["R (%)"].mean()
+    df_1_grouped = df_1_grouped.sort_values("fecha")
+
+    fig = px.line(
+        df_1_grouped,
+        x="fecha",
+        y="R (%)",
+        color="especie",
+        markers=True,
+        title=f"Resistencia a {abx_1} por especie (total)",
+        labels={"fecha": "Mes", "R (%)": "Resistencia (%)", "especie": "Microorganismo"},
+        color_discrete_map=colores_especies
+    )
+    fig.update_layout(hovermode="x unified")
+    return fig
+
+def figura_tendencia(tendencia, abx_1, frecuencia):
+    """Gráfico de líneas: resistencia a un antibiótico de las especies de interés a lo largo
+    de varios años, por periodo (ver gestor_datos.consultar_tendencia)."""
+    if tendencia is None or tendencia.empty:
+        return go.Figure().add_annotation(text="Sin datos para la tendencia", showarrow=False)
+
+    # Mismo mínimo de aislados por punto que el gráfico anual
+    df_tendencia = calcular_conteos_porcentajes(tendencia)
+    df_tendencia = df_tendencia[(df_tendencia["total"] >= 10) & (df_tendencia["antibiotico"] == abx_1)
+                                & (df_tendencia["especie"].isin(especies_fijas))]
+    df_tendencia = df_tendencia.assign(inicio=df_tendencia["periodo"].dt.start_time,
+                                       periodo=df_tendencia["periodo"].astype(str))
+
+    fig = px.line(
+        df_tendencia,
+        x="inicio",
+        y="R (%)",
+        color="especie",
+        markers=True,
+        hover_data={"total": True, "inicio": False, "periodo": True},
+        title=f"Tendencia de la resistencia a {abx_1} por {frecuencia}",
+        labels={"inicio": "Periodo", "periodo": "Periodo", "R (%)": "Resistencia (%)",
+                "especie": "Microorganismo", "total": "Aislados"},
+        color_discrete_map=colores_especies
+    )
+    fig.update_layout(hovermode="x unified")
+    return fig
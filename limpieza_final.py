@@ -1,73 +1,147 @@
+import numpy as np
 import pandas as pd
+from fechas import inicio_de_mes
+from pipeline import EjecutorPipeline, registrar_etapa
 
-# Convierte la columna 'fecha' a formato datetime
-def convertir_fechas_a_datetime(df):
-    df = df.copy()
-    df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce')
-    return df
+# Etapa de fechas: 'fecha' se interpreta una sola vez y se guarda como inicio de mes
+# (datetime64, sin depender del locale); las etiquetas con el mes en español se generan solo
+# al mostrar (ver fechas.etiquetas_meses)
+def interpretar_fechas(df):
+    return pd.to_datetime(df['fecha'], errors='coerce')
 
-# Reordena las columnas del DataFrame colocando las columnas de inicio al principio
-def reordenar_columnas(df, columnas_inicio):
-    otras_columnas = [col for col in df.columns if col not in columnas_inicio]
-    return df[columnas_inicio + otras_columnas]
+# Reemplaza 'fecha' por el inicio de mes de fechas, en las filas indicadas (posiciones) o en
+# todas. Solo la selección de filas copia el DataFrame; sin ella la copia es superficial.
+def aplicar_fechas(df, fechas, filas=None):
+    if filas is None:
+        resultado = df.copy(deep=False)
+    else:
+        resultado, fechas = df.take(filas), fechas.iloc[filas]
+    resultado.isetitem(df.columns.get_loc('fecha'), inicio_de_mes(fechas).to_numpy())
+    return resultado
 
-# Filtra los registros para conservar solo el año predominante
-def filtrar_anios(df):
-    # Obtener el año predominante (el más frecuente)
-    anio_predominante = df['fecha'].dt.year.mode()[0]
-    print(f"Año predominante detectado: {anio_predominante}")
-    return df[df['fecha'].dt.year == anio_predominante]
+# Posiciones de las filas del año indicado o, sin él, del año predominante (el más frecuente)
+def filas_del_anio(fechas, anio_predominante=None):
+    anios = fechas.dt.year
+    if anio_predominante is None:
+        anio_predominante = anios.mode()[0]
+        print(f"Año predominante detectado: {anio_predominante}")
+    return np.flatnonzero(anios.to_numpy() == anio_predominante)
 
-# Formatea la columna 'fecha' a string con meses en español
-def formatear_fechas(df):
-    df = df.copy()
-    df['fecha'] = df['fecha'].apply(lambda x: x.strftime('%B-%Y') if pd.notna(x) else pd.NA)
-    meses_traduccion = {
-        'January': 'Enero', 'February': 'Febrero', 'March': 'Marzo', 'April': 'Abril',
-        'May': 'Mayo', 'June': 'Junio', 'July': 'Julio', 'August': 'Agosto',
-        'September': 'Septiembre', 'October': 'Octubre', 'November': 'Noviembre', 'December': 'Diciembre'
-    }
-    df['fecha'] = df['fecha'].replace(meses_traduccion, regex=True)
-    return df
+# Valores de antibióticos que se descartan: números que quedaron sin categorizar (también los
+# escritos como texto, p. ej. '16' o '0.5') y textos vacíos
+def es_valor_descartable(valor):
+    if isinstance(valor, (int, float, np.number, np.bool_)):
+        return True
+    return isinstance(valor, str) and (valor == '' or valor.replace('.', '', 1).isdigit())
 
 # Limpia las columnas de antibióticos reemplazando valores numéricos y vacíos por NA, 
-# y elimina columnas completamente vacías y filas sin datos en antibióticos
-def limpiar_datos_antibioticos(df, columnas_fijas):
+# y elimina columnas completamente vacías y filas sin datos en antibióticos. columnas_inicio
+# quedan al principio, en ese orden.
+# Todo el bloque de antibióticos se procesa de una vez: cada valor distinto se evalúa una sola
+# vez (factorize) y el resultado se aplica como máscara; las filas y columnas que quedan se
+# copian una sola vez.
+def limpiar_datos_antibioticos(df, columnas_fijas, columnas_inicio=()):
     
-    # Identificar columnas de antibióticos
+    # Identificar columnas de antibióticos; las numéricas o booleanas solo contienen valores
+    # descartables o nulos. Cualquier otro tipo (object, string, category, fechas) se revisa
     antibioticos = [col for col in df.columns if col not in columnas_fijas]
+    numericas = [col for col in antibioticos
+                 if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col])]
+    de_texto = [col for col in antibioticos if col not in numericas]
     
-    # Reemplazar valores numéricos por NA
-    for col in antibioticos:
-        df[col] = df[col].apply(lambda x: pd.NA if isinstance(x, (int, float)) or 
-                               (isinstance(x, str) and x.replace('.', '', 1).isdigit()) else x)
+    # Máscara de valores descartables (a NA) y de nulos, evaluando cada valor distinto una vez.
+    # Se trabaja con una fila por columna (el orden en memoria de los bloques de pandas).
+    valores = np.ascontiguousarray(df[de_texto].to_numpy(dtype=object).T)
+    codigos, unicos = pd.factorize(valores.ravel())
+    # Los nulos (código -1) toman el último elemento, que no se descarta
+    descartables = np.append(np.fromiter((es_valor_descartable(u) for u in unicos), dtype=bool, count=len(unicos)), False)
+    codigos = codigos.reshape(valores.shape)
+    descartar = descartables[codigos]
+    nulos = (codigos < 0) | descartar
+    del codigos
     
-    # Reemplazar valores vacíos por NA
-    df[antibioticos] = df[antibioticos].replace('', pd.NA)
+    # Columnas completamente vacías y filas sin datos en ninguna columna no vacía
+    vacias = nulos.all(axis=1)
+    vacias_de_texto = {de_texto[k] for k in np.flatnonzero(vacias)}
+    columnas_vacias = [col for col in antibioticos if col in numericas or col in vacias_de_texto]
+    con_datos = np.flatnonzero(~vacias)
+    filas = np.flatnonzero(~nulos[con_datos].all(axis=0)) if len(con_datos) else np.array([], dtype=np.intp)
+    del nulos
     
-    # Detectar columnas completamente vacías
-    columnas_vacias = [col for col in antibioticos if df[col].isna().all()]
+    # Bloque de antibióticos limpio (una copia con las filas y columnas que quedan) junto a las fijas
+    bloque = valores[np.ix_(con_datos, filas)]
+    del valores
+    bloque[descartar[np.ix_(con_datos, filas)]] = pd.NA
+    del descartar
+    columnas_inicio = [col for col in columnas_inicio if col in df.columns and col not in antibioticos]
+    fijas = columnas_inicio + [col for col in df.columns if col not in antibioticos and col not in columnas_inicio]
+    df_limpio = pd.concat([df.iloc[filas, [df.columns.get_loc(col) for col in fijas]],
+                           pd.DataFrame(bloque.T, index=df.index[filas], columns=[de_texto[k] for k in con_datos])],
+                          axis=1, copy=False)
     
-    # Eliminar filas sin datos en ninguna columna de antibióticos (excluyendo vacías)
-    df_limpio = df.dropna(subset=[col for col in antibioticos if col not in columnas_vacias], how='all')
-    
-    # Eliminar columnas vacías
-    df_limpio = df_limpio.drop(columns=columnas_vacias)
+    # Orden final: columnas_inicio y el resto en el orden original
+    orden = columnas_inicio + [col for col in df.columns if col not in columnas_inicio and col not in columnas_vacias]
+    if list(df_limpio.columns) != orden:
+        df_limpio = df_limpio[orden]
     
     return df_limpio, columnas_vacias
 
-def procesar_limpieza_final(df):
+COLUMNAS_INICIO = ['fecha', 'Region', 'Hospital', 'SPEC_NUM', 'Tipo de localizacion',
+                   'Tipo de muestra', 'Edad', 'especie', 'Grupo_general', 'Grupo_principal']
+COLUMNAS_FIJAS = ['fecha', 'Region', 'Hospital', 'Tipo de localizacion', 'Tipo de muestra',
+                  'especie', 'Grupo_general', 'Grupo_principal', 'SPEC_NUM', 'Edad']
+
+# Etapa de fechas de procesar_limpieza_final: conserva las filas del año indicado (o del
+# predominante) con 'fecha' como inicio de mes. Si todas las filas son de ese año no se copia.
+def conservar_anio(df, anio=None):
+    fechas = interpretar_fechas(df)
+    filas = filas_del_anio(fechas, anio)
+    return aplicar_fechas(df, fechas, None if len(filas) == len(df) else filas)
+
+# Etapas registradas de la limpieza final; 'anio' en el contexto fija el año a conservar
+@registrar_etapa('conservar_anio', progreso='limpiar')
+def _etapa_conservar_anio(df, contexto):
+    return conservar_anio(df, contexto.get('anio'))
+
+@registrar_etapa('limpiar_datos_antibioticos')
+def _etapa_limpiar_datos_antibioticos(df, contexto):
+    df_limpio, contexto['columnas_vacias'] = limpiar_datos_antibioticos(df, COLUMNAS_FIJAS, COLUMNAS_INICIO)
+    return df_limpio
+
+# En una carga por bloques el año se filtra al guardar (anio_predominante); el bloque solo
+# cuenta sus registros por año, necesario para el año predominante
+@registrar_etapa('fechas_bloque', progreso='limpiar')
+def _etapa_fechas_bloque(df, contexto):
+    fechas = interpretar_fechas(df)
+    contexto['conteo_anios'] = fechas.dt.year.value_counts()
+    # El inicio de mes conserva el año, así que el filtro final puede hacerse sobre él
+    return aplicar_fechas(df, fechas)
+
+ETAPAS_LIMPIEZA_FINAL = ['conservar_anio', 'limpiar_datos_antibioticos']
+ETAPAS_LIMPIEZA_BLOQUE = ['fechas_bloque', 'limpiar_datos_antibioticos']
+
+# anio fija el año a conservar; sin él se conserva el año predominante
+def procesar_limpieza_final(df, anio=None):
     # Configuración inicial
     #ruta_archivo = '/Users/zahir/Downloads/BD_Finales/Nuevo_BD_HonorioDelgadoArequipa_EspeciesTotal.xlsx'
-    columnas_inicio = ['fecha', 'Region', 'Hospital', 'SPEC_NUM', 'Tipo de localizacion', 
-                       'Tipo de muestra', 'Edad', 'especie', 'Grupo_general', 'Grupo_principal']
-    columnas_fijas = ['fecha', 'Region', 'Hospital', 'Tipo de localizacion', 'Tipo de muestra', 
-                      'especie', 'Grupo_general', 'Grupo_principal', 'SPEC_NUM', 'Edad']
     
     # Pipeline de procesamiento
-    df = convertir_fechas_a_datetime(df)
-    df = reordenar_columnas(df, columnas_inicio)
-    df = filtrar_anios(df)
-    df = formatear_fechas(df)
-    df_limpio, _ = limpiar_datos_antibioticos(df, columnas_fijas)    
-    return df_limpio
+    ejecutor = EjecutorPipeline(df, {'anio': anio})
+    return ejecutor.ejecutar_etapas(ETAPAS_LIMPIEZA_FINAL)
+
+# Limpieza de un bloque de una carga por bloques: todo lo que no depende del archivo completo.
+# Devuelve también el conteo de registros por año, necesario para el año predominante.
+def limpiar_bloque(df):
+    ejecutor = EjecutorPipeline(df)
+    ejecutor.ejecutar_etapas(ETAPAS_LIMPIEZA_BLOQUE)
+    return ejecutor.df, ejecutor.contexto['conteo_anios']
+
+# Año que conserva una carga por bloques: el predominante en el archivo completo (suma de
+# los conteo_anios de sus bloques) o el año indicado
+def anio_predominante(conteo_anios, anio=None):
+    if anio is None:
+        if conteo_anios.empty:
+            raise ValueError("El archivo no contiene fechas válidas")
+        anio = int(conteo_anios.sort_index().idxmax())
+        print(f"Año predominante detectado: {anio}")
+    return anio
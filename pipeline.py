@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Archivo JSON Lines opcional al que se agregan las métricas de cada etapa ejecutada
+ARCHIVO_METRICAS_PIPELINE = os.getenv("ARCHIVO_METRICAS_PIPELINE")
+
+def memoria_rss() -> int:
+    """RSS actual del proceso en bytes (0 si no se puede medir)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def reiniciar_pico_rss() -> bool:
+    # En Linux, escribir 5 en clear_refs reinicia el pico de RSS (VmHWM) del proceso
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def pico_rss() -> int:
+    """Pico de RSS en bytes desde el último reinicio (VmHWM).
+
+    Sin /proc se usa el pico de todo el proceso según getrusage, que no se puede reiniciar.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+# Etapas registradas: nombre -> (función(df, contexto) -> df, etapa de progreso que inicia o None)
+ETAPAS: Dict[str, Tuple[Callable, Optional[str]]] = {}
+
+def registrar_etapa(nombre: str, progreso: Optional[str] = None):
+    """Decorador que registra una función como etapa del pipeline con ese nombre.
+
+    La función recibe el DataFrame de trabajo y el contexto compartido (dict) y devuelve el
+    DataFrame con el que sigue el pipeline; los resultados secundarios se dejan en el
+    contexto. progreso es la etapa de carga (ver gestor_datos.ETAPAS_CARGA) que se anuncia
+    al empezar esta etapa.
+    """
+    def decorador(funcion: Callable) -> Callable:
+        ETAPAS[nombre] = (funcion, progreso)
+        return funcion
+    return decorador
+
+# Destinos adicionales de las métricas: funciones que reciben cada medición
+_destinos_metricas: List[Callable[[Dict], None]] = []
+
+def agregar_destino_metricas(destino: Callable[[Dict], None]) -> None:
+    _destinos_metricas.append(destino)
+
+def quitar_destino_metricas(destino: Callable[[Dict], None]) -> None:
+    if destino in _destinos_metricas:
+        _destinos_metricas.remove(destino)
+
+def emitir_metricas(medicion: Dict) -> None:
+    """Envía la medición de una etapa al log (JSON), al archivo de métricas y a los destinos."""
+    linea = json.dumps(medicion, ensure_ascii=False, default=str)
+    logger.info(linea)
+    if ARCHIVO_METRICAS_PIPELINE:
+        try:
+            with open(ARCHIVO_METRICAS_PIPELINE, 'a', encoding='utf-8') as f:
+                f.write(linea + '\n')
+        except OSError as e:
+            print(f"No se pudieron guardar las métricas en {ARCHIVO_METRICAS_PIPELINE}: {str(e)}")
+    for destino in list(_destinos_metricas):
+        try:
+            destino(medicion)
+        except Exception as e:
+            print(f"Error al enviar métricas de la etapa {medicion.get('etapa')}: {str(e)}")
+
+class EjecutorPipeline:
+    """Ejecuta etapas registradas sobre un único DataFrame de trabajo.
+
+    El ejecutor es dueño del DataFrame: al crearse toma una copia superficial (sin copiar
+    los datos), así las etapas pueden renombrar, agregar, reemplazar o eliminar columnas en
+    el lugar sin tocar el DataFrame del llamador. contexto es el dict que comparten las
+    etapas (referencias, parámetros y resultados secundarios).
+
+    De cada etapa se mide el tiempo, las filas de entrada y salida y la memoria (RSS al
+    empezar y al terminar, y el pico mientras corre; los procesos trabajadores de la
+    categorización en paralelo no se cuentan). Cada medición, con las etiquetas del
+    ejecutor (p. ej. año, región y hospital), queda en etapas y se envía con
+    emitir_metricas.
+    """
+
+    def __init__(self, df: pd.DataFrame, contexto: Optional[Dict] = None, etiquetas: Optional[Dict] = None):
+        self.df = df.copy(deep=False)
+        self.contexto = dict(contexto or {})
+        self.etiquetas = dict(etiquetas or {})
+        self.etapas: List[Dict] = []
+
+    def ejecutar(self, nombre: str, etapa: Callable, *args, **kwargs) -> pd.DataFrame:
+        filas_entrada = len(self.df)
+        reiniciar_pico_rss()
+        rss_inicio = memoria_rss()
+        inicio = time.perf_counter()
+        self.df = etapa(self.df, *args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        rss_fin = memoria_rss()
+        medicion = dict(self.etiquetas, etapa=nombre, momento=datetime.now().isoformat(timespec='seconds'),
+                        segundos=round(segundos, 4), filas_entrada=filas_entrada, filas_salida=len(self.df),
+                        rss_inicio=rss_inicio, rss_pico=max(pico_rss(), rss_inicio, rss_fin),
+                        rss_fin=rss_fin, delta_rss=rss_fin - rss_inicio)
+        self.etapas.append(medicion)
+        emitir_metricas(medicion)
+        return self.df
+
+    def ejecutar_etapas(self, nombres: List[str], progreso: Optional[Callable[[str], None]] = None) -> pd.DataFrame:
+        """Ejecuta en orden las etapas registradas con esos nombres."""
+        desconocidas = [nombre for nombre in nombres if nombre not in ETAPAS]
+        if desconocidas:
+            raise ValueError(f"Etapas no registradas: {', '.join(desconocidas)}")
+        for nombre in nombres:
+            funcion, etapa_progreso = ETAPAS[nombre]
+            if progreso is not None and etapa_progreso is not None:
+                progreso(etapa_progreso)
+            self.ejecutar(nombre, funcion, self.contexto)
+        return self.df
+
+    def pico_memoria(self) -> int:
+        """Mayor pico de RSS (bytes) entre las etapas ejecutadas."""
+        return max((etapa['rss_pico'] for etapa in self.etapas), default=0)
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Callable
+import pandas as pd
+from archivos import escritura_atomica
+
+# Versión del formato de los artefactos compilados; incrementarla invalida los existentes
+VERSION_FORMATO = 1
+
+# Directorio para los artefactos compilados de los libros de referencia
+if os.getenv("RENDER"):
+    CACHE_DIR = "/tmp/cache_referencias"
+else:
+    CACHE_DIR = os.path.join(os.path.dirname(__file__), "data", "cache")
+
+def _hash_archivo(ruta: str) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def _ruta_artefacto(ruta: str, nombre: str) -> str:
+    clave = hashlib.sha1(os.path.abspath(ruta).encode()).hexdigest()[:10]
+    return os.path.join(CACHE_DIR, f"{Path(ruta).stem}-{nombre}-{clave}.pkl")
+
+def _escribir_artefacto(artefacto: str, cabecera: dict, contenido: Any) -> None:
+    # Escritura atómica: varios procesos pueden compilar a la vez sin dejar archivos a medias
+    try:
+        with escritura_atomica(artefacto) as temporal, open(temporal, 'wb') as f:
+            pickle.dump(cabecera, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(contenido, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"No se pudo guardar el artefacto {artefacto}: {str(e)}")
+
+def cargar_compilado(ruta: str, nombre: str, construir: Callable[[str], Any], version: int = 1) -> Any:
+    """Devuelve construir(ruta) desde un artefacto binario versionado por el libro de origen.
+
+    El artefacto se reutiliza mientras el mtime y tamaño del libro no cambien; si cambian
+    pero el hash SHA-256 es el mismo, solo se actualiza la cabecera. En cualquier otro caso
+    se vuelve a construir. version es la del constructor: hay que incrementarla cuando cambia
+    la estructura de lo que devuelve construir (p. ej. el formato de un índice), y un
+    artefacto que ya no se puede deserializar con el código actual también se reconstruye.
+    """
+    estado = os.stat(ruta)
+    artefacto = _ruta_artefacto(ruta, nombre)
+    huella = None
+    try:
+        with open(artefacto, 'rb') as f:
+            cabecera = pickle.load(f)
+            if (cabecera.get('version'), cabecera.get('version_constructor')) == (VERSION_FORMATO, version):
+                if (cabecera['mtime_ns'], cabecera['tamano']) == (estado.st_mtime_ns, estado.st_size):
+                    return pickle.load(f)
+                huella = _hash_archivo(ruta)
+                if cabecera['sha256'] == huella:
+                    contenido = pickle.load(f)
+                    cabecera.update(mtime_ns=estado.st_mtime_ns, tamano=estado.st_size)
+                    _escribir_artefacto(artefacto, cabecera, contenido)
+                    return contenido
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, ImportError):
+        pass
+
+    contenido = construir(ruta)
+    cabecera = {
+        'version': VERSION_FORMATO,
+        'version_constructor': version,
+        'origen': os.path.abspath(ruta),
+        'mtime_ns': estado.st_mtime_ns,
+        'tamano': estado.st_size,
+        'sha256': huella or _hash_archivo(ruta),
+    }
+    _escribir_artefacto(artefacto, cabecera, contenido)
+    print(f"Artefacto compilado: {artefacto}")
+    return contenido
+
+def leer_libro(ruta: str) -> pd.DataFrame:
+    """Primera hoja de un libro Excel, leída a través del cache compilado."""
+    return cargar_compilado(ruta, 'libro', pd.read_excel)
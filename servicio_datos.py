@@ -0,0 +1,170 @@
+import fcntl
+import glob
+import hashlib
+import os
+import pickle
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+import gestor_datos
+from archivos import escritura_atomica
+from gestor_datos import consultar_agregados, version_datos
+from cache_graficos import CacheLRU, MEMORIA_CACHE_GRAFICOS_MB
+from graficos import CONSTRUCTORES, CONSTRUCTORES_PESTANA, construir_vista
+
+# Elementos de las vistas serializados y compartidos por todos los workers, en un subdirectorio de DATA_DIR
+SUBDIRECTORIO_VISTAS = "vistas"
+# Versión del formato de los elementos serializados; incrementarla invalida los existentes
+VERSION_VISTAS = 3
+
+# Cache en memoria de este proceso, delante de las vistas en disco
+_cache_local = CacheLRU(MEMORIA_CACHE_GRAFICOS_MB * 1024 * 1024)
+# Un lock por (año, consulta, versión, constructor) para que un solo hilo calcule cada elemento.
+# La consulta es el par (región, hospital) que filtra las particiones; None es "todas".
+# Cada entrada es [lock, hilos que lo usan] y se descarta al liberarlo el último.
+_locks: Dict[tuple, list] = {}
+_locks_lock = threading.Lock()
+
+# Cargas del cubo y ejecuciones de cada constructor hechas por este proceso
+llamadas = Counter()
+
+def _directorio_vistas() -> str:
+    return os.path.join(gestor_datos.DATA_DIR, SUBDIRECTORIO_VISTAS)
+
+def _id_consulta(consulta) -> str:
+    # Los nombres de región y hospital no se usan tal cual en nombres de archivo
+    return hashlib.sha1(repr(tuple(consulta)).encode()).hexdigest()[:12]
+
+def _prefijo_vista(anio, consulta, version) -> str:
+    return f"vista_{anio}_{_id_consulta(consulta)}_{version[0]}_{version[1]}_"
+
+def _ruta_elementos(anio, consulta, version, constructor) -> str:
+    return os.path.join(_directorio_vistas(),
+                        f"{_prefijo_vista(anio, consulta, version)}{constructor}_v{VERSION_VISTAS}.pkl")
+
+@contextmanager
+def _lock_clave(clave):
+    with _locks_lock:
+        entrada = _locks.setdefault(clave, [threading.Lock(), 0])
+        entrada[1] += 1
+    try:
+        with entrada[0]:
+            yield
+    finally:
+        with _locks_lock:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del _locks[clave]
+
+@contextmanager
+def _lock_entre_procesos(ruta: str):
+    # flock sobre un archivo por elemento: otros elementos del mismo año se calculan en paralelo
+    os.makedirs(_directorio_vistas(), exist_ok=True)
+    with open(f"{os.path.splitext(ruta)[0]}.lock", 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _leer_vista(ruta: str) -> Optional[dict]:
+    try:
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+def _eliminar_vistas(anio, consulta=None, conservar_version=None) -> None:
+    # Vistas del año (de una consulta, o de todas) y sus archivos de lock, salvo las de conservar_version.
+    # Un worker que aún calcula una vista eliminada solo repite trabajo: la escritura es atómica.
+    patron = f"vista_{anio}_{_id_consulta(consulta) if consulta is not None else '*'}_*"
+    for archivo in glob.glob(os.path.join(_directorio_vistas(), patron)):
+        if (conservar_version is not None
+                and os.path.basename(archivo).startswith(_prefijo_vista(anio, consulta, conservar_version))):
+            continue
+        try:
+            os.remove(archivo)
+        except OSError:
+            pass
+
+def _escribir_vista(anio, consulta, version, ruta: str, vista: dict) -> None:
+    # Escritura atómica; los elementos de versiones anteriores de la consulta se eliminan
+    try:
+        _eliminar_vistas(anio, consulta, conservar_version=version)
+        with escritura_atomica(ruta) as temporal, open(temporal, 'wb') as f:
+            pickle.dump(vista, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"No se pudo guardar la vista {ruta}: {str(e)}")
+
+def _agregados(anio, consulta, version) -> Optional[dict]:
+    # El cubo se carga una vez por (año, consulta, versión) y lo comparten todos los constructores
+    clave = (anio, consulta, version, 'agregados')
+    with _lock_clave(clave):
+        agregados = _cache_local.obtener(clave)
+        if agregados is None:
+            llamadas['cargar_agregados'] += 1
+            agregados = consultar_agregados(anio, *consulta)
+            if agregados is not None:
+                _cache_local.guardar(clave, agregados)
+    return agregados
+
+def _elementos(anio, consulta, version, constructor) -> Optional[dict]:
+    """Elementos de un constructor: cache de este proceso, luego disco, y si no, se construyen."""
+    clave = (anio, consulta, version, constructor)
+    elementos = _cache_local.obtener(clave)
+    if elementos is not None:
+        return elementos
+    with _lock_clave(clave):
+        # Otro hilo pudo haberlos calculado mientras se esperaba el lock
+        elementos = _cache_local.obtener(clave)
+        if elementos is None:
+            ruta = _ruta_elementos(anio, consulta, version, constructor)
+            with _lock_entre_procesos(ruta):
+                elementos = _leer_vista(ruta)
+                if elementos is None:
+                    agregados = _agregados(anio, consulta, version)
+                    if agregados is None:
+                        return None
+                    llamadas[f'construir_{constructor}'] += 1
+                    elementos = construir_vista(agregados, anio, [constructor])
+                    _escribir_vista(anio, consulta, version, ruta, elementos)
+            _cache_local.guardar(clave, elementos)
+    return elementos
+
+def _version(anio, consulta) -> Optional[Tuple[int, int]]:
+    version = version_datos(anio, *consulta)
+    if version is None and consultar_agregados(anio, *consulta) is not None:
+        # Quedaba un pickle antiguo: cargar_agregados lo migró a Parquet
+        version = version_datos(anio, *consulta)
+    return version
+
+def obtener_vista(anio, pestana=None, region=None, hospital=None) -> Optional[dict]:
+    """Vista del año para la versión actual de sus datos: los elementos de una pestaña o todos.
+
+    region y hospital eligen las particiones que se combinan (None: todas). Solo se
+    ejecutan los constructores de la pestaña pedida, y cada uno una sola vez por versión
+    de los datos, incluso entre hilos y workers (se comparten a través del directorio de
+    vistas). Devuelve None si no hay datos.
+    """
+    consulta = (region, hospital)
+    version = _version(anio, consulta)
+    if version is None:
+        return None
+    vista = {}
+    for constructor in (CONSTRUCTORES_PESTANA[pestana] if pestana else CONSTRUCTORES):
+        elementos = _elementos(anio, consulta, version, constructor)
+        if elementos is None:
+            return None
+        vista.update(elementos)
+    return vista
+
+def preparar_vista(anio, region=None, hospital=None) -> Optional[Tuple[int, int]]:
+    """Versión actual de los datos del año, o None si no tiene datos; no genera gráficos."""
+    return _version(anio, (region, hospital))
+
+def invalidar(anio) -> None:
+    """Descarta las vistas de un año (en memoria y en disco, de todas las consultas) tras
+    guardar datos nuevos en cualquiera de sus particiones."""
+    _cache_local.invalidar(anio)
+    _eliminar_vistas(anio)
@@ -0,0 +1,11 @@
+import os
+import sys
+import pytest
+
+# Los módulos del proyecto están en la raíz y usan rutas relativas a ella (data/...)
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+@pytest.fixture(autouse=True)
+def directorio_raiz(monkeypatch):
+    monkeypatch.chdir(RAIZ)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from agregados import CLAVES_CONTEOS, combinar_agregados, construir_agregados, sumar_por_periodo
+from codificacion import COLUMNAS_CONTEO, codificar_resultados
+
+@pytest.fixture
+def datos():
+    # Filas sin fecha, sin Grupo_principal o sin especie, también como categóricas
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(['2023-01-01', '2023-01-01', None, '2023-02-01', '2023-02-01', '2023-02-01']),
+        'Grupo_principal': ['Enterobacterales', None, 'Enterobacterales', 'Enterobacterales', 'No fermentadores', None],
+        'especie': pd.Categorical(['Escherichia coli', 'Escherichia coli', None, None, 'Pseudomonas aeruginosa',
+                                   'Escherichia coli']),
+        'Tipo de muestra': 'Orina', 'Tipo de localizacion': 'Hospitalizado', 'Edad': '40',
+        'SPEC_NUM': range(6),
+        'Amicacina': ['S', 'R', 'I', None, 'S', 'Inconcluyente'],
+        'Ceftazidima': ['R', None, 'S', 'S', None, 'R'],
+    })
+
+def _conteos_por_melt(df):
+    # Referencia: formato largo y tabla dinámica sobre el texto, con claves nulas
+    largo = df.melt(id_vars=CLAVES_CONTEOS, value_vars=['Amicacina', 'Ceftazidima'],
+                    var_name='antibiotico', value_name='resultado').dropna(subset=['resultado'])
+    tabla = largo.pivot_table(index=CLAVES_CONTEOS + ['antibiotico'], columns='resultado', aggfunc='size',
+                              fill_value=0, dropna=False, observed=True)
+    return tabla.reindex(columns=COLUMNAS_CONTEO, fill_value=0)
+
+def test_conteos_conservan_claves_nulas(datos):
+    cubo = construir_agregados(codificar_resultados(datos))
+    conteos = cubo['conteos'].set_index(CLAVES_CONTEOS + ['antibiotico'])[COLUMNAS_CONTEO]
+    esperado = _conteos_por_melt(datos.astype({'especie': object}))
+    esperado = esperado[esperado.sum(axis=1) > 0]
+    pd.testing.assert_frame_equal(conteos.sort_index(), esperado.sort_index(), check_dtype=False,
+                                  check_names=False, check_index_type=False)
+    # Todos los resultados cuentan, igual que todas las filas en 'aislados'
+    assert conteos.to_numpy().sum() == datos[['Amicacina', 'Ceftazidima']].notna().to_numpy().sum()
+    assert cubo['aislados']['n'].sum() == len(datos)
+
+@pytest.mark.parametrize('frecuencia', ['M', 'Y'])
+def test_sumar_por_periodo_es_aditivo(datos, frecuencia):
+    # Dos particiones con meses en común
+    cubos = [construir_agregados(codificar_resultados(datos.iloc[filas])) for filas in ([0, 3, 4], [1, 2, 5])]
+    claves = ['especie', 'antibiotico']
+    por_cubo = pd.concat([sumar_por_periodo(c['conteos'], frecuencia, claves) for c in cubos])
+    por_cubo = por_cubo.astype({'especie': object}).groupby(['periodo'] + claves)[COLUMNAS_CONTEO].sum()
+    juntos = sumar_por_periodo(combinar_agregados(cubos)['conteos'], frecuencia)
+    juntos = juntos.astype({'especie': object}).set_index(['periodo'] + claves)[COLUMNAS_CONTEO]
+    pd.testing.assert_frame_equal(por_cubo.sort_index(), juntos.sort_index(), check_dtype=False)
+    assert claves == ['especie', 'antibiotico']
@@ -0,0 +1,23 @@
+import os
+import pytest
+from archivos import escritura_atomica
+
+def test_escritura_atomica_reemplaza_al_terminar(tmp_path):
+    ruta = tmp_path / 'sub' / 'datos.bin'
+    with escritura_atomica(str(ruta)) as temporal:
+        with open(temporal, 'wb') as f:
+            f.write(b'nuevo')
+        assert not ruta.exists()
+    assert ruta.read_bytes() == b'nuevo'
+    assert os.listdir(ruta.parent) == ['datos.bin']
+
+def test_escritura_atomica_conserva_el_archivo_si_falla(tmp_path):
+    ruta = tmp_path / 'datos.bin'
+    ruta.write_bytes(b'anterior')
+    with pytest.raises(RuntimeError):
+        with escritura_atomica(str(ruta)) as temporal:
+            with open(temporal, 'wb') as f:
+                f.write(b'a medias')
+            raise RuntimeError("fallo al escribir")
+    assert ruta.read_bytes() == b'anterior'
+    assert os.listdir(tmp_path) == ['datos.bin']
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from cache_graficos import CacheLRU, estimar_tamano
+
+def _tabla(filas=1000):
+    return pd.DataFrame({'valor': np.arange(filas, dtype=np.int64)})
+
+def test_descarta_la_entrada_menos_usada_al_superar_el_limite():
+    tamano = estimar_tamano(_tabla())
+    cache = CacheLRU(max_bytes=3 * tamano)
+    for anio in (2021, 2022, 2023):
+        cache.guardar((anio, 'lineas'), _tabla())
+    assert cache.estadisticas()['bytes'] == 3 * tamano
+    # La más antigua se lee y pasa a ser la más reciente
+    assert cache.obtener((2021, 'lineas')) is not None
+    cache.guardar((2024, 'lineas'), _tabla())
+    assert cache.obtener((2022, 'lineas')) is None
+    for anio in (2021, 2023, 2024):
+        assert cache.obtener((anio, 'lineas')) is not None
+    assert cache.estadisticas()['entradas'] == 3
+    assert cache.estadisticas()['bytes'] <= cache.max_bytes
+
+def test_invalidar_descarta_solo_el_anio():
+    cache = CacheLRU(max_bytes=10 * estimar_tamano(_tabla()))
+    cache.guardar((2023, 'lineas'), _tabla())
+    cache.guardar((2023, 'heatmap'), _tabla())
+    cache.guardar((2024, 'lineas'), _tabla())
+    cache.invalidar(2023)
+    assert cache.obtener((2023, 'lineas')) is None
+    assert cache.obtener((2024, 'lineas')) is not None
+    assert cache.estadisticas()['bytes'] == estimar_tamano(_tabla())
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from categorizacion import (categorizar_dataframe, categorizar_mic, crear_pool_categorizacion, limpiar_valores_mic,
+                            COLUMNAS_NO_ANTIBIOTICOS, CacheResolucion, IndicePuntosCorte, obtener_registro)
+
+# Puntos de corte de prueba: (antibiótico, especie o grupo, modo_exclusion, excluidas) -> (S, I, R)
+PUNTOS_CLASICO = {
+    ('Amicacina', 'Escherichia coli', False, None): (16.0, 32.0, 64.0),
+    ('Amicacina', 'Enterobacterales', False, None): (8.0, 'rango', 32.0),
+    ('Ceftazidima', 'Enterobacterales', True, ('Klebsiella pneumoniae',)): (4.0, None, 16.0),
+    ('Ceftazidima', 'Klebsiella pneumoniae', False, None): (1.0, 2.0, 4.0),
+}
+PUNTOS_ALTERNO = {
+    ('Amicacina', 'Enterobacterales', False, None): (17.0, 15.0, 14.0),
+    ('Ceftazidima', 'Enterobacterales', False, None): (21.0, None, 17.0),
+}
+
+def _categorizar_celda_por_celda(data, puntos_clasico, puntos_alterno):
+    # Camino escalar original: categorizar_mic fila por fila
+    resultado = data.copy().astype({col: object for col in data.columns if col not in COLUMNAS_NO_ANTIBIOTICOS})
+    for col in [c for c in data.columns if c not in COLUMNAS_NO_ANTIBIOTICOS]:
+        for idx, row in data.iterrows():
+            resultado.at[idx, col] = categorizar_mic(row[col], col, row['especie'], row['Grupo_general'],
+                                                     puntos_clasico, puntos_alterno)
+    return resultado
+
+def _clave(valor):
+    # Distingue None, NaN y pd.NA al comparar celdas
+    if valor is None or valor is pd.NA:
+        return repr(valor)
+    if isinstance(valor, float) and np.isnan(valor):
+        return 'nan'
+    return valor
+
+def _comparar(resultado, esperado):
+    assert list(resultado.columns) == list(esperado.columns)
+    for col in esperado.columns:
+        assert [_clave(v) for v in resultado[col]] == [_clave(v) for v in esperado[col]], col
+
+@pytest.fixture
+def datos():
+    mic = ['<=8', '>32', '16', '32', '64', '12', '≤4', '>=64', None, '0.5', '3', 'abc', '<1', '16/4', '20']
+    n = len(mic)
+    especies = ['Escherichia coli', 'Klebsiella pneumoniae', 'Enterobacter cloacae', 'Especie desconocida',
+                None] * (n // 5)
+    grupos = ['Enterobacterales', 'Enterobacterales', 'Enterobacterales', 'Grupo desconocido', None] * (n // 5)
+    return pd.DataFrame({
+        'especie': especies, 'Grupo_general': grupos, 'SPEC_NUM': range(n),
+        'Amicacina': mic, 'Ceftazidima': mic[::-1], 'Sin puntos de corte': mic,
+    })
+
+def test_vectorizado_igual_a_categorizar_mic_con_valores_mic(datos):
+    data = limpiar_valores_mic(datos.copy(), ['Amicacina', 'Ceftazidima', 'Sin puntos de corte'])
+    esperado = _categorizar_celda_por_celda(data, PUNTOS_CLASICO, PUNTOS_ALTERNO)
+    _comparar(categorizar_dataframe(data, PUNTOS_CLASICO, PUNTOS_ALTERNO), esperado)
+
+def test_vectorizado_igual_a_categorizar_mic_con_texto_sin_limpiar(datos):
+    # Prefijos como '<=', '>' o '≤' sin interpretar: float() falla y queda 'Inconcluyente'
+    esperado = _categorizar_celda_por_celda(datos, PUNTOS_CLASICO, PUNTOS_ALTERNO)
+    _comparar(categorizar_dataframe(datos, PUNTOS_CLASICO, PUNTOS_ALTERNO), esperado)
+
+def test_indice_y_procesos_igual_a_categorizar_mic_con_tabla_clsi(datos):
+    _, puntos_clasico, puntos_alterno = obtener_registro().puntos_corte
+    data = limpiar_valores_mic(datos.copy(), ['Amicacina', 'Ceftazidima', 'Sin puntos de corte'])
+    esperado = _categorizar_celda_por_celda(data, dict(puntos_clasico), dict(puntos_alterno))
+    _comparar(categorizar_dataframe(data, puntos_clasico, puntos_alterno), esperado)
+    _comparar(categorizar_dataframe(data, IndicePuntosCorte(PUNTOS_CLASICO), IndicePuntosCorte(PUNTOS_ALTERNO),
+                                    n_procesos=2, umbral_paralelo=0),
+              _categorizar_celda_por_celda(data, PUNTOS_CLASICO, PUNTOS_ALTERNO))
+
+def test_pool_compartido_entre_llamadas(datos):
+    # Un mismo pool sirve para varios bloques (p. ej. todos los de una carga)
+    data = limpiar_valores_mic(datos.copy(), ['Amicacina', 'Ceftazidima', 'Sin puntos de corte'])
+    esperado = _categorizar_celda_por_celda(data, PUNTOS_CLASICO, PUNTOS_ALTERNO)
+    pool = crear_pool_categorizacion(PUNTOS_CLASICO, PUNTOS_ALTERNO, n_procesos=2)
+    try:
+        for bloque in (data.iloc[:8], data.iloc[8:], data):
+            _comparar(categorizar_dataframe(bloque, PUNTOS_CLASICO, PUNTOS_ALTERNO, n_procesos=2,
+                                            umbral_paralelo=0, pool=pool),
+                      esperado.loc[bloque.index])
+    finally:
+        pool.shutdown()
+
+def test_sin_antibiotico_no_consulta_el_cache():
+    cache = CacheResolucion(IndicePuntosCorte(PUNTOS_CLASICO), IndicePuntosCorte(PUNTOS_ALTERNO))
+    for valor in (16.0, 12.0):
+        assert categorizar_mic(valor, None, 'Escherichia coli', 'Enterobacterales', PUNTOS_CLASICO, PUNTOS_ALTERNO,
+                               cache) == categorizar_mic(valor, None, 'Escherichia coli', 'Enterobacterales',
+                                                         PUNTOS_CLASICO, PUNTOS_ALTERNO) == valor
+    assert cache.estadisticas() == {'aciertos': 0, 'fallos': 0, 'entradas': 0}
@@ -0,0 +1,111 @@
+import os
+import pandas as pd
+import pytest
+import gestor_datos
+from agregados import TABLAS_CUBO, clave_muestra, construir_agregados
+from benchmark import escribir_xlsx, generar_carga
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(gestor_datos, 'DATA_DIR', str(tmp_path / 'data'))
+    return tmp_path
+
+@pytest.fixture(scope='module')
+def carga():
+    return generar_carga(600, antibioticos=12, anio=2023, semilla=3)
+
+def _contenido(df, directorio, nombre='carga.xlsx'):
+    ruta = os.path.join(directorio, nombre)
+    escribir_xlsx(df, ruta)
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+def _guardado(directorio, anio=2023):
+    gestor_datos.DATA_DIR = str(directorio)
+    return (gestor_datos.cargar_datos(anio, codificado=True), gestor_datos.cargar_mic_sin_categoria(anio),
+            gestor_datos.cargar_agregados(anio))
+
+def _comparar_guardados(resultado, esperado):
+    (datos, mic, cubo), (datos_esperados, mic_esperado, cubo_esperado) = resultado, esperado
+    assert list(datos.columns) == list(datos_esperados.columns)
+    pd.testing.assert_frame_equal(datos.sort_index(), datos_esperados.sort_index(), check_categorical=False)
+    claves_mic = ['fila', 'antibiotico']
+    pd.testing.assert_frame_equal(mic.sort_values(claves_mic, ignore_index=True),
+                                  mic_esperado.sort_values(claves_mic, ignore_index=True))
+    for nombre, (claves, valores) in TABLAS_CUBO.items():
+        if nombre == 'muestras':
+            # El aislado que representa a cada muestra puede ser otro, pero no el número de muestras
+            assert cubo[nombre]['n'].sum() == cubo_esperado[nombre]['n'].sum()
+            continue
+        suma = lambda tabla: tabla.groupby(claves, dropna=False)[valores].sum()
+        pd.testing.assert_frame_equal(suma(cubo[nombre]), suma(cubo_esperado[nombre]))
+
+def test_carga_por_bloques_igual_a_una_pasada(carga, data_dir):
+    contenido = _contenido(carga, data_dir)
+    gestor_datos.DATA_DIR = str(data_dir / 'una_pasada')
+    filas = gestor_datos.procesar_archivo_subido(contenido, 2023, por_bloques=False)
+    gestor_datos.DATA_DIR = str(data_dir / 'por_bloques')
+    assert gestor_datos.procesar_archivo_por_bloques(contenido, 2023, tamano_bloque=150) == filas
+    particion = gestor_datos._directorio_particion(gestor_datos.PARTICION_POR_DEFECTO)
+    assert not [f for f in os.listdir(particion) if f.startswith('.')]
+    _comparar_guardados(_guardado(data_dir / 'por_bloques'), _guardado(data_dir / 'una_pasada'))
+
+def test_agregar_por_bloques_igual_a_una_pasada(carga, data_dir, monkeypatch):
+    monkeypatch.setattr(gestor_datos, 'TAMANO_BLOQUE', 100)
+    # El archivo agregado repite 50 aislados ya guardados
+    inicial, agregado = _contenido(carga.iloc[:300], data_dir), _contenido(carga.iloc[250:], data_dir, 'mes.xlsx')
+    for modo, por_bloques in (('una_pasada', False), ('por_bloques', True)):
+        gestor_datos.DATA_DIR = str(data_dir / modo)
+        gestor_datos.procesar_archivo_subido(inicial, 2023, por_bloques=False)
+        gestor_datos.agregar_archivo_subido(agregado, 2023, por_bloques=por_bloques)
+    _comparar_guardados(_guardado(data_dir / 'por_bloques'), _guardado(data_dir / 'una_pasada'))
+
+def test_edad_mixta_da_el_mismo_cubo_al_guardarse():
+    # Edades numéricas y como texto en la misma columna: Parquet las guarda como texto
+    datos = pd.DataFrame({
+        'SPEC_NUM': [1, 2, 3, 4, 5], 'especie': 'Escherichia coli', 'Grupo_principal': 'Enterobacterales',
+        'Tipo de muestra': 'Orina', 'Tipo de localizacion': 'Hospitalizado',
+        'fecha': pd.Timestamp(2023, 1, 1), 'Edad': [45, '45', 3.0, '6M', None],
+    })
+    guardados = gestor_datos._preparar_para_parquet(datos)
+    assert guardados['Edad'].tolist()[:4] == ['45', '45', '3.0', '6M']
+    for nombre in TABLAS_CUBO:
+        pd.testing.assert_frame_equal(construir_agregados(datos)[nombre], construir_agregados(guardados)[nombre])
+    muestras = construir_agregados(datos)['muestras'].dropna(subset=['Rango_edad'])
+    assert muestras.set_index('Rango_edad')['n'].to_dict() == {'45-49 años': 2, '2-4 años': 1, '6-11 meses': 1}
+
+def test_version_cambia_al_escribir_el_cubo(carga, data_dir):
+    gestor_datos.procesar_archivo_subido(_contenido(carga, data_dir), 2023, por_bloques=False)
+    version = gestor_datos.version_datos(2023)
+    # El cubo se escribe después de los datos: una vista calculada antes no puede quedar con la versión final
+    gestor_datos.guardar_agregados(gestor_datos.cargar_agregados(2023), 2023)
+    assert gestor_datos.version_datos(2023) not in (None, version)
+
+@pytest.mark.parametrize('por_bloques', [False, True])
+def test_agregar_reconoce_spec_num_float_guardado(carga, data_dir, monkeypatch, por_bloques):
+    monkeypatch.setattr(gestor_datos, 'TAMANO_BLOQUE', 40)
+    # Una celda vacía deja SPEC_NUM como float al leer el archivo (123.0); el mes agregado lo trae entero
+    inicial = carga.iloc[:200].astype({'SPEC_NUM': object})
+    inicial.iloc[0, inicial.columns.get_loc('SPEC_NUM')] = None
+    gestor_datos.procesar_archivo_subido(_contenido(inicial, data_dir), 2023, por_bloques=False)
+    guardados = gestor_datos.cargar_datos(2023, codificado=True)
+    assert guardados['SPEC_NUM'].dtype == float
+    cubo = gestor_datos.cargar_agregados(2023)
+
+    repetidos = carga.iloc[100:200]
+    assert gestor_datos.agregar_archivo_subido(_contenido(repetidos, data_dir, 'mes.xlsx'), 2023,
+                                               por_bloques=por_bloques) == 0
+    assert len(gestor_datos.cargar_datos(2023, codificado=True)) == len(guardados)
+
+    # Con aislados nuevos de muestras ya guardadas, esas muestras no se cuentan otra vez
+    nuevos = carga.iloc[100:200].assign(ORGANISM=carga['ORGANISM'].iloc[300:400].to_numpy())
+    agregadas = gestor_datos.agregar_archivo_subido(_contenido(nuevos, data_dir, 'mes.xlsx'), 2023,
+                                                    por_bloques=por_bloques)
+    assert agregadas > 0
+    datos = gestor_datos.cargar_datos(2023, codificado=True)
+    claves = clave_muestra(datos['SPEC_NUM'])
+    anteriores = datos.index.isin(guardados.index)
+    muestras_nuevas = set(claves[~anteriores]) - set(claves[anteriores])
+    assert len(muestras_nuevas) < agregadas
+    assert (gestor_datos.cargar_agregados(2023)['muestras']['n'].sum()
+            == cubo['muestras']['n'].sum() + len(muestras_nuevas))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from limpieza_final import anio_predominante, filas_del_anio, limpiar_datos_antibioticos
+
+def _datos(**tipos):
+    df = pd.DataFrame({
+        'especie': ['Escherichia coli', 'Klebsiella pneumoniae', 'Escherichia coli', 'Proteus mirabilis'],
+        'Amicacina': ['S', '16', None, 'R'],
+        'Ceftazidima': ['I', 'S', None, '0.5'],
+        'Gentamicina': [4.0, np.nan, 8.0, 1.0],
+    })
+    return df.astype(tipos)
+
+def test_columna_string_se_limpia_igual_que_object():
+    esperado, vacias_esperadas = limpiar_datos_antibioticos(_datos(), ['especie'])
+    resultado, vacias = limpiar_datos_antibioticos(_datos(Amicacina='string', Ceftazidima='category'), ['especie'])
+    # Los resultados S/I/R de columnas string o category se conservan; los números pasan a NA
+    assert resultado['Amicacina'].tolist() == ['S', pd.NA, 'R']
+    assert resultado['Ceftazidima'].tolist() == ['I', 'S', pd.NA]
+    assert vacias == vacias_esperadas == ['Gentamicina']
+    pd.testing.assert_frame_equal(resultado, esperado)
+
+def test_anio_predominante_solo_se_informa_si_se_detecta(capsys):
+    fechas = pd.Series(pd.to_datetime(['2022-12-31', '2023-01-01', '2023-02-01']))
+    assert filas_del_anio(fechas, 2022).tolist() == [0]
+    assert anio_predominante(pd.Series({2022: 1, 2023: 2}), 2022) == 2022
+    assert capsys.readouterr().out == ''
+    assert filas_del_anio(fechas).tolist() == [1, 2]
+    assert anio_predominante(pd.Series({2022: 1, 2023: 2})) == 2023
+    assert capsys.readouterr().out.count("Año predominante detectado: 2023") == 2
+
+def _limpiar_por_celda(df, columnas_fijas, columnas_inicio=()):
+    # Referencia: la limpieza anterior, celda por celda
+    antibioticos = [col for col in df.columns if col not in columnas_fijas]
+    for col in antibioticos:
+        df[col] = df[col].apply(lambda x: pd.NA if isinstance(x, (int, float)) or
+                                (isinstance(x, str) and x.replace('.', '', 1).isdigit()) else x)
+    df[antibioticos] = df[antibioticos].replace('', pd.NA)
+    columnas_vacias = [col for col in antibioticos if df[col].isna().all()]
+    df_limpio = df.dropna(subset=[col for col in antibioticos if col not in columnas_vacias], how='all')
+    columnas_inicio = [col for col in columnas_inicio if col in df_limpio.columns]
+    df_limpio = df_limpio[columnas_inicio + [col for col in df_limpio.columns
+                                             if col not in columnas_inicio and col not in columnas_vacias]]
+    return df_limpio, columnas_vacias
+
+def test_limpieza_vectorizada_igual_a_celda_por_celda():
+    rng = np.random.default_rng(0)
+    filas, valores = 2000, np.array(['S', 'I', 'R', 'S', 'R', '16', '0.5', '>=32', '', None, 8, 0.25], dtype=object)
+    df = pd.DataFrame({f'AB{k:02d}': rng.choice(valores, filas, p=[0.02, 0.01, 0.02] + [0.95 / 9] * 9)
+                       for k in range(60)})
+    # Filas solo con valores descartables, que se eliminan
+    df.iloc[:200] = rng.choice(np.array(['16', '', None, 4], dtype=object), (200, df.shape[1]))
+    df.insert(0, 'especie', 'Escherichia coli')
+    df['AB_VACIA'] = rng.choice(np.array(['', None, '4'], dtype=object), filas)
+    resultado, vacias = limpiar_datos_antibioticos(df.copy(), ['especie'])
+    esperado, vacias_esperadas = _limpiar_por_celda(df.copy(), ['especie'])
+    assert vacias == vacias_esperadas == ['AB_VACIA']
+    assert len(resultado) == filas - 200
+    # Los nulos pueden ser None o NA según el camino; el resto de valores debe coincidir
+    pd.testing.assert_frame_equal(resultado.fillna(np.nan), esperado.fillna(np.nan))
@@ -0,0 +1,61 @@
+import gc
+import json
+import pandas as pd
+import pytest
+import pipeline
+from benchmark import generar_carga
+from categorizacion import contexto_categorizacion
+from gestor_datos import ETAPAS_PROCESAMIENTO
+
+# Pico de memoria de una carga completa, como múltiplo del tamaño del DataFrame leído
+# (antes de procesar sobre un único DataFrame de trabajo era unas 3 veces)
+MULTIPLO_PICO_MAXIMO = 2.5
+
+def _procesar(df):
+    ejecutor = pipeline.EjecutorPipeline(df, dict(contexto_categorizacion(), anio=None))
+    del df
+    return ejecutor.ejecutar_etapas(ETAPAS_PROCESAMIENTO)
+
+def test_pico_de_memoria_acotado_por_el_tamano_de_la_entrada():
+    if not pipeline.reiniciar_pico_rss():
+        pytest.skip("El pico de RSS no se puede reiniciar en este sistema")
+    # Referencias y puntos de corte ya cargados, como en un worker que ya procesó cargas
+    _procesar(generar_carga(300, antibioticos=40, semilla=1))
+    cargas = [generar_carga(20_000, antibioticos=40)]
+    tamano = cargas[0].memory_usage(deep=True).sum()
+    gc.collect()
+    pipeline.reiniciar_pico_rss()
+    inicio = pipeline.memoria_rss()
+    # El pipeline queda como único dueño del DataFrame, igual que en gestor_datos
+    resultado = _procesar(cargas.pop())
+    assert len(resultado) > 0
+    assert pipeline.pico_rss() - inicio < MULTIPLO_PICO_MAXIMO * tamano
+
+def test_metricas_de_una_etapa(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'ETAPAS', dict(pipeline.ETAPAS))
+    archivo = tmp_path / 'metricas.jsonl'
+    monkeypatch.setattr(pipeline, 'ARCHIVO_METRICAS_PIPELINE', str(archivo))
+
+    @pipeline.registrar_etapa('prueba_filtrar')
+    def _filtrar(df, contexto):
+        return df[df['valor'] >= contexto['minimo']]
+
+    recibidas = []
+    pipeline.agregar_destino_metricas(recibidas.append)
+    try:
+        ejecutor = pipeline.EjecutorPipeline(pd.DataFrame({'valor': range(10)}), {'minimo': 4}, {'anio': 2023})
+        assert len(ejecutor.ejecutar_etapas(['prueba_filtrar'])) == 6
+    finally:
+        pipeline.quitar_destino_metricas(recibidas.append)
+
+    assert recibidas == ejecutor.etapas
+    medicion, = recibidas
+    assert medicion['anio'] == 2023 and medicion['etapa'] == 'prueba_filtrar'
+    assert (medicion['filas_entrada'], medicion['filas_salida']) == (10, 6)
+    assert medicion['rss_inicio'] > 0 and medicion['rss_fin'] > 0
+    assert medicion['rss_pico'] >= max(medicion['rss_inicio'], medicion['rss_fin'])
+    assert medicion['delta_rss'] == medicion['rss_fin'] - medicion['rss_inicio']
+    # El archivo de métricas recibe la misma medición como una línea JSON
+    assert [json.loads(linea) for linea in archivo.read_text(encoding='utf-8').splitlines()] == [medicion]
+    with pytest.raises(ValueError):
+        ejecutor.ejecutar_etapas(['no_registrada'])
@@ -0,0 +1,35 @@
+import pickle
+import referencias
+from referencias import VERSION_FORMATO, _ruta_artefacto, cargar_compilado
+
+def _construir(llamadas):
+    def construir(ruta):
+        llamadas.append(ruta)
+        return {'contenido': len(llamadas)}
+    return construir
+
+def test_version_del_constructor_invalida_el_artefacto(tmp_path, monkeypatch):
+    monkeypatch.setattr(referencias, 'CACHE_DIR', str(tmp_path / 'cache'))
+    libro = tmp_path / 'libro.xlsx'
+    libro.write_bytes(b'datos')
+    llamadas = []
+    assert cargar_compilado(str(libro), 'indice', _construir(llamadas)) == {'contenido': 1}
+    assert cargar_compilado(str(libro), 'indice', _construir(llamadas)) == {'contenido': 1}
+    assert cargar_compilado(str(libro), 'indice', _construir(llamadas), version=2) == {'contenido': 2}
+    assert len(llamadas) == 2
+
+def test_artefacto_con_modulo_inexistente_se_reconstruye(tmp_path, monkeypatch):
+    monkeypatch.setattr(referencias, 'CACHE_DIR', str(tmp_path / 'cache'))
+    libro = tmp_path / 'libro.xlsx'
+    libro.write_bytes(b'datos')
+    llamadas = []
+    cargar_compilado(str(libro), 'indice', _construir(llamadas))
+    # Contenido que referencia una clase de un módulo que ya no existe
+    artefacto = _ruta_artefacto(str(libro), 'indice')
+    with open(artefacto, 'rb') as f:
+        cabecera = pickle.load(f)
+    with open(artefacto, 'wb') as f:
+        pickle.dump(cabecera, f)
+        f.write(b'\x80\x04\x95\x1c\x00\x00\x00\x00\x00\x00\x00\x8c\x0emodulo_borrado\x94\x8c\x05Clase\x94\x93\x94.')
+    assert cabecera['version'] == VERSION_FORMATO
+    assert cargar_compilado(str(libro), 'indice', _construir(llamadas)) == {'contenido': 2}
@@ -0,0 +1,56 @@
+import os
+import threading
+import pytest
+import gestor_datos
+import servicio_datos
+from benchmark import escribir_xlsx, generar_carga
+from cache_graficos import CacheLRU
+from graficos import CONSTRUCTORES_PESTANA
+
+PESTANA = "tab-aislados"
+
+@pytest.fixture
+def servicio(tmp_path, monkeypatch):
+    monkeypatch.setattr(gestor_datos, 'DATA_DIR', str(tmp_path / 'data'))
+    monkeypatch.setattr(servicio_datos, '_cache_local', CacheLRU(64 * 1024 * 1024))
+    monkeypatch.setattr(servicio_datos, 'llamadas', servicio_datos.Counter())
+    for anio in (2022, 2023):
+        ruta = os.path.join(tmp_path, f'carga_{anio}.xlsx')
+        escribir_xlsx(generar_carga(300, antibioticos=8, anio=anio, semilla=anio), ruta)
+        with open(ruta, 'rb') as f:
+            gestor_datos.procesar_archivo_subido(f.read(), anio, por_bloques=False)
+    return servicio_datos
+
+def _construcciones(llamadas):
+    return {nombre: n for nombre, n in llamadas.items() if nombre.startswith('construir_')}
+
+def test_cubo_y_constructores_una_vez_por_anio(servicio):
+    primera = servicio.obtener_vista(2023, PESTANA)
+    assert primera
+    assert servicio.obtener_vista(2023, PESTANA).keys() == primera.keys()
+    assert servicio.obtener_vista(2022, PESTANA)
+    assert servicio.llamadas['cargar_agregados'] == 2
+    assert _construcciones(servicio.llamadas) == {f'construir_{c}': 2 for c in CONSTRUCTORES_PESTANA[PESTANA]}
+
+def test_otro_proceso_reutiliza_las_vistas_en_disco(servicio, monkeypatch):
+    servicio.obtener_vista(2023, PESTANA)
+    # Un worker nuevo no tiene nada en memoria, pero encuentra los elementos ya serializados
+    monkeypatch.setattr(servicio, '_cache_local', CacheLRU(64 * 1024 * 1024))
+    servicio.llamadas.clear()
+    assert servicio.obtener_vista(2023, PESTANA)
+    assert servicio.llamadas['cargar_agregados'] == 0
+    assert not _construcciones(servicio.llamadas)
+
+def test_locks_por_elemento(servicio):
+    consulta = (None, None)
+    version = servicio.preparar_vista(2023)
+    lineas, heatmaps = (servicio._ruta_elementos(2023, consulta, version, c) for c in ('lineas', 'heatmaps'))
+    # Con el elemento 'lineas' bloqueado por otro worker, los demás del mismo año se calculan igual
+    with servicio._lock_entre_procesos(lineas):
+        hilo = threading.Thread(target=servicio._elementos, args=(2023, consulta, version, 'heatmaps'))
+        hilo.start()
+        hilo.join(timeout=60)
+        assert not hilo.is_alive()
+    assert os.path.exists(heatmaps)
+    # Los locks en memoria se descartan al liberarse
+    assert servicio._locks == {}